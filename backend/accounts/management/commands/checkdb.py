@@ -4,12 +4,19 @@ Django management command to check database configuration and connection.
 Usage:
     python manage.py checkdb
     python manage.py checkdb --verbose
+    python manage.py checkdb --test-connection --samples 10
+    python manage.py checkdb --benchmark --iterations 500 --output db-bench.json
+    python manage.py checkdb --benchmark --alias replica_1
 """
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import connection
 from django.conf import settings
-from tastestack.db_config import get_database_info, check_database_connection, print_database_info
+from tastestack.db_config import (
+    get_database_info, check_database_connection, print_database_info,
+    measure_connect_latency, get_pool_stats,
+)
+import json
 import os
 
 
@@ -27,8 +34,49 @@ class Command(BaseCommand):
             action='store_true',
             help='Test database connection'
         )
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=5,
+            help='Connections to open when measuring connect latency (default: 5)'
+        )
+        parser.add_argument(
+            '--benchmark',
+            action='store_true',
+            help='Measure latency and throughput and replay the queries of the main read views'
+        )
+        parser.add_argument(
+            '--alias',
+            default='default',
+            help='Database alias to benchmark, e.g. replica_1 (default: default)'
+        )
+        parser.add_argument(
+            '--iterations',
+            type=int,
+            default=200,
+            help='Operations per benchmark probe (default: 200)'
+        )
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=500,
+            help='Rows inserted by the insert probes, rolled back afterwards (default: 500)'
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            help='Random seed for the benchmark'
+        )
+        parser.add_argument(
+            '--output',
+            help='Also write the benchmark results as JSON to this file'
+        )
 
     def handle(self, *args, **options):
+        if options['benchmark']:
+            self.benchmark(options)
+            return
+
         self.stdout.write(self.style.SUCCESS('\n🔍 TasteStack Database Configuration Check\n'))
         
         # Get database information
@@ -44,14 +92,25 @@ class Command(BaseCommand):
             self.stdout.write(f"Database: {db_info['name']}")
         elif db_info['engine'] == 'sqlite3':
             self.stdout.write(f"Database File: {db_info['name']}")
-            self.stdout.write(f"Location: {db_info['location']}")
+            self.stdout.write(f"Location: {db_info.get('location', 'N/A')}")
+
+        replicas = [alias for alias in settings.DATABASES if alias != 'default']
+        if replicas:
+            self.stdout.write(f"Read Replicas: {len(replicas)} "
+                              f"({getattr(settings, 'DATABASE_REPLICA_STRATEGY', 'round_robin')})")
+            for alias in replicas:
+                replica = settings.DATABASES[alias]
+                location = f"{replica.get('HOST')}/{replica['NAME']}" if replica.get('HOST') else replica['NAME']
+                self.stdout.write(f"  {alias}: {replica['ENGINE'].split('.')[-1]} {location}")
         
         # Environment variables check
         if options['verbose']:
             self.stdout.write(f"\n{self.style.HTTP_INFO('Environment Variables:')}")
             env_vars = [
                 'DATABASE_ENGINE', 'DATABASE_URL',
-                'POSTGRES_DB', 'POSTGRES_USER', 'POSTGRES_HOST', 'POSTGRES_PORT'
+                'POSTGRES_DB', 'POSTGRES_USER', 'POSTGRES_HOST', 'POSTGRES_PORT',
+                'DATABASE_CONN_MAX_AGE', 'DATABASE_CONN_HEALTH_CHECKS', 'POSTGRES_POOL',
+                'DATABASE_REPLICA_URLS'
             ]
             
             for var in env_vars:
@@ -71,6 +130,7 @@ class Command(BaseCommand):
             
             if success:
                 self.stdout.write(f"  {self.style.SUCCESS(message)}")
+                self.report_connection_management(options['samples'])
             else:
                 self.stdout.write(f"  {self.style.ERROR(message)}")
         
@@ -137,3 +197,111 @@ class Command(BaseCommand):
         self.stdout.write(f"  • Apply migrations: python manage.py migrate")
         
         self.stdout.write(f"\n{self.style.SUCCESS('Database check completed! ✓')}\n")
+
+    def report_connection_management(self, samples):
+        """Show how connections are reused, connect latency and pool statistics"""
+        db_config = settings.DATABASES['default']
+        pool_options = db_config.get('OPTIONS', {}).get('pool')
+
+        self.stdout.write(f"\n{self.style.HTTP_INFO('Connection Management:')}")
+        if pool_options:
+            self.stdout.write(f"  Mode: {self.style.SUCCESS('psycopg connection pool')}")
+            if isinstance(pool_options, dict):
+                for key, value in pool_options.items():
+                    self.stdout.write(f"  Pool {key}: {value}")
+        elif db_config.get('CONN_MAX_AGE'):
+            self.stdout.write(f"  Mode: {self.style.SUCCESS('persistent connections')} "
+                              f"(CONN_MAX_AGE={db_config['CONN_MAX_AGE']}s)")
+        else:
+            self.stdout.write(f"  Mode: {self.style.WARNING('new connection per request')} (CONN_MAX_AGE=0)")
+        self.stdout.write(f"  Health checks: {db_config.get('CONN_HEALTH_CHECKS', False)}")
+        if connection.vendor == 'sqlite':
+            self.report_sqlite_pragmas()
+
+        latency = measure_connect_latency(max(1, samples))
+        for label, key in (('Connect', 'connect_ms'), ('SELECT 1', 'query_ms')):
+            values = latency[key]
+            self.stdout.write(
+                f"  {label} latency: min {min(values):.2f} ms, "
+                f"avg {sum(values) / len(values):.2f} ms, max {max(values):.2f} ms "
+                f"({len(values)} samples)"
+            )
+
+        stats = get_pool_stats()
+        if stats is not None:
+            self.stdout.write(f"\n{self.style.HTTP_INFO('Pool Statistics:')}")
+            for key, value in sorted(stats.items()):
+                self.stdout.write(f"  {key}: {value}")
+
+    def report_sqlite_pragmas(self):
+        """Show the SQLite settings that matter for concurrent workers"""
+        with connection.cursor() as cursor:
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'cache_size', 'temp_store'):
+                value = cursor.execute(f'PRAGMA {pragma}').fetchone()[0]
+                self.stdout.write(f"  PRAGMA {pragma}: {value}")
+        self.stdout.write(f"  Write transactions: BEGIN {connection.transaction_mode or 'DEFERRED'}")
+        if not connection.settings_dict['OPTIONS'].get('init_command'):
+            self.stdout.write(f"  {self.style.WARNING('Set SQLITE_TUNING=true for WAL mode and a busy timeout')}")
+
+    def benchmark(self, options):
+        """Run the database probes and print a report"""
+        from tastestack.db_benchmark import run_benchmark
+
+        if options['alias'] not in settings.DATABASES:
+            raise CommandError(f"Unknown database alias: {options['alias']}")
+
+        self.stdout.write(self.style.SUCCESS('\n⏱️  TasteStack Database Benchmark\n'))
+        results = run_benchmark(
+            alias=options['alias'],
+            iterations=options['iterations'],
+            samples=options['samples'],
+            rows=options['rows'],
+            replay_iterations=max(5, options['iterations'] // 10),
+            seed=options['seed'],
+        )
+
+        meta = results['meta']
+        self.stdout.write(f"Database: {meta['vendor']} ({meta['alias']}) {meta['host'] or ''} {meta['name']}")
+        self.stdout.write(f"Recipes: {meta.get('recipes', 0)}\n")
+
+        header = f"  {'probe':<24}{'ops':>7}{'ops/s':>11}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        self.stdout.write(self.style.HTTP_INFO(header))
+        for name in ('connect', 'round_trip', 'point_lookup', 'range_scan', 'insert_single'):
+            if name in results:
+                self.write_row(name, results[name])
+        if 'insert_bulk' in results:
+            bulk = results['insert_bulk']
+            self.stdout.write(f"  {'insert_bulk':<24}{bulk['operations']:>7}{bulk['ops_per_s']:>11}"
+                              f"  ({bulk['total_ms']:.1f} ms total)")
+
+        if results.get('replay'):
+            self.stdout.write(f"\n{self.style.HTTP_INFO('View query replay (all SELECTs of one request per op):')}")
+            self.stdout.write(self.style.HTTP_INFO(header))
+            for name, replay in results['replay'].items():
+                self.write_row(f"{name} ({replay['statements']}q)", replay)
+            self.stdout.write('\n  Slowest statement per view:')
+            for name, replay in results['replay'].items():
+                slowest = replay.get('slowest_statement')
+                if slowest:
+                    self.stdout.write(f"  {name}: {slowest['p50_ms']} ms  {slowest['sql'][:120]}")
+
+        if results.get('replay_failed'):
+            failed = ', '.join(f'{name} ({status})' for name, status in results['replay_failed'].items())
+            self.stdout.write(f"\n  {self.style.WARNING(f'Views not replayed, their request failed: {failed}')}")
+        if results.get('skipped'):
+            self.stdout.write(f"\n  {self.style.WARNING(results['skipped'])}")
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"\nResults written to {options['output']}"))
+        self.stdout.write('')
+
+    def write_row(self, name, summary):
+        if not summary.get('operations'):
+            self.stdout.write(f"  {name:<24}{0:>7}")
+            return
+        self.stdout.write(
+            f"  {name:<24}{summary['operations']:>7}{summary['ops_per_s']:>11}"
+            f"{summary['p50_ms']:>10}{summary['p95_ms']:>10}{summary['p99_ms']:>10}{summary['max_ms']:>10}"
+        )
@@ -0,0 +1,119 @@
+"""
+Django management command to summarize the slow query log.
+
+Reads ``SLOW_QUERY_LOG_FILE`` and its rotated backups, groups the entries by
+fingerprint and lists the statements that cost the most total time.
+
+Usage:
+    python manage.py slow_queries
+    python manage.py slow_queries --top 20 --since 24 --view search-recipes
+    python manage.py slow_queries --json
+"""
+
+import json
+import os
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Summarize the slow query log by total time per query fingerprint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--file', help='Log file to read (default: SLOW_QUERY_LOG_FILE)')
+        parser.add_argument('--top', type=int, default=10, help='Number of fingerprints to show (default: 10)')
+        parser.add_argument('--since', type=float, help='Only include entries from the last N hours')
+        parser.add_argument('--view', help='Only include entries from this view name')
+        parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+
+    def handle(self, *args, **options):
+        path = options['file'] or getattr(settings, 'SLOW_QUERY_LOG_FILE', '')
+        if not path:
+            raise CommandError('SLOW_QUERY_LOG_FILE is not set and no --file was given')
+
+        since = None
+        if options['since'] is not None:
+            since = datetime.now(dt_timezone.utc) - timedelta(hours=options['since'])
+
+        groups = {}
+        entries = 0
+        for entry in self.read_entries(path):
+            if options['view'] and entry.get('view') != options['view']:
+                continue
+            if since and datetime.fromisoformat(entry['timestamp']) < since:
+                continue
+            entries += 1
+            group = groups.setdefault(entry['fingerprint'], {
+                'fingerprint': entry['fingerprint'],
+                'count': 0,
+                'total_ms': 0.0,
+                'max_ms': 0.0,
+                'views': {},
+                'last_seen': entry['timestamp'],
+                'explain': None,
+            })
+            group['count'] += 1
+            group['total_ms'] += entry['duration_ms']
+            group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+            view = entry.get('view') or '(no request)'
+            group['views'][view] = group['views'].get(view, 0) + 1
+            group['last_seen'] = max(group['last_seen'], entry['timestamp'])
+            if entry.get('explain'):
+                group['explain'] = entry['explain']
+
+        top = sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)[:options['top']]
+        for group in top:
+            group['total_ms'] = round(group['total_ms'], 2)
+            group['mean_ms'] = round(group['total_ms'] / group['count'], 2)
+
+        if options['json']:
+            self.stdout.write(json.dumps({'entries': entries, 'fingerprints': len(groups), 'top': top}, indent=2))
+            return
+
+        if not entries:
+            self.stdout.write(self.style.SUCCESS('No slow queries recorded ✓'))
+            return
+
+        self.stdout.write(self.style.SUCCESS(
+            f"\n🐢 {entries} slow queries across {len(groups)} fingerprints (top {len(top)} by total time)\n"
+        ))
+        for rank, group in enumerate(top, 1):
+            self.stdout.write(self.style.WARNING(
+                f"#{rank}  total {group['total_ms']:.1f} ms  count {group['count']}  "
+                f"mean {group['mean_ms']:.1f} ms  max {group['max_ms']:.1f} ms"
+            ))
+            self.stdout.write(f"    {group['fingerprint'][:300]}")
+            views = ', '.join(f"{name} ({count})" for name, count in
+                              sorted(group['views'].items(), key=lambda item: -item[1]))
+            self.stdout.write(f"    views: {views}")
+            self.stdout.write(f"    last seen: {group['last_seen']}")
+            if group['explain']:
+                self.stdout.write('    plan:')
+                for line in group['explain']:
+                    self.stdout.write(f"      {line}")
+            self.stdout.write('')
+
+    def read_entries(self, path):
+        """Yield entries from the log and its rotated backups, oldest first"""
+        paths = []
+        backups = getattr(settings, 'SLOW_QUERY_LOG_BACKUP_COUNT', 5)
+        for index in range(backups, 0, -1):
+            if os.path.exists(f'{path}.{index}'):
+                paths.append(f'{path}.{index}')
+        if os.path.exists(path):
+            paths.append(path)
+        if not paths:
+            raise CommandError(f'No slow query log found at {path}')
+
+        for log_path in paths:
+            with open(log_path, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
@@ -0,0 +1,71 @@
+"""
+Django management command for routine SQLite maintenance.
+
+Checkpoints the write-ahead log back into the database file (so the -wal
+file does not grow without bound under constant reads) and runs
+``PRAGMA optimize`` to refresh the query planner statistics. Run it from
+cron, or keep it running with ``--every``.
+
+Usage:
+    python manage.py sqlite_maintenance
+    python manage.py sqlite_maintenance --checkpoint TRUNCATE --every 300
+"""
+
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+
+class Command(BaseCommand):
+    help = 'Checkpoint the SQLite write-ahead log and run PRAGMA optimize'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--checkpoint',
+            choices=['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE'],
+            default='PASSIVE',
+            help='wal_checkpoint mode; TRUNCATE also empties the -wal file but waits for readers (default: PASSIVE)'
+        )
+        parser.add_argument('--skip-optimize', action='store_true', help='Only checkpoint the WAL')
+        parser.add_argument('--every', type=float, help='Repeat every N seconds until interrupted')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError(f'The default database is {connection.vendor}, not SQLite')
+
+        while True:
+            self.run_once(options)
+            if not options['every']:
+                break
+            connection.close()
+            time.sleep(options['every'])
+
+    def run_once(self, options):
+        wal_path = f"{connection.settings_dict['NAME']}-wal"
+        wal_before = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+
+        with connection.cursor() as cursor:
+            journal_mode = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+            self.stdout.write(f"Journal mode: {journal_mode}")
+
+            if journal_mode.lower() == 'wal':
+                started = time.perf_counter()
+                busy, log_frames, checkpointed = cursor.execute(
+                    f"PRAGMA wal_checkpoint({options['checkpoint']})"
+                ).fetchone()
+                elapsed = (time.perf_counter() - started) * 1000
+                wal_after = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+                status = self.style.WARNING('blocked by readers/writers') if busy else self.style.SUCCESS('done')
+                self.stdout.write(
+                    f"  Checkpoint ({options['checkpoint']}): {status}, {checkpointed}/{log_frames} frames "
+                    f"in {elapsed:.1f} ms, WAL {wal_before / 1024:.0f} KiB -> {wal_after / 1024:.0f} KiB"
+                )
+            else:
+                self.stdout.write('  Not in WAL mode, nothing to checkpoint (set SQLITE_TUNING=true)')
+
+            if not options['skip_optimize']:
+                started = time.perf_counter()
+                cursor.execute('PRAGMA optimize')
+                self.stdout.write(f"  PRAGMA optimize: {(time.perf_counter() - started) * 1000:.1f} ms")
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from .models import User
+from tastestack.uploads import BoundedImageField
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -8,6 +9,7 @@ class UserSerializer(serializers.ModelSerializer):
     name = serializers.SerializerMethodField()
     location = serializers.CharField(max_length=200, required=False, allow_blank=True)
     website = serializers.URLField(required=False, allow_blank=True)
+    profile_picture = BoundedImageField(required=False, allow_null=True)
 
     class Meta:
         model = User
@@ -1,3 +1,348 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from django.contrib.auth.tokens import default_token_generator
+from django.db import connection, connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from tastestack import db_router, ratelimit
+from tastestack.authentication import invalidate_cached_user
+from tastestack.db_benchmark import record_view_queries, request_host, view_paths
+from tastestack.test_utils import QueryBudgetTestCase, TasteStackTestCase, make_image_file
+from interactions.models import Follow
+from recipes.models import Recipe
+from .models import User
 
-# Create your tests here.
+
+class AccountQueryBudgetTests(QueryBudgetTestCase):
+    """Every URL in accounts/urls.py must not run more queries as data grows"""
+
+    def test_register(self):
+        def prepare():
+            username = f'newcomer{self.user_count}'
+            data = {'username': username, 'email': f'{username}@example.com',
+                    'password': 'freshpass123', 'password_confirm': 'freshpass123'}
+            return lambda: self.client.post(reverse('register'), data, format='json')
+        self.assertConstantQueries(prepare, 201)
+
+    def test_login(self):
+        data = {'email': 'owner@example.com', 'password': 'ownerpass123'}
+        self.assertConstantQueries(lambda: lambda: self.client.post(reverse('login'), data, format='json'), 200)
+
+    def test_token_refresh(self):
+        def prepare():
+            data = {'refresh': str(RefreshToken.for_user(self.owner))}
+            return lambda: self.client.post(reverse('token_refresh'), data, format='json')
+        self.assertConstantQueries(prepare, 200)
+
+    def test_logout(self):
+        def prepare():
+            data = {'refresh': str(RefreshToken.for_user(self.owner))}
+            return lambda: self.client.post(reverse('logout'), data, format='json')
+        self.assertConstantQueries(prepare, 200)
+
+    def test_user_profile(self):
+        self.assertConstantGet(reverse('user_profile'))
+
+    def test_update_profile(self):
+        def prepare():
+            data = {'bio': 'Home cook', 'profile_picture': make_image_file()}
+            return lambda: self.client.put(reverse('update_profile'), data, format='multipart')
+        self.assertConstantQueries(prepare, 200)
+
+    def test_dashboard_stats(self):
+        self.assertConstantGet(reverse('dashboard_stats'))
+
+    def test_recent_activity(self):
+        self.assertConstantGet(reverse('recent_activity'))
+
+    def test_public_profile(self):
+        self.assertConstantGet(reverse('public_profile', args=[self.owner.pk]))
+
+    def test_public_profile_as_viewer(self):
+        self.client.force_authenticate(self.viewer)
+        self.assertConstantGet(reverse('public_profile', args=[self.owner.pk]))
+
+    def test_follow_user(self):
+        def prepare():
+            Follow.objects.filter(follower=self.viewer, following=self.owner).delete()
+            return lambda: self.client.post(reverse('follow_user', args=[self.owner.pk]))
+        self.client.force_authenticate(self.viewer)
+        self.assertConstantQueries(prepare, 200)
+
+    def test_forgot_password(self):
+        self.assertConstantQueries(
+            lambda: lambda: self.client.post(reverse('forgot_password'), {'email': 'owner@example.com'},
+                                             format='json'), 200
+        )
+
+    def test_reset_password(self):
+        def prepare():
+            self.owner.refresh_from_db()
+            data = {'user_id': self.owner.pk, 'token': default_token_generator.make_token(self.owner),
+                    'password': 'anotherpass123'}
+            return lambda: self.client.post(reverse('reset_password'), data, format='json')
+        self.assertConstantQueries(prepare, 200)
+
+
+class CachedJWTAuthenticationTests(TasteStackTestCase):
+    """The user of a bearer token is loaded once per token, not once per request"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.owner)}')
+
+    def user_queries(self, path):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in context.captured_queries if 'FROM "accounts_user"' in query['sql']]
+
+    def test_user_is_cached_per_token(self):
+        self.assertEqual(len(self.user_queries(reverse('user_profile'))[1]), 1)
+        response, queries = self.user_queries(reverse('user_profile'))
+        self.assertEqual(queries, [])
+        self.assertEqual(response.data['email'], 'owner@example.com')
+        self.assertIn('cache;desc="hits=1 misses=0"', response['Server-Timing'])
+
+    def test_update_profile_invalidates(self):
+        self.user_queries(reverse('user_profile'))
+        response = self.client.put(reverse('update_profile'), {'bio': 'Home cook'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        response, queries = self.user_queries(reverse('user_profile'))
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(response.data['bio'], 'Home cook')
+
+        # Saving the cached user must not touch the password it does not carry
+        self.client.put(reverse('update_profile'), {'location': 'Dhaka'}, format='json')
+        response = self.client.post(reverse('login'), {'email': 'owner@example.com', 'password': 'ownerpass123'},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_update_profile_writes_only_loaded_fields(self):
+        self.user_queries(reverse('user_profile'))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.put(reverse('update_profile'), {'bio': 'Home cook'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        user_queries = [query['sql'] for query in context.captured_queries if '"accounts_user"' in query['sql']]
+        self.assertEqual(len(user_queries), 1)
+        self.assertTrue(user_queries[0].startswith('UPDATE'))
+        self.assertNotIn('"password"', user_queries[0])
+
+    def test_reset_password_invalidates(self):
+        self.user_queries(reverse('user_profile'))
+        data = {'user_id': self.owner.pk, 'token': default_token_generator.make_token(self.owner),
+                'password': 'anotherpass123'}
+        self.assertEqual(self.client.post(reverse('reset_password'), data, format='json').status_code, 200)
+        self.assertEqual(len(self.user_queries(reverse('user_profile'))[1]), 1)
+
+    def test_inactive_user_is_rejected_from_cache(self):
+        self.user_queries(reverse('user_profile'))
+        self.owner.is_active = False
+        self.owner.save()
+        invalidate_cached_user(self.owner)
+        self.assertEqual(self.client.get(reverse('user_profile')).status_code, 401)
+
+    def test_token_user_views_skip_the_user_row(self):
+        for path in (reverse('dashboard_stats'), reverse('get-comments-on-my-recipes')):
+            self.assertEqual(self.user_queries(path)[1], [])
+
+
+class RefreshTokenTests(TasteStackTestCase):
+    """Clients renew access tokens with a refresh token instead of the password"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(None)
+
+    def sign_in(self):
+        response = self.client.post(reverse('login'), {'email': 'owner@example.com', 'password': 'ownerpass123'},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def refresh(self, refresh_token):
+        return self.client.post(reverse('token_refresh'), {'refresh': refresh_token}, format='json')
+
+    def test_register_returns_refresh_token(self):
+        data = {'username': 'newcomer', 'email': 'newcomer@example.com',
+                'password': 'freshpass123', 'password_confirm': 'freshpass123'}
+        response = self.client.post(reverse('register'), data, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.refresh(response.data['refresh']).status_code, 200)
+
+    def test_refresh_rotates_and_blacklists(self):
+        tokens = self.sign_in()
+        response = self.refresh(tokens['refresh'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AccessToken(response.data['access'])['user_id'], self.owner.pk)
+
+        # The used refresh token cannot be replayed, its replacement works
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+        self.assertEqual(self.refresh(response.data['refresh']).status_code, 200)
+
+    def test_logout_blacklists(self):
+        tokens = self.sign_in()
+        self.assertEqual(self.client.post(reverse('logout'), {'refresh': tokens['refresh']}, format='json').status_code, 200)
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+
+    def test_reset_password_revokes_sessions(self):
+        tokens = self.sign_in()
+        data = {'user_id': self.owner.pk, 'token': default_token_generator.make_token(self.owner),
+                'password': 'anotherpass123'}
+        self.assertEqual(self.client.post(reverse('reset_password'), data, format='json').status_code, 200)
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+
+
+@override_settings(RATELIMIT_ENABLED=True, RATELIMIT_STORE='tastestack.ratelimit.LocalStore',
+                   RATELIMIT_RATES={'login': {'ip': '3/min'}})
+class RateLimitTests(TasteStackTestCase):
+    """Auth endpoints draw from per-IP token buckets"""
+
+    def setUp(self):
+        super().setUp()
+        ratelimit.get_store().clear()
+
+    def login(self, **extra):
+        return self.client.post(reverse('login'), {'email': 'owner@example.com', 'password': 'wrong'},
+                                format='json', **extra)
+
+    def test_login_is_limited_per_ip(self):
+        for remaining in (2, 1, 0):
+            response = self.login()
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual((response['X-RateLimit-Limit'], response['X-RateLimit-Remaining']), ('3/min', str(remaining)))
+
+        response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+
+        # Another client has its own bucket
+        self.assertEqual(self.login(REMOTE_ADDR='10.0.0.2').status_code, 400)
+
+    @override_settings(RATELIMIT_TRUSTED_PROXIES=1)
+    def test_client_ip_behind_proxy(self):
+        for _ in range(3):
+            self.login(HTTP_X_FORWARDED_FOR='203.0.113.7')
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='203.0.113.7').status_code, 429)
+        self.assertEqual(self.login(HTTP_X_FORWARDED_FOR='203.0.113.8').status_code, 400)
+
+    def test_bucket_refills(self):
+        store = ratelimit.LocalStore()
+        self.assertEqual(store.take('key', 1, 60), (True, 0))
+        self.assertFalse(store.take('key', 1, 60)[0])
+        tokens, updated, full_at = store._buckets['key']
+        store._buckets['key'] = (tokens, updated - 60, full_at - 60)
+        self.assertTrue(store.take('key', 1, 60)[0])
+
+
+REPLICAS = ('replica_1', 'replica_2')
+
+
+@override_settings(DATABASE_ROUTERS=['tastestack.db_router.ReplicaRouter'])
+class ReplicaRoutingTests(TestCase):
+    """Reads go to two SQLite replica files unless they could see stale data"""
+
+    # The replicas only exist once setUpClass() has added them
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        # Each replica is its own SQLite file holding a recipe titled after its alias
+        cls._replica_dir = tempfile.mkdtemp()
+        for alias in REPLICAS:
+            connections.settings[alias] = {'ENGINE': 'django.db.backends.sqlite3',
+                                           'NAME': os.path.join(cls._replica_dir, f'{alias}.sqlite3')}
+        connections.configure_settings(connections.settings)
+        for alias in REPLICAS:
+            with connections[alias].schema_editor() as editor:
+                editor.create_model(User)
+                editor.create_model(Recipe)
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        for alias in REPLICAS:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+        shutil.rmtree(cls._replica_dir, ignore_errors=True)
+
+    @classmethod
+    def setUpTestData(cls):
+        for alias in ('default', *REPLICAS):
+            author = User.objects.using(alias).create(username='author', email='author@example.com')
+            cls.create_recipe(alias, author, using=alias)
+        cls.author = User.objects.get(username='author')
+
+    @staticmethod
+    def create_recipe(title, author, using='default'):
+        return Recipe.objects.using(using).create(
+            title=title, description='Routing', ingredients=[], instructions=[], prep_time=1, cook_time=1,
+            servings=1, difficulty='Easy', category='dinner', author=author,
+        )
+
+    def read(self):
+        """Alias of the database the next read goes to"""
+        return Recipe.objects.order_by('id').values_list('title', flat=True).first()
+
+    def test_round_robin(self):
+        reads = [self.read() for _ in range(4)]
+        self.assertEqual(sorted(reads[:2]), list(REPLICAS))
+        self.assertEqual(reads[2:], reads[:2])
+
+    @override_settings(DATABASE_REPLICA_STRATEGY='least_loaded')
+    def test_least_loaded(self):
+        db_router._in_flight.update({'replica_1': 3, 'replica_2': 1})
+        try:
+            self.assertEqual(self.read(), 'replica_2')
+            db_router._in_flight['replica_2'] = 5
+            self.assertEqual(self.read(), 'replica_1')
+        finally:
+            db_router._in_flight.clear()
+
+    def test_write_pins_the_rest_of_the_scope(self):
+        with db_router.routing_scope():
+            self.assertIn(self.read(), REPLICAS)
+            self.create_recipe('written', self.author)
+            self.assertEqual(self.read(), 'default')
+        # Outside a scope, a write does not change where later reads go
+        self.create_recipe('written', self.author)
+        self.assertIn(self.read(), REPLICAS)
+        self.assertIn(self.read(), REPLICAS)
+
+    def test_middleware_pins_the_writer(self):
+        reads = []
+
+        def view(request):
+            reads.append(self.read())
+            return HttpResponse(status=201 if request.method == 'POST' else 200)
+
+        middleware = db_router.ReplicaPinningMiddleware(view)
+        factory = RequestFactory()
+        writer = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.author)}'}
+        middleware(factory.get('/', **writer))
+        middleware(factory.post('/', **writer))
+        middleware(factory.get('/', **writer))
+        middleware(factory.get('/'))
+        self.assertIn(reads[0], REPLICAS)
+        self.assertEqual(reads[1:3], ['default', 'default'])
+        self.assertIn(reads[3], REPLICAS)
+
+
+class DatabaseBenchmarkTests(TasteStackTestCase):
+    """The view replay of ``checkdb --benchmark``"""
+
+    @override_settings(ALLOWED_HOSTS=['.tastestack.example'])
+    def test_views_are_recorded_on_an_allowed_host(self):
+        self.assertEqual(request_host(), 'tastestack.example')
+        paths = {**view_paths(self.recipe.pk, self.owner.pk, 'recipe'), 'missing': '/api/recipes/999999/'}
+        recorded, failed = record_view_queries(self.owner, paths)
+        self.assertEqual(failed, {'missing': 404})
+        self.assertEqual(set(recorded), set(paths) - {'missing'})
+        self.assertTrue(all(recorded.values()))
@@ -1,9 +1,12 @@
 from django.urls import path
+from rest_framework_simplejwt.views import TokenBlacklistView, TokenRefreshView
 from . import views
 
 urlpatterns = [
     path('register/', views.register, name='register'),
     path('login/', views.login, name='login'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('logout/', TokenBlacklistView.as_view(), name='logout'),
     path('user/', views.user_profile, name='user_profile'),
     path('user/update/', views.update_profile, name='update_profile'),
     path('dashboard-stats/', views.dashboard_stats, name='dashboard_stats'),
@@ -1,19 +1,51 @@
+import asyncio
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
 from rest_framework_simplejwt.tokens import RefreshToken
 from django.contrib.auth.tokens import default_token_generator
 from django.core.mail import send_mail
 from django.conf import settings
 from django.db import models
 from django.db.models import Count, Sum, Avg
+from django.utils import timezone
 from .serializers import UserSerializer, UserRegistrationSerializer
 from .models import User
 from recipes.models import Recipe
 from interactions.models import Like, Comment, Follow
+from tastestack.async_api import alist, async_api_view, json_response
+from tastestack.authentication import TokenUserAuthentication, invalidate_cached_user
+from tastestack.ratelimit import rate_limit
 
 
+def issue_tokens(user):
+    """
+    Access and refresh tokens for a user who just signed in.
+
+    Clients renew the short-lived access token at ``/api/auth/token/refresh/``
+    instead of sending the password again, so the password hash is only
+    computed at sign-in.
+    """
+    refresh = RefreshToken.for_user(user)
+    return {
+        'token': str(refresh.access_token),
+        'refresh': str(refresh),
+    }
+
+
+def revoke_refresh_tokens(user):
+    """Blacklist every unexpired refresh token of a user, signing out their other sessions"""
+    token_ids = OutstandingToken.objects.filter(
+        user=user, expires_at__gt=timezone.now(), blacklistedtoken__isnull=True
+    ).values_list('id', flat=True)
+    BlacklistedToken.objects.bulk_create(
+        [BlacklistedToken(token_id=token_id) for token_id in token_ids], ignore_conflicts=True
+    )
+
+
+@rate_limit('register')
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def register(request):
@@ -59,11 +91,10 @@ def register(request):
         print("Serializer is valid, creating user...")
         try:
             user = serializer.save()
-            refresh = RefreshToken.for_user(user)
             print(f"User created successfully: {user.email}")
             return Response({
                 'user': UserSerializer(user).data,
-                'token': str(refresh.access_token),
+                **issue_tokens(user),
             }, status=status.HTTP_201_CREATED)
         except Exception as e:
             print(f"Error creating user: {e}")
@@ -86,6 +117,7 @@ def register(request):
     return Response(formatted_errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@rate_limit('login')
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def login(request):
@@ -99,10 +131,9 @@ def login(request):
             return Response({'error': 'Invalid credentials'}, status=status.HTTP_400_BAD_REQUEST)
         
         if user.check_password(password):
-            refresh = RefreshToken.for_user(user)
             return Response({
                 'user': UserSerializer(user).data,
-                'token': str(refresh.access_token),
+                **issue_tokens(user),
             })
         else:
             return Response({'error': 'Invalid credentials'}, status=status.HTTP_400_BAD_REQUEST)
@@ -150,6 +181,7 @@ def update_profile(request):
             serializer.update(user, validated_data)
         else:
             serializer.save()
+        invalidate_cached_user(user)
         
         return Response(serializer.data)
     
@@ -160,26 +192,28 @@ def update_profile(request):
 
 
 @api_view(['GET'])
+@authentication_classes([TokenUserAuthentication])
 @permission_classes([IsAuthenticated])
 def dashboard_stats(request):
     """Get user dashboard statistics"""
-    user = request.user
+    # Only the id is needed, so the user row is never loaded
+    user_id = request.user.id
     
     # Get user's recipes
-    user_recipes = Recipe.objects.filter(author=user)
+    user_recipes = Recipe.objects.filter(author_id=user_id)
     total_recipes = user_recipes.count()
     
     # Get total likes on user's recipes
-    total_likes = Like.objects.filter(recipe__author=user).count()
+    total_likes = Like.objects.filter(recipe__author_id=user_id).count()
     
     # Get total comments on user's recipes
-    total_comments = Comment.objects.filter(recipe__author=user, hidden=False).count()
+    total_comments = Comment.objects.filter(recipe__author_id=user_id, hidden=False).count()
     
     # Get followers count
-    followers_count = Follow.objects.filter(following=user).count()
+    followers_count = Follow.objects.filter(following_id=user_id).count()
     
     # Get following count
-    following_count = Follow.objects.filter(follower=user).count()
+    following_count = Follow.objects.filter(follower_id=user_id).count()
     
     return Response({
         'total_recipes': total_recipes,
@@ -209,7 +243,7 @@ def recent_activity(request):
         })
     
     # Get recent likes on user's recipes
-    recent_likes = Like.objects.filter(recipe__author=user).order_by('-created_at')[:5]
+    recent_likes = Like.objects.filter(recipe__author=user).select_related('recipe', 'user').order_by('-created_at')[:5]
     for like in recent_likes:
         activities.append({
             'type': 'recipe_liked',
@@ -219,7 +253,9 @@ def recent_activity(request):
         })
     
     # Get recent comments on user's recipes
-    recent_comments = Comment.objects.filter(recipe__author=user, hidden=False).order_by('-created_at')[:5]
+    recent_comments = Comment.objects.filter(recipe__author=user, hidden=False).select_related(
+        'recipe', 'user'
+    ).order_by('-created_at')[:5]
     for comment in recent_comments:
         activities.append({
             'type': 'comment_received',
@@ -230,7 +266,7 @@ def recent_activity(request):
         })
     
     # Get recent followers
-    recent_followers = Follow.objects.filter(following=user).order_by('-created_at')[:5]
+    recent_followers = Follow.objects.filter(following=user).select_related('follower').order_by('-created_at')[:5]
     for follow in recent_followers:
         activities.append({
             'type': 'follower_gained',
@@ -275,35 +311,42 @@ def follow_user(request, user_id):
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def public_profile(request, user_id):
+async def _not_following():
+    """Stands in for the follow lookup when there is nothing to look up"""
+    return False
+
+
+@async_api_view(['GET'], permission_classes=[AllowAny])
+async def public_profile(request, user_id):
     """Get public profile view of a user"""
     try:
-        user = User.objects.get(pk=user_id)
+        user = await User.objects.aget(pk=user_id)
     except User.DoesNotExist:
-        return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+        return json_response({'error': 'User not found'}, status.HTTP_404_NOT_FOUND)
     
     # Get user's public recipes
     user_recipes = Recipe.objects.filter(author=user).order_by('-created_at')
-    total_recipes = user_recipes.count()
-    
-    # Get total likes on user's recipes
-    total_likes = Like.objects.filter(recipe__author=user).count()
-    
-    # Get average rating of user's recipes
-    avg_rating = user_recipes.aggregate(
-        avg_rating=models.Avg('ratings__rating')
-    )['avg_rating'] or 0
-    
-    # Get followers/following count
-    followers_count = Follow.objects.filter(following=user).count()
-    following_count = Follow.objects.filter(follower=user).count()
+    recent_recipes = user_recipes.select_related('author').prefetch_related('images').with_stats()[:6]
     
     # Check if current user is following this user (if authenticated)
-    is_following = False
-    if request.user.is_authenticated and request.user != user:
-        is_following = Follow.objects.filter(follower=request.user, following=user).exists()
+    viewer = request.user
+    if viewer.is_authenticated and viewer.pk != user.pk:
+        is_following = Follow.objects.filter(follower=viewer, following=user).aexists()
+    else:
+        is_following = _not_following()
+    
+    # The counts are independent, so run them concurrently
+    (total_recipes, total_likes, rating, followers_count, following_count,
+     is_following, recent_recipes) = await asyncio.gather(
+        user_recipes.acount(),
+        Like.objects.filter(recipe__author=user).acount(),
+        user_recipes.aaggregate(avg_rating=models.Avg('ratings__rating')),
+        Follow.objects.filter(following=user).acount(),
+        Follow.objects.filter(follower=user).acount(),
+        is_following,
+        alist(recent_recipes),
+    )
+    avg_rating = rating['avg_rating'] or 0
     
     # Serialize user data (exclude sensitive info for public view)
     user_data = {
@@ -318,12 +361,12 @@ def public_profile(request, user_id):
         'date_joined': user.date_joined,
     }
     
-    # Get recent recipes (limit to 6 for preview)
-    from recipes.serializers import RecipeSerializer
-    recent_recipes = user_recipes[:6]
-    recipe_serializer = RecipeSerializer(recent_recipes, many=True, context={'request': request})
+    # Serialize recent recipes (limit to 6 for preview)
+    from recipes.serializers import RecipeSerializer, aget_viewer_context
+    viewer_context = await aget_viewer_context(viewer, [recipe.id for recipe in recent_recipes])
+    recipe_serializer = RecipeSerializer(recent_recipes, many=True, context={'request': request, **viewer_context})
     
-    return Response({
+    return json_response({
         'user': user_data,
         'stats': {
             'total_recipes': total_recipes,
@@ -337,6 +380,7 @@ def public_profile(request, user_id):
     })
 
 
+@rate_limit('forgot_password')
 @api_view(['POST'])
 @permission_classes([AllowAny])
 def forgot_password(request):
@@ -382,6 +426,8 @@ def reset_password(request):
         if default_token_generator.check_token(user, token):
             user.set_password(password)
             user.save()
+            invalidate_cached_user(user)
+            revoke_refresh_tokens(user)
             return Response({'message': 'Password reset successful'})
         else:
             return Response({'error': 'Invalid or expired token'}, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,122 @@
+"""
+Live update events for likes, ratings and comments.
+
+Each recipe has a ``recipe:<id>`` channel carrying ``stats`` events (fresh
+like and rating counts) and ``comment`` events (a comment was created,
+updated, hidden or deleted). Each user has a ``user:<id>`` inbox carrying
+``activity`` events when someone else likes, rates or comments on one of
+their recipes.
+
+The publish functions defer their work to ``transaction.on_commit`` and do
+nothing while no stream is open (with the in-process backend), so writes
+pay for live updates only while someone watches.
+"""
+
+from django.db import transaction
+from django.db.models import Avg, Count
+from recipes.models import Recipe
+from tastestack import live
+
+
+def recipe_channel(recipe_id):
+    return f'recipe:{recipe_id}'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def _actor(user):
+    return {'id': user.id, 'username': user.username}
+
+
+def comment_payload(comment):
+    """Compact representation of a comment; ``comment.user`` must be loaded"""
+    user = comment.user
+    return {
+        'id': comment.id,
+        'content': comment.content,
+        'hidden': comment.hidden,
+        'created_at': comment.created_at,
+        'updated_at': comment.updated_at,
+        'user': {
+            'id': user.id,
+            'username': user.username,
+            'profile_picture': user.profile_picture.url if user.profile_picture else None,
+        },
+    }
+
+
+def _listened():
+    return live.is_enabled() and live.broker.has_listeners()
+
+
+def publish_recipe_activity(user, activity):
+    """
+    Publish fresh counts of recipes a user liked, unliked or rated.
+
+    Args:
+        user: The user who made the change
+        activity: recipe id -> ``{'type': 'like' | 'unlike' | 'rating', ...}``;
+            the dict also goes to the author's inbox, except for unlikes
+    """
+    if activity:
+        transaction.on_commit(lambda: _send_recipe_activity(user, dict(activity)))
+
+
+def _send_recipe_activity(user, activity):
+    if not _listened():
+        return
+    # Counts of every touched recipe in one query
+    rows = Recipe.objects.filter(pk__in=activity).values('id', 'title', 'author_id').annotate(
+        likes_count=Count('likes', distinct=True),
+        ratings_count=Count('ratings', distinct=True),
+        average_rating=Avg('ratings__rating'),
+    )
+    for row in rows:
+        live.publish(recipe_channel(row['id']), 'stats', {
+            'recipe': row['id'],
+            'likes_count': row['likes_count'],
+            'ratings_count': row['ratings_count'],
+            'average_rating': round(row['average_rating'] or 0, 2),
+        })
+        event = activity[row['id']]
+        if row['author_id'] != user.id and event['type'] != 'unlike':
+            live.publish(user_channel(row['author_id']), 'activity', {
+                **event, 'recipe': row['id'], 'title': row['title'], 'user': _actor(user),
+            })
+
+
+def publish_comment(action, recipe, comment, user):
+    """
+    Publish a new or changed comment to the recipe's channel; new comments
+    also go to the recipe author's inbox.
+
+    Args:
+        action: ``created``, ``updated`` or ``hidden``
+        recipe: The commented recipe
+        comment: The comment, with ``user`` loaded
+        user: The user who made the change
+    """
+    if not _listened():
+        return
+    # A hidden comment's text must not reach the streams it was hidden from
+    payload = {'id': comment.id, 'hidden': True} if action == 'hidden' else comment_payload(comment)
+
+    def send():
+        live.publish(recipe_channel(recipe.id), 'comment', {
+            'action': action, 'recipe': recipe.id, 'comment': payload,
+        })
+        if action == 'created' and recipe.author_id != user.id:
+            live.publish(user_channel(recipe.author_id), 'activity', {
+                'type': 'comment', 'recipe': recipe.id, 'title': recipe.title,
+                'user': _actor(user), 'comment': payload['id'], 'excerpt': payload['content'][:140],
+            })
+    transaction.on_commit(send)
+
+
+def publish_comment_deleted(recipe, comment_id):
+    if _listened():
+        transaction.on_commit(lambda: live.publish(recipe_channel(recipe.id), 'comment', {
+            'action': 'deleted', 'recipe': recipe.id, 'comment': {'id': comment_id},
+        }))
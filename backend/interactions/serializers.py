@@ -22,6 +22,7 @@ class RatingSerializer(serializers.ModelSerializer):
             recipe=recipe,
             defaults={'rating': validated_data['rating']}
         )
+        self.created = created
         return rating
 
 
@@ -42,6 +43,7 @@ class LikeSerializer(serializers.ModelSerializer):
             user=user,
             recipe=recipe
         )
+        self.created = created
         return like
 
 
@@ -78,3 +80,17 @@ class CommentSerializer(serializers.ModelSerializer):
             content=validated_data['content']
         )
         return comment
+
+
+class InteractionOperationSerializer(serializers.Serializer):
+    """A single like, unlike or rate operation of a batch request"""
+    OPERATIONS = ('like', 'unlike', 'rate')
+
+    op = serializers.ChoiceField(choices=OPERATIONS)
+    recipe = serializers.IntegerField(min_value=1)
+    rating = serializers.IntegerField(min_value=1, max_value=5, required=False)
+
+    def validate(self, data):
+        if data['op'] == 'rate' and 'rating' not in data:
+            raise serializers.ValidationError({'rating': 'This field is required for rate operations.'})
+        return data
@@ -1,3 +1,265 @@
-from django.test import TestCase
+import asyncio
+import json
+import time
+from asgiref.sync import sync_to_async
+from django.test import AsyncClient, override_settings
+from django.urls import reverse
+from tastestack.metrics import QueryTimer, RequestMetrics
+from tastestack.middleware import WrappingMiddleware
+from tastestack.nplusone import NPlusOneError, detect_nplusone
+from tastestack.overload import StatementDeadline
+from tastestack.queries import instrument_queries
+from tastestack.test_utils import QueryBudgetTestCase, TasteStackTestCase
+from tastestack.live import RESYNC, Subscription
+from .models import Like, Comment, Rating
 
-# Create your tests here.
+
+class InteractionQueryBudgetTests(QueryBudgetTestCase):
+    """Every URL in interactions/urls.py must not run more queries as data grows"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.viewer)
+
+    def test_like_recipe(self):
+        def prepare():
+            Like.objects.filter(user=self.viewer, recipe=self.recipe).delete()
+            return lambda: self.client.post(reverse('like-recipe', args=[self.recipe.pk]))
+        self.assertConstantQueries(prepare, 201)
+
+    def test_unlike_recipe(self):
+        def prepare():
+            Like.objects.get_or_create(user=self.viewer, recipe=self.recipe)
+            return lambda: self.client.post(reverse('unlike-recipe', args=[self.recipe.pk]))
+        self.assertConstantQueries(prepare, 204)
+
+    def test_get_recipe_comments(self):
+        self.assertConstantGet(reverse('get-recipe-comments', args=[self.recipe.pk]))
+
+    def test_add_comment(self):
+        self.assertConstantQueries(
+            lambda: lambda: self.client.post(reverse('add-comment', args=[self.recipe.pk]),
+                                             {'content': 'Tasty'}, format='json'), 201
+        )
+
+    def test_edit_comment(self):
+        def prepare():
+            comment = Comment.objects.create(user=self.viewer, recipe=self.recipe, content='Draft')
+            return lambda: self.client.put(reverse('edit-comment', args=[self.recipe.pk, comment.pk]),
+                                           {'content': 'Edited'}, format='json')
+        self.assertConstantQueries(prepare, 200)
+
+    def test_delete_comment(self):
+        def prepare():
+            comment = Comment.objects.create(user=self.viewer, recipe=self.recipe, content='Doomed')
+            return lambda: self.client.delete(reverse('delete-comment', args=[self.recipe.pk, comment.pk]))
+        self.assertConstantQueries(prepare, 204)
+
+    def test_hide_comment(self):
+        def prepare():
+            comment = Comment.objects.create(user=self.viewer, recipe=self.recipe, content='Hidden')
+            return lambda: self.client.post(reverse('hide-comment', args=[self.recipe.pk, comment.pk]))
+        self.assertConstantQueries(prepare, 200)
+
+    def test_batch_interactions(self):
+        def prepare():
+            operations = []
+            for recipe_id in self.owner.recipes.values_list('id', flat=True):
+                operations.append({'op': 'like', 'recipe': recipe_id})
+                operations.append({'op': 'rate', 'recipe': recipe_id, 'rating': 3})
+            return lambda: self.client.post(reverse('batch-interactions'), {'operations': operations}, format='json')
+        self.assertConstantQueries(prepare, 200)
+
+    def test_get_comments_on_my_recipes(self):
+        self.client.force_authenticate(self.owner)
+        self.assertConstantGet(reverse('get-comments-on-my-recipes'))
+
+
+class BatchInteractionTests(TasteStackTestCase):
+    """Batched likes, unlikes and ratings"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.viewer)
+        self.other = self.create_recipe(self.owner, 'Other Recipe')
+
+    def batch(self, *operations):
+        return self.client.post(reverse('batch-interactions'), {'operations': list(operations)}, format='json')
+
+    def test_last_operation_wins(self):
+        response = self.batch(
+            {'op': 'like', 'recipe': self.recipe.pk}, {'op': 'unlike', 'recipe': self.recipe.pk},
+            {'op': 'unlike', 'recipe': self.other.pk}, {'op': 'like', 'recipe': self.other.pk},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Like.objects.filter(user=self.viewer).values_list('recipe_id', flat=True)),
+                         [self.other.pk])
+        self.assertFalse(response.data['recipes'][self.recipe.pk]['is_liked'])
+        self.assertEqual(response.data['recipes'][self.other.pk], {'likes_count': 1, 'average_rating': 0,
+                                                                   'is_liked': True})
+        self.recipe.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual(self.recipe.trending_day, 0)
+        self.assertGreater(self.other.trending_day, 0)
+
+    def test_rating_is_upserted(self):
+        self.batch({'op': 'rate', 'recipe': self.recipe.pk, 'rating': 2})
+        created_at = Rating.objects.get(user=self.viewer).created_at
+        self.recipe.refresh_from_db()
+        score = self.recipe.trending_day
+
+        response = self.batch({'op': 'rate', 'recipe': self.recipe.pk, 'rating': 5},
+                              {'op': 'rate', 'recipe': self.recipe.pk, 'rating': 4})
+        self.assertEqual(response.status_code, 200)
+        rating = Rating.objects.get(user=self.viewer)
+        self.assertEqual((rating.rating, rating.created_at), (4, created_at))
+        self.assertEqual(response.data['recipes'][self.recipe.pk]['average_rating'], 4)
+        # Changing a rating is not a new interaction
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.trending_day, score)
+
+    def test_invalid_operations(self):
+        response = self.batch({'op': 'bookmark', 'recipe': self.recipe.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual((response.data['applied'], response.data['failed']), (0, 1))
+        self.assertIn('op', response.data['results'][0]['errors'])
+
+        response = self.batch({'op': 'like', 'recipe': self.recipe.pk}, {'op': 'rate', 'recipe': self.other.pk})
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.data['results']], ['ok', 'error'])
+        self.assertTrue(Like.objects.filter(user=self.viewer, recipe=self.recipe).exists())
+
+        response = self.client.post(reverse('batch-interactions'), {'operations': []}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class NPlusOneDetectorTests(TasteStackTestCase):
+    """The detector must flag lazy loads in a loop and point at the relation to fetch"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # One comment on each of more recipes than NPLUSONE_THRESHOLD
+        for number in range(8):
+            recipe = cls.create_recipe(cls.owner, f'Recipe {number}')
+            Comment.objects.create(user=cls.viewer, recipe=recipe, content='Tasty')
+
+    def test_lazy_foreign_key_raises_with_suggestion(self):
+        with self.assertRaises(NPlusOneError) as raised:
+            with detect_nplusone('comment loop'):
+                titles = [comment.recipe.title for comment in Comment.objects.all()]
+        self.assertTrue(titles)
+        report = str(raised.exception)
+        self.assertIn("Comment: select_related('recipe')", report)
+        self.assertIn('interactions/tests.py', report)
+
+    def test_call_site_skips_instrumentation(self):
+        def view(request):
+            with instrument_queries(QueryTimer(RequestMetrics())):
+                with instrument_queries(StatementDeadline(time.monotonic() + 60)):
+                    return [comment.recipe.title for comment in Comment.objects.all()]
+
+        with self.assertRaises(NPlusOneError) as raised:
+            with detect_nplusone('comment loop'):
+                WrappingMiddleware(view)(None)
+        report = str(raised.exception)
+        self.assertIn('interactions/tests.py', report)
+        self.assertNotIn('tastestack/', report)
+
+    def test_select_related_passes(self):
+        with detect_nplusone('comment loop'):
+            [comment.recipe.title for comment in Comment.objects.select_related('recipe')]
+
+
+class LiveUpdateTests(TasteStackTestCase):
+    """Server-Sent Event streams of recipes and inboxes"""
+
+    def setUp(self):
+        super().setUp()
+        self.async_client = AsyncClient()
+
+    async def open_stream(self, path):
+        response = await self.async_client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertIn(b'event: ready', await anext(stream))
+        return stream
+
+    async def next_event(self, stream):
+        chunk = await asyncio.wait_for(anext(stream), 5)
+        event_type, data = chunk.decode().strip().split('\n')
+        return event_type.removeprefix('event: '), json.loads(data.removeprefix('data: '))
+
+    def post(self, name, args, data=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse(name, args=args), data or {}, format='json')
+        self.assertLess(response.status_code, 400)
+        return response
+
+    async def recipe_stream_path(self):
+        ticket = (await sync_to_async(self.post)('events-ticket', [])).data['ticket']
+        return f"{reverse('recipe-events', args=[self.recipe.pk])}?ticket={ticket}"
+
+    async def test_recipe_stream(self):
+        stream = await self.open_stream(await self.recipe_stream_path())
+        try:
+            self.client.force_authenticate(self.viewer)
+            await sync_to_async(self.post)('like-recipe', [self.recipe.pk])
+            self.assertEqual(await self.next_event(stream), ('stats', {
+                'recipe': self.recipe.pk, 'likes_count': 1, 'ratings_count': 0, 'average_rating': 0,
+            }))
+
+            await sync_to_async(self.post)('add-comment', [self.recipe.pk], {'content': 'Lovely'})
+            event_type, data = await self.next_event(stream)
+            self.assertEqual((event_type, data['action'], data['comment']['content']), ('comment', 'created', 'Lovely'))
+
+            # A hidden comment's text is not sent again
+            comment_id = data['comment']['id']
+            self.client.force_authenticate(self.owner)
+            await sync_to_async(self.post)('hide-comment', [self.recipe.pk, comment_id])
+            self.assertEqual(await self.next_event(stream), ('comment', {
+                'action': 'hidden', 'recipe': self.recipe.pk, 'comment': {'id': comment_id, 'hidden': True},
+            }))
+        finally:
+            await stream.aclose()
+
+    async def test_recipe_stream_needs_credentials(self):
+        path = reverse('recipe-events', args=[self.recipe.pk])
+        self.assertEqual((await self.async_client.get(path)).status_code, 401)
+        self.assertEqual((await self.async_client.get(path, {'ticket': 'forged'})).status_code, 401)
+
+    async def test_inbox_stream(self):
+        response = await self.async_client.get(reverse('inbox-events'), {'ticket': 'forged'})
+        self.assertEqual(response.status_code, 401)
+
+        ticket = (await sync_to_async(self.post)('events-ticket', [])).data['ticket']
+        stream = await self.open_stream(f"{reverse('inbox-events')}?ticket={ticket}")
+        try:
+            self.client.force_authenticate(self.viewer)
+            await sync_to_async(self.post)('rate-recipe', [self.recipe.pk], {'rating': 4})
+            event_type, data = await self.next_event(stream)
+            self.assertEqual(event_type, 'activity')
+            self.assertEqual((data['type'], data['rating'], data['user']['id']), ('rating', 4, self.viewer.pk))
+        finally:
+            await stream.aclose()
+
+    @override_settings(LIVE_UPDATES_HEARTBEAT_SECONDS=0.01)
+    async def test_heartbeat(self):
+        stream = await self.open_stream(await self.recipe_stream_path())
+        try:
+            self.assertEqual(await asyncio.wait_for(anext(stream), 5), b': heartbeat\n\n')
+        finally:
+            await stream.aclose()
+
+    async def test_slow_client_gets_resync(self):
+        subscription = Subscription(('recipe:1',), asyncio.get_running_loop(), max_queue=3)
+        for number in range(5):
+            subscription.deliver(f'event {number}')
+        self.assertEqual(subscription.queue.qsize(), 2)
+        self.assertEqual(subscription.queue.get_nowait(), RESYNC)
+        self.assertEqual(subscription.queue.get_nowait(), 'event 4')
+
+    def test_wsgi_is_refused(self):
+        response = self.client.get(reverse('recipe-events', args=[self.recipe.pk]))
+        self.assertEqual(response.status_code, 503)
@@ -9,5 +9,9 @@ urlpatterns = [
     path('recipes/<int:recipe_id>/comments/<int:comment_id>/edit/', views.edit_comment, name='edit-comment'),
     path('recipes/<int:recipe_id>/comments/<int:comment_id>/delete/', views.delete_comment, name='delete-comment'),
     path('recipes/<int:recipe_id>/comments/<int:comment_id>/hide/', views.hide_comment, name='hide-comment'),
+    path('batch/', views.batch_interactions, name='batch-interactions'),
+    path('recipes/<int:recipe_id>/events/', views.recipe_events, name='recipe-events'),
+    path('events/ticket/', views.events_ticket, name='events-ticket'),
+    path('events/inbox/', views.inbox_events, name='inbox-events'),
     path('comments/my-recipes/', views.get_comments_on_my_recipes, name='get-comments-on-my-recipes'),
 ]
@@ -1,12 +1,29 @@
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
+from django.core import signing
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
 from django.utils.html import escape
+import asyncio
 import os
-from .models import Like, Comment
-from .serializers import LikeSerializer, CommentSerializer
+from .models import Like, Comment, Rating
+from .events import publish_comment, publish_comment_deleted, publish_recipe_activity, recipe_channel, user_channel
+from .serializers import LikeSerializer, CommentSerializer, InteractionOperationSerializer
 from recipes.models import Recipe
+from recipes.recommendations import mark_changed
+from recipes import trending
+from recipes.trending import Interaction
+from tastestack import live
+from tastestack.async_api import alist, async_api_view, json_response
+from tastestack.authentication import TokenUserAuthentication
+
+
+EVENTS_TICKET_SALT = 'interactions.events.ticket'
 
 
 @api_view(['POST'])
@@ -19,7 +36,11 @@ def like_recipe(request, recipe_id):
     
     serializer = LikeSerializer(data={'recipe': recipe.id}, context={'request': request})
     if serializer.is_valid():
-        serializer.save()
+        like = serializer.save()
+        if serializer.created:
+            trending.record([Interaction(recipe.id, 'like', like.created_at)])
+        mark_changed([recipe.id])
+        publish_recipe_activity(request.user, {recipe.id: {'type': 'like'}})
         return Response({'message': 'Recipe liked successfully'}, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -35,21 +56,26 @@ def unlike_recipe(request, recipe_id):
     try:
         like = Like.objects.get(user=request.user, recipe=recipe)
         like.delete()
+        trending.record([Interaction(recipe.id, 'like', like.created_at, removed=True)])
+        mark_changed([recipe.id])
+        publish_recipe_activity(request.user, {recipe.id: {'type': 'unlike'}})
         return Response({'message': 'Recipe unliked successfully'}, status=status.HTTP_204_NO_CONTENT)
     except Like.DoesNotExist:
         return Response({'error': 'You have not liked this recipe'}, status=status.HTTP_400_BAD_REQUEST)
 
 
-@api_view(['GET'])
-def get_recipe_comments(request, recipe_id):
-    try:
-        recipe = Recipe.objects.get(pk=recipe_id)
-    except Recipe.DoesNotExist:
-        return Response({'error': 'Recipe not found'}, status=status.HTTP_404_NOT_FOUND)
+@async_api_view(['GET'])
+async def get_recipe_comments(request, recipe_id):
+    comments = Comment.objects.filter(recipe_id=recipe_id).select_related('user', 'recipe__author')
+    recipe_exists, comments = await asyncio.gather(
+        Recipe.objects.filter(pk=recipe_id).aexists(),
+        alist(comments),
+    )
+    if not recipe_exists:
+        return json_response({'error': 'Recipe not found'}, status.HTTP_404_NOT_FOUND)
     
-    comments = Comment.objects.filter(recipe=recipe)
     serializer = CommentSerializer(comments, many=True)
-    return Response(serializer.data)
+    return json_response(serializer.data)
 
 
 @api_view(['POST'])
@@ -63,7 +89,9 @@ def add_comment(request, recipe_id):
     serializer = CommentSerializer(data={'recipe_id': recipe_id, 'content': request.data.get('content')},
                                  context={'request': request})
     if serializer.is_valid():
-        serializer.save()
+        comment = serializer.save()
+        trending.record([Interaction(recipe.id, 'comment', comment.created_at)])
+        publish_comment('created', recipe, comment, request.user)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -95,6 +123,7 @@ def edit_comment(request, recipe_id, comment_id):
         new_content = escape(new_content)
         comment.content = new_content
     comment.save()
+    publish_comment('updated', recipe, comment, request.user)
     
     serializer = CommentSerializer(comment)
     return Response(serializer.data, status=status.HTTP_200_OK)
@@ -118,8 +147,11 @@ def hide_comment(request, recipe_id, comment_id):
         return Response({'error': 'You do not have permission to hide this comment'}, status=status.HTTP_403_FORBIDDEN)
     
     # Hide the comment
+    if not comment.hidden:
+        trending.record([Interaction(recipe.id, 'comment', comment.created_at, removed=True)])
     comment.hidden = True
     comment.save()
+    publish_comment('hidden', recipe, comment, request.user)
     
     return Response({'message': 'Comment hidden successfully'}, status=status.HTTP_200_OK)
 
@@ -141,22 +173,214 @@ def delete_comment(request, recipe_id, comment_id):
     if comment.user != request.user and recipe.author != request.user:
         return Response({'error': 'You do not have permission to delete this comment'}, status=status.HTTP_403_FORBIDDEN)
     
+    comment_id = comment.id
     comment.delete()
+    if not comment.hidden:
+        trending.record([Interaction(recipe.id, 'comment', comment.created_at, removed=True)])
+    publish_comment_deleted(recipe, comment_id)
     return Response({'message': 'Comment deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
 
 
 @api_view(['GET'])
+@authentication_classes([TokenUserAuthentication])
 @permission_classes([IsAuthenticated])
 def get_comments_on_my_recipes(request):
     """Get all comments on the current user's recipes for moderation"""
-    user = request.user
-    
     # Get all comments on user's recipes
     comments = Comment.objects.filter(
-        recipe__author=user
-    ).select_related('user', 'recipe').order_by('-created_at')
+        recipe__author_id=request.user.id
+    ).select_related('user', 'recipe__author').order_by('-created_at')
     
     serializer = CommentSerializer(comments, many=True)
     return Response({
         'comments': serializer.data
     })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_interactions(request):
+    """
+    Apply many like, unlike and rate operations in one request.
+
+    Expects ``{"operations": [{"op": "like", "recipe": 1},
+    {"op": "rate", "recipe": 2, "rating": 4}, ...]}``. Operations are
+    validated one by one; valid ones are applied in a single transaction with
+    bulk upserts, and when several operations touch the same recipe the last
+    one wins. The response has one result per operation, in request order,
+    with status 200 when every operation applied, 207 when some did and 400
+    when none did.
+    """
+    operations = request.data.get('operations')
+    if not isinstance(operations, list) or not operations:
+        return Response({'error': 'operations must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+
+    max_operations = getattr(settings, 'INTERACTION_BATCH_MAX_OPERATIONS', 500)
+    if len(operations) > max_operations:
+        return Response(
+            {'error': f'A batch can contain at most {max_operations} operations'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    results = []
+    valid = []
+    operation_serializer = InteractionOperationSerializer()
+    for index, operation in enumerate(operations):
+        try:
+            data = operation_serializer.run_validation(operation)
+        except ValidationError as e:
+            results.append({'index': index, 'status': 'error', 'errors': e.detail})
+            continue
+        results.append({'index': index, 'op': data['op'], 'recipe': data['recipe'], 'status': 'ok'})
+        valid.append((index, data))
+
+    # One query to check that every referenced recipe exists
+    existing_ids = set(Recipe.objects.filter(
+        pk__in={data['recipe'] for _, data in valid}
+    ).values_list('id', flat=True))
+
+    like_state = {}  # recipe id -> True (like) / False (unlike), last operation wins
+    ratings = {}  # recipe id -> rating, last operation wins
+    for index, data in valid:
+        if data['recipe'] not in existing_ids:
+            results[index].update({'status': 'error', 'errors': {'recipe': 'Recipe not found'}})
+            continue
+        if data['op'] == 'rate':
+            ratings[data['recipe']] = data['rating']
+            results[index]['rating'] = data['rating']
+        else:
+            like_state[data['recipe']] = data['op'] == 'like'
+
+    user = request.user
+    liked_ids = [recipe_id for recipe_id, liked in like_state.items() if liked]
+    unliked_ids = [recipe_id for recipe_id, liked in like_state.items() if not liked]
+
+    now = timezone.now()
+    with transaction.atomic():
+        # Only likes and ratings that change something count towards trending
+        # scores, so they are derived from the rows this transaction wrote
+        interactions = []
+        if liked_ids:
+            # Existing likes keep their original timestamp
+            Like.objects.bulk_create(
+                [Like(user=user, recipe_id=recipe_id, created_at=now) for recipe_id in liked_ids],
+                ignore_conflicts=True,
+            )
+            interactions += [Interaction(recipe_id, 'like', now) for recipe_id in Like.objects.filter(
+                user=user, recipe_id__in=liked_ids, created_at=now).values_list('recipe_id', flat=True)]
+        if unliked_ids:
+            # Locked, so a concurrent unlike waits and then finds nothing to remove
+            removed = dict(Like.objects.select_for_update().filter(user=user, recipe_id__in=unliked_ids)
+                           .values_list('recipe_id', 'created_at'))
+            if removed:
+                Like.objects.filter(user=user, recipe_id__in=list(removed)).delete()
+            interactions += [Interaction(recipe_id, 'like', created_at, removed=True)
+                             for recipe_id, created_at in removed.items()]
+        if ratings:
+            Rating.objects.bulk_create(
+                [Rating(user=user, recipe_id=recipe_id, rating=value, created_at=now, updated_at=now)
+                 for recipe_id, value in ratings.items()],
+                update_conflicts=True,
+                unique_fields=['user', 'recipe'],
+                update_fields=['rating', 'updated_at'],
+            )
+            # Updated ratings keep their created_at
+            interactions += [Interaction(recipe_id, 'rating', now) for recipe_id in Rating.objects.filter(
+                user=user, recipe_id__in=list(ratings), created_at=now).values_list('recipe_id', flat=True)]
+        trending.record(interactions)
+        mark_changed(set(like_state) | set(ratings))
+
+    activity = {recipe_id: {'type': 'like' if liked else 'unlike'} for recipe_id, liked in like_state.items()}
+    activity.update({recipe_id: {'type': 'rating', 'rating': value} for recipe_id, value in ratings.items()})
+    publish_recipe_activity(user, activity)
+
+    # Fresh counts for the touched recipes, in one query
+    touched_ids = set(like_state) | set(ratings)
+    recipes = {
+        row['id']: {
+            'likes_count': row['num_likes'],
+            'average_rating': row['avg_rating'] or 0,
+            'is_liked': row['is_liked'],
+        }
+        for row in Recipe.objects.filter(pk__in=touched_ids).with_stats().annotate(
+            is_liked=Exists(Like.objects.filter(recipe=OuterRef('pk'), user=user)),
+        ).values('id', 'num_likes', 'avg_rating', 'is_liked')
+    } if touched_ids else {}
+
+    applied = sum(1 for result in results if result['status'] == 'ok')
+    failed = len(results) - applied
+    if failed == 0:
+        response_status = status.HTTP_200_OK
+    elif applied == 0:
+        response_status = status.HTTP_400_BAD_REQUEST
+    else:
+        response_status = status.HTTP_207_MULTI_STATUS
+
+    return Response({
+        'results': results,
+        'applied': applied,
+        'failed': failed,
+        'recipes': recipes,
+    }, status=response_status)
+
+
+def _stream_user_id(request):
+    """
+    The user opening an event stream, from the request or its ``ticket``.
+
+    Returns:
+        tuple: ``(user id, None)``, or ``(None, 401 response)``
+    """
+    if request.user.is_authenticated:
+        return request.user.pk, None
+    ticket = request.GET.get('ticket')
+    if ticket:
+        try:
+            return signing.loads(ticket, salt=EVENTS_TICKET_SALT,
+                                 max_age=getattr(settings, 'LIVE_UPDATES_TICKET_MAX_AGE', 60))['user'], None
+        except signing.BadSignature:
+            return None, json_response({'error': 'Invalid or expired ticket'}, status.HTTP_401_UNAUTHORIZED)
+    return None, json_response({'detail': 'Authentication credentials were not provided.'},
+                               status.HTTP_401_UNAUTHORIZED)
+
+
+@async_api_view(['GET'], permission_classes=[AllowAny])
+async def recipe_events(request, recipe_id):
+    """
+    Server-Sent Events stream of a recipe's counts and comments.
+
+    Comments are only readable when signed in, so the stream needs the
+    credentials or a ticket like the inbox does.
+    """
+    _, error = _stream_user_id(request)
+    if error:
+        return error
+    if not await Recipe.objects.filter(pk=recipe_id).aexists():
+        return json_response({'error': 'Recipe not found'}, status.HTTP_404_NOT_FOUND)
+    return live.event_stream(request, [recipe_channel(recipe_id)])
+
+
+@api_view(['POST'])
+@authentication_classes([TokenUserAuthentication])
+@permission_classes([IsAuthenticated])
+def events_ticket(request):
+    """
+    Issue a short-lived ticket for the event streams.
+
+    Browsers cannot send an Authorization header with ``EventSource``, so
+    the stream URLs carry this ticket instead of the access token.
+    """
+    max_age = getattr(settings, 'LIVE_UPDATES_TICKET_MAX_AGE', 60)
+    return Response({
+        'ticket': signing.dumps({'user': request.user.pk}, salt=EVENTS_TICKET_SALT),
+        'expires_in': max_age,
+    })
+
+
+@async_api_view(['GET'], permission_classes=[AllowAny])
+async def inbox_events(request):
+    """Server-Sent Events stream of activity on the current user's recipes"""
+    user_id, error = _stream_user_id(request)
+    if error:
+        return error
+    return live.event_stream(request, [user_channel(user_id)])
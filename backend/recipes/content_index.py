@@ -0,0 +1,412 @@
+"""
+Content-based "similar recipes" from TF-IDF over the recipe text.
+
+Collaborative neighbours (recipes/recommendations.py) need likes and
+ratings, so a new recipe has none. Content neighbours only need its title,
+categories, ingredients and instructions: each recipe becomes a TF-IDF
+vector of its words (``1 + ln(count)`` times the word's inverse document
+frequency, with title, category and ingredient words counted more than
+instruction words), truncated to its ``CONTENT_INDEX_MAX_TERMS`` strongest
+words and normalized, so the dot product of two vectors is their cosine.
+
+``build_index()`` (the ``build_content_index`` command) writes every vector
+to one binary file in ``CONTENT_INDEX_PATH``: float32 weights and uint32
+ids, both as a forward index (recipe -> words) and as an inverted index
+(word -> the ``CONTENT_INDEX_MAX_POSTINGS`` recipes that weigh it most).
+Workers map the file read-only with ``mmap`` and read it through typed
+memoryviews, so the page cache holds it once for all processes. Neighbours
+of a recipe are found by walking the postings of its words, a sparse
+vector x matrix product that never touches recipes sharing no word with it.
+
+Created and updated recipes are appended to a delta log next to the file
+(``index_recipe()``, on commit). Each worker reads the new part of the log
+before a lookup and weighs the delta recipes with the file's IDF, so they
+are searchable at once; the next build folds them in and trims the log.
+Appends hold a shared ``flock`` on the log and the trim an exclusive one, so
+no record lands in a log the trim has already read. The file uses native
+byte order: build it on the machine, or architecture, that reads it.
+"""
+
+import bisect
+import fcntl
+import heapq
+import json
+import logging
+import math
+import mmap
+import os
+import re
+import struct
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+from operator import itemgetter
+
+from django.conf import settings
+from .models import Recipe
+from .search import STOP_WORDS
+
+
+logger = logging.getLogger('recipes.content_index')
+
+BASE_FILE = 'content.idx'
+DELTA_FILE = 'content.delta'
+
+MAGIC = b'TSCI'
+VERSION = 1
+# magic, version, recipes, words, forward entries, postings, built at (epoch seconds)
+HEADER = struct.Struct('=4sIIIIId')
+
+# How much a word counts in each field
+FIELD_WEIGHTS = {'title': 3, 'category': 2, 'ingredients': 2, 'instructions': 1}
+
+KITCHEN_WORDS = frozenset('''
+cup cups tbsp tsp tablespoon tablespoons teaspoon teaspoons gram grams kg ml oz lb lbs
+pound pounds pinch minute minutes hour hours add until then
+'''.split())
+
+_WORD = re.compile(r'[^\W\d_]{3,}')
+
+
+def _text(value):
+    if isinstance(value, (list, tuple)):
+        return ' '.join(str(item) for item in value)
+    return str(value or '')
+
+
+def term_counts(title, category, ingredients, instructions):
+    """Field-weighted word counts of a recipe"""
+    counts = Counter()
+    fields = {'title': title, 'category': (category or '').replace(',', ' '),
+              'ingredients': ingredients, 'instructions': instructions}
+    for field, value in fields.items():
+        for word in _WORD.findall(_text(value).lower()):
+            if word not in STOP_WORDS and word not in KITCHEN_WORDS:
+                counts[word] += FIELD_WEIGHTS[field]
+    return counts
+
+
+def idf(document_frequency, documents):
+    return math.log((documents + 1) / (document_frequency + 1)) + 1
+
+
+def tfidf(counts, idf_of, max_terms):
+    """Normalized TF-IDF vector (word -> weight) of the strongest ``max_terms`` words"""
+    weights = {word: (1 + math.log(count)) * idf_of(word) for word, count in counts.items()}
+    top = heapq.nlargest(max_terms, weights.items(), key=itemgetter(1, 0))
+    norm = math.sqrt(sum(weight * weight for _, weight in top))
+    return {word: weight / norm for word, weight in top} if norm else {}
+
+
+def _directory():
+    return settings.CONTENT_INDEX_PATH
+
+
+def _max_terms():
+    return getattr(settings, 'CONTENT_INDEX_MAX_TERMS', 64)
+
+
+class _Base:
+    """The sections of a built index file, as memoryviews into its mapping"""
+
+    def __init__(self, path=None):
+        self.built_at = 0.0
+        self.doc_ids = self.doc_offsets = self.doc_terms = self.post_offsets = self.post_docs = array('I')
+        self.doc_weights = self.idf = self.post_weights = array('f')
+        self.terms = []
+        if path is None:
+            return
+
+        with open(path, 'rb') as f:
+            # The mapping stays valid after the file is closed or replaced
+            view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        magic, version, docs, terms, entries, postings, self.built_at = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} content index')
+
+        offset = HEADER.size
+
+        def section(code, length):
+            nonlocal offset
+            start, offset = offset, offset + 4 * length
+            return view[start:offset].cast(code)
+
+        self.doc_ids = section('I', docs)
+        self.doc_offsets = section('I', docs + 1)
+        self.doc_terms = section('I', entries)
+        self.doc_weights = section('f', entries)
+        self.idf = section('f', terms)
+        self.post_offsets = section('I', terms + 1)
+        self.post_docs = section('I', postings)
+        self.post_weights = section('f', postings)
+        self.terms = bytes(view[offset:]).decode().split('\n') if terms else []
+
+    @property
+    def term_index(self):
+        if not hasattr(self, '_term_index'):
+            self._term_index = {word: index for index, word in enumerate(self.terms)}
+        return self._term_index
+
+    def idf_of(self, word):
+        index = self.term_index.get(word)
+        return self.idf[index] if index is not None else idf(0, len(self.doc_ids))
+
+    def vector(self, recipe_id):
+        doc = bisect.bisect_left(self.doc_ids, recipe_id)
+        if doc == len(self.doc_ids) or self.doc_ids[doc] != recipe_id:
+            return None
+        start, end = self.doc_offsets[doc], self.doc_offsets[doc + 1]
+        return {self.terms[term]: weight for term, weight in zip(self.doc_terms[start:end], self.doc_weights[start:end])}
+
+
+class ContentIndex:
+    """One worker's view of the index file and delta log in ``directory``"""
+
+    def __init__(self, directory):
+        self.base_path = os.path.join(directory, BASE_FILE)
+        self.delta_path = os.path.join(directory, DELTA_FILE)
+        self.base = _Base()
+        self.delta = {}  # recipe id -> vector, for recipes saved since the build
+        self._base_signature = None
+        self._delta_position = (None, 0)  # inode, bytes read
+
+    def refresh(self):
+        """Remap a rebuilt file and read new delta records; cheap when nothing changed"""
+        try:
+            stat = os.stat(self.base_path)
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            signature = None
+        if signature != self._base_signature:
+            self.base = _Base(self.base_path if signature else None)
+            self._base_signature = signature
+            # Delta vectors are weighed with the file's IDF
+            self.delta, self._delta_position = {}, (None, 0)
+        self._read_delta()
+
+    def _read_delta(self):
+        try:
+            stat = os.stat(self.delta_path)
+        except FileNotFoundError:
+            self.delta, self._delta_position = {}, (None, 0)
+            return
+        inode, position = self._delta_position
+        delta = self.delta
+        if stat.st_ino != inode or stat.st_size < position:
+            # Trimmed by a build
+            delta, position = {}, 0
+        if stat.st_size == position:
+            self.delta, self._delta_position = delta, (stat.st_ino, position)
+            return
+
+        with open(self.delta_path, 'rb') as f:
+            f.seek(position)
+            data = f.read(stat.st_size - position)
+        # A record still being appended is read next time
+        end = data.rfind(b'\n') + 1
+        delta = dict(delta)
+        max_terms = _max_terms()
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record['at'] >= self.base.built_at:
+                delta[record['id']] = tfidf(record['terms'], self.base.idf_of, max_terms)
+        self.delta, self._delta_position = delta, (stat.st_ino, position + end)
+
+    def vector(self, recipe_id):
+        if recipe_id in self.delta:
+            return self.delta[recipe_id]
+        return self.base.vector(recipe_id)
+
+    def nearest(self, recipe_id, k):
+        """
+        The ``k`` recipes whose text is most similar to ``recipe_id``'s.
+
+        Returns:
+            list: ``(recipe id, cosine)`` pairs, best first; empty when the
+            recipe is not indexed
+        """
+        base, delta = self.base, self.delta
+        query = delta[recipe_id] if recipe_id in delta else base.vector(recipe_id)
+        if not query:
+            return []
+
+        scores = defaultdict(float)
+        term_index = base.term_index
+        for word, weight in query.items():
+            term = term_index.get(word)
+            if term is None:
+                continue
+            start, end = base.post_offsets[term], base.post_offsets[term + 1]
+            for doc, doc_weight in zip(base.post_docs[start:end], base.post_weights[start:end]):
+                scores[doc] += weight * doc_weight
+
+        results = {}
+        for doc, score in scores.items():
+            other_id = base.doc_ids[doc]
+            # The file's vector of a recipe saved since the build is stale
+            if other_id != recipe_id and other_id not in delta:
+                results[other_id] = score
+        for other_id, vector in delta.items():
+            if other_id != recipe_id:
+                score = sum(weight * vector.get(word, 0.0) for word, weight in query.items())
+                if score > 0:
+                    results[other_id] = score
+        return heapq.nlargest(k, results.items(), key=lambda item: (item[1], -item[0]))
+
+
+_indexes = {}
+_lock = threading.Lock()
+
+
+def get_index():
+    """This process' ``ContentIndex``, refreshed from disk"""
+    directory = _directory()
+    with _lock:
+        index = _indexes.get(directory)
+        if index is None:
+            index = _indexes[directory] = ContentIndex(directory)
+        try:
+            index.refresh()
+        except (OSError, ValueError):
+            logger.exception('Could not read the content index in %s', directory)
+    return index
+
+
+def nearest(recipe_id, k):
+    return get_index().nearest(recipe_id, k)
+
+
+def index_recipe(recipe):
+    """
+    Append a created or updated recipe to the delta log.
+
+    Call it once the recipe has committed (``transaction.on_commit``). A
+    failure is logged, never raised: the next build picks the recipe up.
+    """
+    counts = term_counts(recipe.title, recipe.category, recipe.ingredients, recipe.instructions)
+    line = json.dumps({'id': recipe.id, 'at': time.time(), 'terms': counts}, separators=(',', ':')) + '\n'
+    directory = _directory()
+    try:
+        os.makedirs(directory, exist_ok=True)
+        # One O_APPEND write per record, so concurrent workers do not interleave
+        fd = _lock_delta(os.path.join(directory, DELTA_FILE), fcntl.LOCK_SH)
+        try:
+            os.write(fd, line.encode())
+        finally:
+            os.close(fd)
+    except OSError:
+        logger.exception('Could not add recipe %s to the content index', recipe.id)
+
+
+def build_index():
+    """
+    Write the index file for every recipe and trim the delta log.
+
+    Returns:
+        int: Number of recipes indexed
+    """
+    directory = _directory()
+    max_terms = _max_terms()
+    max_postings = getattr(settings, 'CONTENT_INDEX_MAX_POSTINGS', 2000)
+    # Delta records written from now on may not be in the file
+    built_at = time.time()
+
+    recipe_ids, doc_counts, document_frequency = array('I'), [], Counter()
+    rows = Recipe.objects.order_by('id').values_list('id', 'title', 'category', 'ingredients', 'instructions')
+    for recipe_id, *fields in rows.iterator(chunk_size=1000):
+        counts = term_counts(*fields)
+        recipe_ids.append(recipe_id)
+        doc_counts.append(counts)
+        document_frequency.update(counts.keys())
+
+    documents = len(recipe_ids)
+    terms = sorted(document_frequency)
+    term_index = {word: index for index, word in enumerate(terms)}
+    idf_values = array('f', (idf(document_frequency[word], documents) for word in terms))
+
+    doc_offsets, doc_terms, doc_weights = array('I', [0]), array('I'), array('f')
+    postings = defaultdict(list)  # term -> [(weight, doc)]
+    for doc, counts in enumerate(doc_counts):
+        vector = tfidf(counts, lambda word: idf_values[term_index[word]], max_terms)
+        for term, weight in sorted((term_index[word], weight) for word, weight in vector.items()):
+            doc_terms.append(term)
+            doc_weights.append(weight)
+            postings[term].append((weight, doc))
+        doc_offsets.append(len(doc_terms))
+        doc_counts[doc] = None
+
+    post_offsets, post_docs, post_weights = array('I', [0]), array('I'), array('f')
+    for term in range(len(terms)):
+        # Keep the recipes the word matters most to; the rest add little to any score
+        kept = heapq.nlargest(max_postings, postings.pop(term, ()))
+        for weight, doc in sorted(kept, key=itemgetter(1)):
+            post_docs.append(doc)
+            post_weights.append(weight)
+        post_offsets.append(len(post_docs))
+
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, BASE_FILE)
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, documents, len(terms), len(doc_terms), len(post_docs), built_at))
+        for section in (recipe_ids, doc_offsets, doc_terms, doc_weights, idf_values,
+                        post_offsets, post_docs, post_weights):
+            section.tofile(f)
+        f.write('\n'.join(terms).encode())
+    # Workers that mapped the old file keep reading it until they remap
+    os.replace(temporary, path)
+    _trim_delta(os.path.join(directory, DELTA_FILE), built_at)
+    return documents
+
+
+def _lock_delta(path, operation):
+    """
+    Open the delta log for appending and ``flock`` it.
+
+    A log replaced by a trim while waiting for the lock is reopened, so the
+    returned descriptor is always the current log's.
+
+    Returns:
+        int: The file descriptor; closing it releases the lock
+    """
+    while True:
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, operation)
+            replaced = os.fstat(fd).st_ino != os.stat(path).st_ino
+        except FileNotFoundError:
+            replaced = True
+        except OSError:
+            os.close(fd)
+            raise
+        if not replaced:
+            return fd
+        os.close(fd)
+
+
+def _trim_delta(path, built_at):
+    """Drop delta records that the new file already covers"""
+    if not os.path.exists(path):
+        return
+    # Appends wait until the trimmed log has replaced the one read here
+    fd = _lock_delta(path, fcntl.LOCK_EX)
+    try:
+        with open(path, 'rb') as f:
+            lines = f.read().splitlines(keepends=True)
+        kept = []
+        for line in lines:
+            try:
+                if line.endswith(b'\n') and json.loads(line)['at'] >= built_at:
+                    kept.append(line)
+            except ValueError:
+                pass
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            f.writelines(kept)
+        os.replace(temporary, path)
+    finally:
+        os.close(fd)
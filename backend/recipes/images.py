@@ -0,0 +1,131 @@
+"""
+Derivative generation for recipe gallery images.
+
+Decoding and resizing is CPU bound and holds the full bitmap in memory, so it
+runs in a small per-process ``ProcessPoolExecutor`` instead of the request
+thread. Set ``IMAGE_PROCESS_WORKERS=0`` to generate derivatives inline (used
+by tests and single-process development servers).
+
+Uploads streamed to disk are handed to the workers by path, so the request
+process never reads them into memory; only small in-memory uploads are sent
+as bytes. Every render holds one of the decode slots of ``tastestack.uploads``
+until it finishes, so thumbnails count against ``IMAGE_DECODE_CONCURRENCY``
+like validation does.
+"""
+
+import io
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+from tastestack.uploads import acquire_decode_slot, decode_slot, release_decode_slot
+
+
+THUMBNAIL_SIZE = (400, 400)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def render_thumbnail(source, size=THUMBNAIL_SIZE):
+    """
+    Create a JPEG thumbnail from an image file.
+
+    Runs inside a pool worker, so it only takes and returns plain values.
+
+    Args:
+        source (str or bytes): Path of the original image file, or its contents
+        size (tuple): Bounding box for the thumbnail
+
+    Returns:
+        bytes: JPEG encoded thumbnail
+    """
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as image:
+        # Let the JPEG decoder downscale while decoding when it can
+        image.draft('RGB', size)
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(size)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=85, optimize=True)
+        return output.getvalue()
+
+
+def get_process_pool():
+    """Return the shared process pool, or None when processing inline"""
+    global _pool
+    workers = getattr(settings, 'IMAGE_PROCESS_WORKERS', 2)
+    if workers <= 0:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=workers)
+        return _pool
+
+
+def generate_thumbnails(uploaded_files):
+    """
+    Generate thumbnails for several uploaded images in parallel.
+
+    Raises ``ImageDecodeBusy`` (HTTP 503) when no decode slot frees up in time.
+
+    Args:
+        uploaded_files (list): Validated uploaded image files
+
+    Returns:
+        list: One entry per file, either a ``ContentFile`` or the exception
+        raised while rendering it
+    """
+    sources = []
+    for uploaded_file in uploaded_files:
+        if hasattr(uploaded_file, 'temporary_file_path'):
+            sources.append(uploaded_file.temporary_file_path())
+        else:
+            uploaded_file.seek(0)
+            sources.append(uploaded_file.read())
+            uploaded_file.seek(0)
+
+    pool = get_process_pool()
+    if pool is None:
+        rendered = []
+        for source in sources:
+            with decode_slot():
+                try:
+                    rendered.append(render_thumbnail(source))
+                except Exception as e:
+                    rendered.append(e)
+    else:
+        futures = []
+        try:
+            for source in sources:
+                acquire_decode_slot()
+                try:
+                    future = pool.submit(render_thumbnail, source)
+                except BaseException:
+                    release_decode_slot()
+                    raise
+                future.add_done_callback(lambda _: release_decode_slot())
+                futures.append(future)
+        finally:
+            # Renders already submitted release their slots when they finish
+            wait(futures)
+        rendered = []
+        for future in futures:
+            try:
+                rendered.append(future.result())
+            except Exception as e:
+                rendered.append(e)
+
+    results = []
+    for uploaded_file, thumbnail in zip(uploaded_files, rendered):
+        if isinstance(thumbnail, Exception):
+            results.append(thumbnail)
+        else:
+            name = os.path.splitext(os.path.basename(uploaded_file.name))[0]
+            results.append(ContentFile(thumbnail, name=f"{name}_thumb.jpg"))
+    return results
@@ -0,0 +1,123 @@
+"""
+Django management command to export recipes as NDJSON.
+
+Each line is one recipe with its author, ingredients, instructions,
+categories, ratings, likes and comments. Recipes are streamed from the
+database in chunks, so memory use does not grow with the size of the dataset.
+
+Usage:
+    python manage.py export_recipes recipes.ndjson
+    python manage.py export_recipes - --chunk-size 500 > recipes.ndjson
+"""
+
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from recipes.models import Recipe
+from interactions.models import Rating, Like, Comment
+
+
+def serialize_recipe(recipe):
+    """Build the NDJSON record for a recipe with prefetched interactions"""
+    return {
+        'id': recipe.id,
+        'title': recipe.title,
+        'description': recipe.description,
+        'ingredients': recipe.ingredients,
+        'instructions': recipe.instructions,
+        'prep_time': recipe.prep_time,
+        'cook_time': recipe.cook_time,
+        'servings': recipe.servings,
+        'difficulty': recipe.difficulty,
+        'category': recipe.category,
+        'image': recipe.image.name if recipe.image else None,
+        'created_at': recipe.created_at,
+        'author': {
+            'id': recipe.author.id,
+            'username': recipe.author.username,
+            'email': recipe.author.email,
+        },
+        'ratings': [
+            {'user': rating.user.email, 'rating': rating.rating, 'created_at': rating.created_at}
+            for rating in recipe.ratings.all()
+        ],
+        'likes': [
+            {'user': like.user.email, 'created_at': like.created_at}
+            for like in recipe.likes.all()
+        ],
+        'comments': [
+            {
+                'user': comment.user.email,
+                'content': comment.content,
+                'hidden': comment.hidden,
+                'created_at': comment.created_at,
+            }
+            for comment in recipe.comments.all()
+        ],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Export recipes with their interactions as NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output',
+            help='Output file path, or - for stdout'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Number of recipes fetched from the database at a time (default: 1000)'
+        )
+        parser.add_argument(
+            '--author',
+            type=int,
+            help='Only export recipes by this author id'
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        recipes = Recipe.objects.select_related('author').prefetch_related(
+            Prefetch('ratings', queryset=Rating.objects.select_related('user').only(
+                'recipe', 'rating', 'created_at', 'user__email')),
+            Prefetch('likes', queryset=Like.objects.select_related('user').only(
+                'recipe', 'created_at', 'user__email')),
+            Prefetch('comments', queryset=Comment.objects.select_related('user').only(
+                'recipe', 'content', 'hidden', 'created_at', 'user__email').order_by('created_at')),
+        ).order_by('pk')
+
+        if options['author']:
+            recipes = recipes.filter(author_id=options['author'])
+
+        output = sys.stdout if options['output'] == '-' else open(options['output'], 'w', encoding='utf-8')
+        # Progress goes to stderr so stdout can be piped
+        log = self.stderr if options['output'] == '-' else self.stdout
+
+        started = time.perf_counter()
+        exported = 0
+        try:
+            for recipe in recipes.iterator(chunk_size=chunk_size):
+                output.write(json.dumps(serialize_recipe(recipe), cls=DjangoJSONEncoder, ensure_ascii=False))
+                output.write('\n')
+                exported += 1
+                if exported % chunk_size == 0:
+                    elapsed = time.perf_counter() - started
+                    log.write(f"  Exported {exported} recipes ({exported / elapsed:.0f} recipes/s)")
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+        elapsed = time.perf_counter() - started
+        rate = exported / elapsed if elapsed else 0
+        log.write(self.style.SUCCESS(
+            f"Exported {exported} recipes in {elapsed:.2f}s ({rate:.0f} recipes/s)"
+        ))
@@ -0,0 +1,226 @@
+"""
+Django management command to import recipes from NDJSON.
+
+Reads the format written by ``export_recipes``: one recipe per line with its
+author, ratings, likes and comments. Lines are streamed and inserted with
+``bulk_create`` in batches, one transaction per batch. Users are matched by
+email through an id map loaded once up front.
+
+Each batch adds its likes, ratings and comments to the trending scores and
+queues its recipes for the next similar recipes refresh, like the views do.
+The content index is rebuilt once at the end rather than growing the delta
+log by one record per imported recipe.
+
+Usage:
+    python manage.py import_recipes recipes.ndjson
+    python manage.py import_recipes recipes.ndjson --batch-size 1000 --create-users
+    cat recipes.ndjson | python manage.py import_recipes -
+"""
+
+import json
+import sys
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from accounts.models import User
+from recipes import trending
+from recipes.content_index import build_index
+from recipes.models import Recipe
+from recipes.recommendations import mark_changed
+from recipes.trending import Interaction
+from interactions.models import Rating, Like, Comment
+
+
+RECIPE_FIELDS = (
+    'title', 'description', 'ingredients', 'instructions',
+    'prep_time', 'cook_time', 'servings', 'difficulty', 'category',
+)
+
+
+def parse_timestamp(value):
+    """Parse an ISO timestamp from the export, defaulting to now"""
+    if value:
+        parsed = parse_datetime(value)
+        if parsed:
+            return parsed
+    return timezone.now()
+
+
+class Command(BaseCommand):
+    help = 'Import recipes with their interactions from NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'input',
+            help='Input file path, or - for stdin'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of recipes inserted per transaction (default: 500)'
+        )
+        parser.add_argument(
+            '--create-users',
+            action='store_true',
+            help='Create missing authors and interacting users (with unusable passwords)'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        self.create_users = options['create_users']
+        # email -> id for every existing user, loaded once
+        self.user_ids = dict(User.objects.values_list('email', 'id'))
+        self.stats = {'recipes': 0, 'ratings': 0, 'likes': 0, 'comments': 0, 'users': 0, 'skipped': 0}
+
+        source = sys.stdin if options['input'] == '-' else open(options['input'], encoding='utf-8')
+        started = time.perf_counter()
+        batch = []
+        try:
+            for line_number, line in enumerate(source, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    batch.append(json.loads(line))
+                except json.JSONDecodeError as e:
+                    raise CommandError(f'Invalid JSON on line {line_number}: {e}')
+
+                if len(batch) >= batch_size:
+                    self.import_batch(batch)
+                    batch = []
+                    self.report_progress(started)
+
+            if batch:
+                self.import_batch(batch)
+        finally:
+            if source is not sys.stdin:
+                source.close()
+        if self.stats['recipes']:
+            build_index()
+
+        elapsed = time.perf_counter() - started
+        rate = self.stats['recipes'] / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.stats['recipes']} recipes in {elapsed:.2f}s ({rate:.0f} recipes/s)"
+        ))
+        self.stdout.write(
+            f"  Ratings: {self.stats['ratings']}, Likes: {self.stats['likes']}, "
+            f"Comments: {self.stats['comments']}, New users: {self.stats['users']}"
+        )
+        if self.stats['skipped']:
+            self.stdout.write(self.style.WARNING(
+                f"  Skipped {self.stats['skipped']} recipes or interactions with unknown users "
+                f"(use --create-users to create them)"
+            ))
+
+    def report_progress(self, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"  Imported {self.stats['recipes']} recipes ({self.stats['recipes'] / elapsed:.0f} recipes/s)")
+
+    def ensure_users(self, records):
+        """Create users referenced by this batch that do not exist yet"""
+        missing = {}
+        for record in records:
+            author = record.get('author') or {}
+            if author.get('email') and author['email'] not in self.user_ids:
+                missing[author['email']] = author.get('username')
+            for key in ('ratings', 'likes', 'comments'):
+                for item in record.get(key, []):
+                    if item.get('user') and item['user'] not in self.user_ids:
+                        missing.setdefault(item['user'], None)
+
+        if not missing:
+            return
+
+        taken = set(User.objects.filter(
+            username__in=[username for username in missing.values() if username]
+        ).values_list('username', flat=True))
+        unusable_password = make_password(None)
+        new_users = []
+        for email, username in missing.items():
+            if not username or username in taken:
+                username = email
+            taken.add(username)
+            new_users.append(User(email=email, username=username, password=unusable_password))
+
+        User.objects.bulk_create(new_users, batch_size=len(new_users))
+        self.user_ids.update(User.objects.filter(email__in=missing).values_list('email', 'id'))
+        self.stats['users'] += len(new_users)
+
+    def import_batch(self, records):
+        with transaction.atomic():
+            if self.create_users:
+                self.ensure_users(records)
+
+            recipes = []
+            kept = []
+            for record in records:
+                author_id = self.user_ids.get((record.get('author') or {}).get('email'))
+                if author_id is None:
+                    self.stats['skipped'] += 1
+                    continue
+                recipe = Recipe(author_id=author_id, created_at=parse_timestamp(record.get('created_at')))
+                for field in RECIPE_FIELDS:
+                    if field in record:
+                        setattr(recipe, field, record[field])
+                if record.get('image'):
+                    recipe.image.name = record['image']
+                recipes.append(recipe)
+                kept.append(record)
+
+            recipes = Recipe.objects.bulk_create(recipes)
+
+            ratings, likes, comments = [], [], []
+            for recipe, record in zip(recipes, kept):
+                for item in record.get('ratings', []):
+                    user_id = self.user_ids.get(item.get('user'))
+                    if user_id is None:
+                        self.stats['skipped'] += 1
+                        continue
+                    ratings.append(Rating(user_id=user_id, recipe_id=recipe.id, rating=item['rating'],
+                                          created_at=parse_timestamp(item.get('created_at'))))
+                for item in record.get('likes', []):
+                    user_id = self.user_ids.get(item.get('user'))
+                    if user_id is None:
+                        self.stats['skipped'] += 1
+                        continue
+                    likes.append(Like(user_id=user_id, recipe_id=recipe.id,
+                                      created_at=parse_timestamp(item.get('created_at'))))
+                for item in record.get('comments', []):
+                    user_id = self.user_ids.get(item.get('user'))
+                    if user_id is None:
+                        self.stats['skipped'] += 1
+                        continue
+                    comments.append(Comment(user_id=user_id, recipe_id=recipe.id, content=item['content'],
+                                            hidden=item.get('hidden', False),
+                                            created_at=parse_timestamp(item.get('created_at'))))
+
+            # Duplicates in the input (same user twice on a recipe) are dropped by the unique constraints,
+            # so what was inserted is read back: the recipes are new, everything on them is from this batch
+            Rating.objects.bulk_create(ratings, ignore_conflicts=True)
+            Like.objects.bulk_create(likes, ignore_conflicts=True)
+            Comment.objects.bulk_create(comments)
+
+            recipe_ids = [recipe.id for recipe in recipes]
+            inserted = {
+                'like': list(Like.objects.filter(recipe_id__in=recipe_ids).values_list('recipe_id', 'created_at')),
+                'rating': list(Rating.objects.filter(recipe_id__in=recipe_ids).values_list('recipe_id', 'created_at')),
+                'comment': list(Comment.objects.filter(recipe_id__in=recipe_ids, hidden=False)
+                                .values_list('recipe_id', 'created_at')),
+            }
+            trending.record([Interaction(recipe_id, kind, at)
+                             for kind, rows in inserted.items() for recipe_id, at in rows])
+            mark_changed({recipe_id for kind in ('like', 'rating') for recipe_id, _ in inserted[kind]})
+
+        self.stats['recipes'] += len(recipes)
+        self.stats['ratings'] += len(inserted['rating'])
+        self.stats['likes'] += len(inserted['like'])
+        self.stats['comments'] += len(comments)
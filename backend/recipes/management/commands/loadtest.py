@@ -0,0 +1,281 @@
+"""
+Django management command to load test the API in-process.
+
+Many client threads call the project's WSGI application directly (no network,
+no server) across the real endpoints, and the command reports throughput and
+p50/p95/p99 latency per endpoint as JSON. Run it against a dataset created by
+``seed_scale`` and save the output to compare commits.
+
+Usage:
+    python manage.py loadtest --threads 16 --duration 30 --output bench.json
+    python manage.py loadtest --endpoints list,detail,search --baseline bench.json
+"""
+
+import io
+import json
+import random
+import subprocess
+import threading
+import time
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connection, connections
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from accounts.models import User
+from recipes.models import Recipe
+from tastestack.stats import percentile
+from .seed_scale import DISHES, INGREDIENTS, zipf_weights
+
+
+class Workload:
+    """Picks endpoints, recipes and users for the client threads"""
+
+    def __init__(self, recipe_ids, users, seed=None):
+        self.recipe_ids = recipe_ids
+        self.recipe_weights = zipf_weights(len(recipe_ids))
+        self.users = users
+        self.search_terms = [word.split()[-1].lower() for word in DISHES] + INGREDIENTS[:10]
+        self.seed = seed
+
+    def rng_for(self, thread_index):
+        return random.Random(None if self.seed is None else self.seed + thread_index)
+
+    def hot_recipe(self, rng):
+        return rng.choices(self.recipe_ids, cum_weights=self.recipe_weights)[0]
+
+    # Each endpoint returns (method, path, body, needs_auth); search and
+    # comments fall back to the default IsAuthenticated permission
+    def list(self, rng, user):
+        return 'GET', f'/api/recipes/?page={rng.randint(1, 5)}', None, False
+
+    def search(self, rng, user):
+        return 'GET', f'/api/recipes/search/?q={rng.choice(self.search_terms)}', None, True
+
+    def detail(self, rng, user):
+        return 'GET', f'/api/recipes/{self.hot_recipe(rng)}/', None, False
+
+    def comments(self, rng, user):
+        return 'GET', f'/api/interactions/recipes/{self.hot_recipe(rng)}/comments/', None, True
+
+    def like(self, rng, user):
+        return 'POST', f'/api/interactions/recipes/{self.hot_recipe(rng)}/like/', {}, True
+
+    def rate(self, rng, user):
+        return 'POST', f'/api/recipes/{self.hot_recipe(rng)}/rate/', {'rating': rng.randint(1, 5)}, True
+
+    def dashboard(self, rng, user):
+        return 'GET', '/api/auth/dashboard-stats/', None, True
+
+    def profile(self, rng, user):
+        return 'GET', f'/api/auth/profile/{rng.choice(self.users)[0]}/', None, False
+
+
+ENDPOINTS = ['list', 'search', 'detail', 'comments', 'like', 'rate', 'dashboard', 'profile']
+
+
+class Command(BaseCommand):
+    help = 'Drive the WSGI application with concurrent clients and report latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent client threads (default: 8)')
+        parser.add_argument('--duration', type=float, default=10, help='Seconds to run (default: 10)')
+        parser.add_argument('--warmup', type=float, default=1, help='Seconds of unrecorded warm-up (default: 1)')
+        parser.add_argument('--endpoints', default=','.join(ENDPOINTS),
+                            help=f'Comma-separated endpoints to exercise (default: {",".join(ENDPOINTS)})')
+        parser.add_argument('--users', type=int, default=50, help='Number of distinct authenticated clients (default: 50)')
+        parser.add_argument('--seed', type=int, help='Random seed for the request mix')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument('--baseline', help='Previous JSON report to compare against')
+        parser.add_argument('--rate-limit', action='store_true',
+                            help='Keep rate limiting on (by default it is off so endpoints are measured, not 429s)')
+
+    def handle(self, *args, **options):
+        endpoints = [name.strip() for name in options['endpoints'].split(',') if name.strip()]
+        unknown = set(endpoints) - set(ENDPOINTS)
+        if unknown:
+            raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+
+        recipe_ids = list(Recipe.objects.order_by('id').values_list('id', flat=True))
+        users = list(User.objects.order_by('id').values_list('id', 'username')[:options['users']])
+        if not recipe_ids or not users:
+            raise CommandError('No data to test against. Run: python manage.py seed_scale')
+
+        # Tokens are minted up front so the run measures requests, not logins
+        user_objects = User.objects.in_bulk([user_id for user_id, _ in users])
+        tokens = [str(AccessToken.for_user(user_objects[user_id])) for user_id, _ in users]
+        connections.close_all()
+
+        settings.RATELIMIT_ENABLED = options['rate_limit'] and getattr(settings, 'RATELIMIT_ENABLED', True)
+        workload = Workload(recipe_ids, users, options['seed'])
+        application = get_wsgi_application()
+
+        samples = {name: [] for name in endpoints}
+        errors = {name: 0 for name in endpoints}
+        failures = {}  # endpoint -> first exception raised by a request
+        lock = threading.Lock()
+        recording = threading.Event()
+        stop = threading.Event()
+
+        def client(thread_index):
+            rng = workload.rng_for(thread_index)
+            local_samples = {name: [] for name in endpoints}
+            local_errors = {name: 0 for name in endpoints}
+            local_failures = {}
+            try:
+                while not stop.is_set():
+                    name = rng.choice(endpoints)
+                    user_index = rng.randrange(len(users))
+                    method, path, body, needs_auth = getattr(workload, name)(rng, users[user_index])
+                    token = tokens[user_index] if needs_auth or rng.random() < 0.5 else None
+
+                    started = time.perf_counter()
+                    try:
+                        status_code = self.call(application, method, path, body, token)
+                    except Exception as e:
+                        # Counted as an error instead of ending the thread
+                        status_code = None
+                        local_failures.setdefault(name, f'{type(e).__name__}: {e}')
+                    elapsed = time.perf_counter() - started
+
+                    if recording.is_set():
+                        local_samples[name].append(elapsed)
+                        if status_code is None or status_code >= 500:
+                            local_errors[name] += 1
+            finally:
+                connections.close_all()
+                with lock:
+                    for name in endpoints:
+                        samples[name].extend(local_samples[name])
+                        errors[name] += local_errors[name]
+                    for name, failure in local_failures.items():
+                        failures.setdefault(name, failure)
+
+        threads = [threading.Thread(target=client, args=(index,), daemon=True)
+                   for index in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+
+        time.sleep(options['warmup'])
+        recording.set()
+        measured_from = time.perf_counter()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+        measured = time.perf_counter() - measured_from
+        for name, failure in failures.items():
+            self.stderr.write(self.style.WARNING(f'{name} raised {failure}'))
+
+        report = self.build_report(samples, errors, measured, options)
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            self.compare(report, options['baseline'])
+
+    def call(self, application, method, path, body, token):
+        """
+        Call the WSGI application once and return the status code.
+
+        Raises:
+            RuntimeError: The application returned without calling start_response
+        """
+        path, _, query = path.partition('?')
+        payload = json.dumps(body).encode() if body is not None else b''
+        environ = {
+            'REQUEST_METHOD': method,
+            'PATH_INFO': path,
+            'QUERY_STRING': query,
+            'HTTP_HOST': 'localhost',
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(payload)),
+            'wsgi.input': io.BytesIO(payload),
+        }
+        if token:
+            environ['HTTP_AUTHORIZATION'] = f'Bearer {token}'
+        setup_testing_defaults(environ)
+
+        status_holder = []
+
+        def start_response(status, headers, exc_info=None):
+            status_holder.append(int(status.split(' ', 1)[0]))
+
+        result = application(environ, start_response)
+        try:
+            for _ in result:
+                pass
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        if not status_holder:
+            raise RuntimeError('The application returned without calling start_response')
+        return status_holder[0]
+
+    def build_report(self, samples, errors, measured, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                                    text=True, timeout=5).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+
+        endpoints = {}
+        total_requests = 0
+        total_errors = 0
+        for name, values in samples.items():
+            values.sort()
+            total_requests += len(values)
+            total_errors += errors[name]
+            endpoints[name] = {
+                'requests': len(values),
+                'errors': errors[name],
+                'throughput_rps': round(len(values) / measured, 1),
+                'mean_ms': round(sum(values) / len(values) * 1000, 2) if values else 0,
+                'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+                'max_ms': round(values[-1] * 1000, 2) if values else 0,
+            }
+
+        return {
+            'meta': {
+                'commit': commit,
+                'timestamp': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'threads': options['threads'],
+                'duration_s': round(measured, 2),
+                'recipes': Recipe.objects.count(),
+                'users': User.objects.count(),
+            },
+            'total': {
+                'requests': total_requests,
+                'errors': total_errors,
+                'throughput_rps': round(total_requests / measured, 1),
+            },
+            'endpoints': endpoints,
+        }
+
+    def compare(self, report, baseline_path):
+        with open(baseline_path, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+        self.stderr.write(f"\nComparison with {baseline_path} (commit {baseline['meta'].get('commit')}):")
+        self.stderr.write(f"  {'endpoint':<12}{'p50 ms':>18}{'p95 ms':>18}{'rps':>18}")
+        for name, current in report['endpoints'].items():
+            previous = baseline['endpoints'].get(name)
+            if not previous:
+                continue
+            columns = []
+            for key in ('p50_ms', 'p95_ms', 'throughput_rps'):
+                before, after = previous[key], current[key]
+                change = f"{(after - before) / before * 100:+.0f}%" if before else 'n/a'
+                columns.append(f"{after:>9} ({change:>6})")
+            self.stderr.write(f"  {name:<12}" + ''.join(columns))
@@ -0,0 +1,38 @@
+"""
+Django management command to refresh the "similar recipes" neighbour lists.
+
+By default only recipes whose likes or ratings changed since the last run
+are recomputed; ``--full`` rebuilds every list from all likes and ratings.
+Run the incremental refresh from cron every few minutes and the full one
+nightly, or keep it running with ``--every``.
+
+Usage:
+    python manage.py refresh_similar_recipes
+    python manage.py refresh_similar_recipes --full
+    python manage.py refresh_similar_recipes --every 300
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from recipes.recommendations import refresh_similar_recipes
+
+
+class Command(BaseCommand):
+    help = 'Recompute the similar recipes of recipes whose likes or ratings changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Rebuild the neighbours of every recipe')
+        parser.add_argument('--every', type=float, help='Repeat every N seconds until interrupted')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            count = refresh_similar_recipes(full=options['full'])
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(f'Refreshed {count} neighbour lists in {elapsed:.2f}s'))
+            if not options['every']:
+                break
+            connection.close()
+            time.sleep(options['every'])
@@ -0,0 +1,40 @@
+"""
+Django management command to renormalize the trending scores.
+
+Moves the epoch the stored scores are relative to up to now and scales the
+scores to match, so that they stay far from float overflow; the ranking
+does not change. ``--rebuild`` recomputes the scores from the likes,
+ratings and comments instead: run it once after migrating, and whenever
+interactions were changed outside the API (admin, imports).
+
+Usage:
+    python manage.py renormalize_trending
+    python manage.py renormalize_trending --rebuild
+    python manage.py renormalize_trending --every 86400
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from recipes import trending
+
+
+class Command(BaseCommand):
+    help = 'Move the trending score epoch to now, or rebuild the scores from interactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recompute every score from interactions')
+        parser.add_argument('--every', type=float, help='Repeat every N seconds until interrupted')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            count = trending.rebuild() if options['rebuild'] else trending.renormalize()
+            elapsed = time.perf_counter() - started
+            action = 'Rebuilt' if options['rebuild'] else 'Renormalized'
+            self.stdout.write(self.style.SUCCESS(f'{action} the scores of {count} recipes in {elapsed:.2f}s'))
+            if not options['every']:
+                break
+            connection.close()
+            time.sleep(options['every'])
@@ -0,0 +1,63 @@
+"""
+Django management command to run the periodic maintenance jobs.
+
+Runs every command of ``SCHEDULED_JOBS`` once at start-up and then every
+``every`` seconds: the incremental and full refresh of the similar recipes,
+the content index rebuild, the trending renormalization and the cleanup of
+expired refresh tokens. The deploy start commands run it in the background
+next to the web server. The content index lives on local disk, so every
+container needs its own scheduler anyway.
+
+A failing job is reported on stderr and retried at its next turn.
+
+Usage:
+    python manage.py run_scheduled_jobs
+    python manage.py run_scheduled_jobs --once
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+
+DEFAULT_JOBS = [
+    {'command': 'build_content_index', 'every': 86400},
+    {'command': 'refresh_similar_recipes', 'every': 300},
+    {'command': 'refresh_similar_recipes', 'args': ['--full'], 'every': 86400},
+    {'command': 'renormalize_trending', 'every': 86400},
+    {'command': 'flushexpiredtokens', 'every': 86400},
+]
+
+
+class Command(BaseCommand):
+    help = 'Run the similar recipes, content index, trending and token cleanup jobs on their schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Run every job once and exit')
+
+    def handle(self, *args, **options):
+        jobs = getattr(settings, 'SCHEDULED_JOBS', DEFAULT_JOBS)
+        next_runs = [time.monotonic()] * len(jobs)
+        while True:
+            for index, job in enumerate(jobs):
+                if time.monotonic() < next_runs[index]:
+                    continue
+                self.run_job(job)
+                next_runs[index] = time.monotonic() + job['every']
+            if options['once']:
+                break
+            connection.close()
+            time.sleep(max(0.0, min(next_runs) - time.monotonic()))
+
+    def run_job(self, job):
+        name = ' '.join([job['command'], *job.get('args', [])])
+        started = time.perf_counter()
+        try:
+            call_command(job['command'], *job.get('args', []), stdout=self.stdout, stderr=self.stderr)
+        except Exception as e:
+            self.stderr.write(self.style.ERROR(f'{name} failed: {e}'))
+            return
+        self.stdout.write(f'{name} finished in {time.perf_counter() - started:.2f}s')
@@ -0,0 +1,285 @@
+"""
+Django management command to generate a large synthetic dataset.
+
+Popularity follows a Zipf distribution: a few authors write most recipes and
+a few recipes collect most likes, ratings and comments, like real traffic.
+Everything is inserted with ``bulk_create`` in batches, then the trending
+scores, similar recipes and content index are rebuilt from the new rows.
+
+Usage:
+    python manage.py seed_scale --users 1000 --recipes 10000 --likes 100000
+    python manage.py seed_scale --users 200 --recipes 2000 --likes 20000 --ratings 10000 --comments 5000 --follows 3000 --seed 42
+"""
+
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from accounts.models import User
+from recipes import trending
+from recipes.content_index import build_index
+from recipes.models import Recipe
+from recipes.recommendations import refresh_similar_recipes
+from interactions.models import Rating, Like, Comment, Follow
+
+
+SEED_PASSWORD = 'seedpassword123'
+
+ADJECTIVES = [
+    'Spicy', 'Creamy', 'Crispy', 'Smoky', 'Zesty', 'Hearty', 'Rustic', 'Golden',
+    'Tangy', 'Garlicky', 'Herbed', 'Sweet', 'Roasted', 'Grilled', 'Classic', 'Easy',
+]
+DISHES = [
+    'Chicken Curry', 'Beef Stew', 'Pasta Primavera', 'Mushroom Risotto', 'Lentil Soup',
+    'Fish Tacos', 'Vegetable Stir Fry', 'Pancakes', 'Chocolate Cake', 'Caesar Salad',
+    'Biryani', 'Pad Thai', 'Shakshuka', 'Ramen', 'Lasagna', 'Burrito Bowl', 'Hummus',
+    'Banana Bread', 'Paneer Tikka', 'Greek Salad', 'Cheesecake', 'Lassi', 'Falafel',
+]
+INGREDIENTS = [
+    'onion', 'garlic', 'ginger', 'tomato', 'olive oil', 'butter', 'salt', 'black pepper',
+    'cumin', 'turmeric', 'chili flakes', 'chicken breast', 'beef', 'rice', 'pasta',
+    'lentils', 'chickpeas', 'spinach', 'bell pepper', 'mushrooms', 'cream', 'milk',
+    'eggs', 'flour', 'sugar', 'lemon', 'coriander', 'basil', 'parmesan', 'yogurt',
+]
+STEPS = [
+    'Chop the {0} and {1}.',
+    'Heat oil in a pan and add the {0}.',
+    'Stir in the {1} and cook for {n} minutes.',
+    'Season with {0} to taste.',
+    'Simmer gently for {n} minutes until thickened.',
+    'Bake at 180C for {n} minutes.',
+    'Garnish with {1} and serve warm.',
+]
+COMMENTS = [
+    'Loved this recipe!', 'Made it twice already, family favourite.', 'A bit too salty for me.',
+    'Great with extra {0}.', 'Turned out perfect, thanks for sharing!', 'Easy and delicious.',
+    'I swapped {0} for {1} and it still worked.', 'Could use more spice.',
+]
+
+
+def zipf_weights(n, exponent=1.1):
+    """Return cumulative Zipf weights for ``n`` ranked items"""
+    return list(itertools.accumulate(1.0 / (rank ** exponent) for rank in range(1, n + 1)))
+
+
+def batched(iterable, size):
+    """Yield lists of at most ``size`` items"""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Generate a large synthetic dataset with Zipf-distributed activity'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100, help='Number of users to create (default: 100)')
+        parser.add_argument('--recipes', type=int, default=1000, help='Number of recipes to create (default: 1000)')
+        parser.add_argument('--likes', type=int, default=10000, help='Number of likes to create (default: 10000)')
+        parser.add_argument('--ratings', type=int, help='Number of ratings to create (default: half of --likes)')
+        parser.add_argument('--comments', type=int, help='Number of comments to create (default: a fifth of --likes)')
+        parser.add_argument('--follows', type=int, help='Number of follows to create (default: 5 per user)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk insert (default: 2000)')
+        parser.add_argument('--seed', type=int, help='Random seed for reproducible datasets')
+        parser.add_argument('--days', type=int, default=365, help='Spread timestamps over this many days (default: 365)')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('--users must be at least 2')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.days = options['days']
+
+        ratings = options['ratings'] if options['ratings'] is not None else options['likes'] // 2
+        comments = options['comments'] if options['comments'] is not None else options['likes'] // 5
+        follows = options['follows'] if options['follows'] is not None else options['users'] * 5
+
+        started = time.perf_counter()
+        user_ids = self.create_users(options['users'])
+        recipe_ids = self.create_recipes(user_ids, options['recipes'])
+        if recipe_ids:
+            self.create_pairs(Like, 'likes', user_ids, recipe_ids, options['likes'])
+            self.create_pairs(Rating, 'ratings', user_ids, recipe_ids, ratings,
+                              extra=lambda: {'rating': self.rng.choices([1, 2, 3, 4, 5], [1, 1, 3, 6, 8])[0]})
+            self.create_comments(user_ids, recipe_ids, comments)
+        self.create_follows(user_ids, follows)
+        if recipe_ids:
+            self.rebuild_derived()
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(f"Seeding completed in {elapsed:.1f}s ✓"))
+        self.stdout.write(f"  Seeded users can log in with password: {SEED_PASSWORD}")
+
+    def rebuild_derived(self):
+        """Rebuild what the views keep up to date, which bulk inserts skip"""
+        started = time.perf_counter()
+        self.report('Trending scores', trending.rebuild(), started)
+        started = time.perf_counter()
+        self.report('Similar recipe lists', refresh_similar_recipes(full=True), started)
+        started = time.perf_counter()
+        self.report('Content index', build_index(), started)
+
+    def random_timestamp(self):
+        return self.now - timezone.timedelta(seconds=self.rng.randint(0, self.days * 86400))
+
+    def report(self, label, count, started):
+        elapsed = time.perf_counter() - started
+        rate = count / elapsed if elapsed else 0
+        self.stdout.write(f"  {label}: {count} ({rate:.0f} rows/s)")
+
+    def create_users(self, count):
+        started = time.perf_counter()
+        # Hash once; PBKDF2 per user would dominate the run time
+        password = make_password(SEED_PASSWORD)
+        offset = self.next_seed_number()
+        first_names = ['Ayesha', 'Rahim', 'Maria', 'John', 'Priya', 'Kenji', 'Fatima', 'Luca', 'Sara', 'Omar']
+        last_names = ['Khan', 'Smith', 'Rossi', 'Tanaka', 'Das', 'Garcia', 'Ahmed', 'Chen', 'Silva', 'Haque']
+
+        users = (
+            User(
+                username=f"seed_user_{offset + i}",
+                email=f"seed_user_{offset + i}@example.com",
+                password=password,
+                first_name=self.rng.choice(first_names),
+                last_name=self.rng.choice(last_names),
+                date_joined=self.random_timestamp(),
+            )
+            for i in range(count)
+        )
+        for batch in batched(users, self.batch_size):
+            with transaction.atomic():
+                User.objects.bulk_create(batch)
+
+        user_ids = list(User.objects.filter(
+            username__startswith='seed_user_'
+        ).order_by('-id').values_list('id', flat=True)[:count])
+        self.report('Users', len(user_ids), started)
+        return user_ids
+
+    def next_seed_number(self):
+        """One past the highest ``seed_user_<n>`` taken, as a username or email"""
+        taken = User.objects.filter(
+            Q(username__startswith='seed_user_') | Q(email__startswith='seed_user_')
+        ).values_list('username', 'email')
+        numbers = [
+            int(number)
+            for username, email in taken.iterator()
+            for number in (username.removeprefix('seed_user_'), email.split('@')[0].removeprefix('seed_user_'))
+            if number.isdigit()
+        ]
+        return max(numbers, default=-1) + 1
+
+    def build_recipe(self, author_id):
+        rng = self.rng
+        ingredients = rng.sample(INGREDIENTS, rng.randint(4, 10))
+        steps = []
+        for _ in range(rng.randint(3, 7)):
+            a, b = rng.sample(ingredients, 2)
+            steps.append(rng.choice(STEPS).format(a, b, n=rng.randint(2, 40)))
+        categories = rng.sample([key for key, _ in Recipe.CATEGORY_CHOICES], rng.randint(1, 3))
+        return Recipe(
+            title=f"{rng.choice(ADJECTIVES)} {rng.choice(DISHES)}",
+            description=f"A {rng.choice(ADJECTIVES).lower()} take on a favourite, made with {ingredients[0]} and {ingredients[1]}.",
+            ingredients=[f"{rng.randint(1, 4)} {unit} {name}" for name, unit in
+                         zip(ingredients, itertools.cycle(['cups', 'tbsp', 'tsp', 'g']))],
+            instructions=steps,
+            prep_time=rng.choice([5, 10, 15, 20, 30, 45]),
+            cook_time=rng.choice([0, 10, 20, 30, 45, 60, 90]),
+            servings=rng.randint(1, 8),
+            difficulty=rng.choice(['Easy', 'Easy', 'Medium', 'Medium', 'Hard']),
+            category=','.join(categories),
+            author_id=author_id,
+            created_at=self.random_timestamp(),
+        )
+
+    def create_recipes(self, user_ids, count):
+        started = time.perf_counter()
+        author_weights = zipf_weights(len(user_ids))
+        authors = self.rng.choices(user_ids, cum_weights=author_weights, k=count)
+
+        recipe_ids = []
+        for batch in batched((self.build_recipe(author_id) for author_id in authors), self.batch_size):
+            with transaction.atomic():
+                created = Recipe.objects.bulk_create(batch)
+            recipe_ids.extend(recipe.id for recipe in created)
+
+        self.report('Recipes', len(recipe_ids), started)
+        # Shuffle so popularity is unrelated to creation order
+        self.rng.shuffle(recipe_ids)
+        return recipe_ids
+
+    def zipf_pairs(self, user_ids, recipe_ids, count):
+        """Yield up to ``count`` distinct (user, recipe) pairs with Zipf-popular recipes"""
+        recipe_weights = zipf_weights(len(recipe_ids))
+        user_weights = zipf_weights(len(user_ids), exponent=0.8)
+        seen = set()
+        limit = min(count, len(user_ids) * len(recipe_ids))
+        attempts = 0
+        while len(seen) < limit and attempts < limit * 10:
+            attempts += 1
+            pair = (
+                self.rng.choices(user_ids, cum_weights=user_weights)[0],
+                self.rng.choices(recipe_ids, cum_weights=recipe_weights)[0],
+            )
+            if pair not in seen:
+                seen.add(pair)
+                yield pair
+
+    def create_pairs(self, model, label, user_ids, recipe_ids, count, extra=None):
+        started = time.perf_counter()
+        rows = (
+            model(user_id=user_id, recipe_id=recipe_id, created_at=self.random_timestamp(),
+                  **(extra() if extra else {}))
+            for user_id, recipe_id in self.zipf_pairs(user_ids, recipe_ids, count)
+        )
+        created = 0
+        for batch in batched(rows, self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+        self.report(label.capitalize(), created, started)
+
+    def create_comments(self, user_ids, recipe_ids, count):
+        started = time.perf_counter()
+        recipe_weights = zipf_weights(len(recipe_ids))
+        rows = (
+            Comment(
+                user_id=self.rng.choice(user_ids),
+                recipe_id=recipe_id,
+                content=self.rng.choice(COMMENTS).format(*self.rng.sample(INGREDIENTS, 2)),
+                hidden=self.rng.random() < 0.02,
+                created_at=self.random_timestamp(),
+            )
+            for recipe_id in self.rng.choices(recipe_ids, cum_weights=recipe_weights, k=count)
+        )
+        created = 0
+        for batch in batched(rows, self.batch_size):
+            with transaction.atomic():
+                Comment.objects.bulk_create(batch)
+            created += len(batch)
+        self.report('Comments', created, started)
+
+    def create_follows(self, user_ids, count):
+        started = time.perf_counter()
+        # Popular users attract followers the same way popular recipes attract likes
+        pairs = (
+            Follow(follower_id=follower, following_id=following, created_at=self.random_timestamp())
+            for follower, following in self.zipf_pairs(user_ids, user_ids, count)
+            if follower != following
+        )
+        created = 0
+        for batch in batched(pairs, self.batch_size):
+            with transaction.atomic():
+                Follow.objects.bulk_create(batch, ignore_conflicts=True)
+            created += len(batch)
+        self.report('Follows', created, started)
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.1 on 2026-10-19 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_alter_recipe_category'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='recipeimage',
+            options={'ordering': ['position', 'uploaded_at']},
+        ),
+        migrations.AddField(
+            model_name='recipeimage',
+            name='position',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='recipeimage',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='recipe_images/thumbnails/'),
+        ),
+        migrations.AddIndex(
+            model_name='recipeimage',
+            index=models.Index(fields=['recipe', 'position'], name='recipes_rec_recipe__32bb55_idx'),
+        ),
+    ]
@@ -1,9 +1,34 @@
 from django.db import models
+from django.db.models import Avg, Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from accounts.models import User
 import json
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_stats(self):
+        """
+        Annotate like counts and average ratings.
+
+        Uses correlated subqueries rather than joins so that likes and
+        ratings do not multiply each other's rows. ``likes_count`` and
+        ``average_rating`` read these annotations instead of querying.
+        """
+        Like = self.model.likes.rel.related_model
+        Rating = self.model.ratings.rel.related_model
+        like_counts = Like.objects.filter(recipe=OuterRef('pk')).order_by().values('recipe').annotate(
+            total=Count('pk')
+        ).values('total')
+        rating_averages = Rating.objects.filter(recipe=OuterRef('pk')).order_by().values('recipe').annotate(
+            average=Avg('rating')
+        ).values('average')
+        return self.annotate(
+            num_likes=Coalesce(Subquery(like_counts), 0),
+            avg_rating=Subquery(rating_averages),
+        )
+
+
 class Recipe(models.Model):
     DIFFICULTY_CHOICES = [
         ('Easy', 'Easy'),
@@ -45,6 +70,17 @@ class Recipe(models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='recipes')
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    # Time-decayed interaction scores, relative to TrendingEpoch; see recipes/trending.py
+    trending_day = models.FloatField(default=0)
+    trending_week = models.FloatField(default=0)
+
+    objects = RecipeQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-trending_day'], name='recipe_trending_day_idx'),
+            models.Index(fields=['-trending_week'], name='recipe_trending_week_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -53,6 +89,9 @@ class Recipe(models.Model):
 
     @property
     def average_rating(self):
+        # Use the with_stats() annotation when present
+        if hasattr(self, 'avg_rating'):
+            return self.avg_rating or 0
         ratings = self.ratings.all()
         if ratings.exists():
             return sum(rating.rating for rating in ratings) / ratings.count()
@@ -60,13 +99,47 @@ class Recipe(models.Model):
 
     @property
     def likes_count(self):
+        if hasattr(self, 'num_likes'):
+            return self.num_likes
         return self.likes.count()
 
 
 class RecipeImage(models.Model):
     recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='recipe_images/')
+    thumbnail = models.ImageField(upload_to='recipe_images/thumbnails/', blank=True, null=True)
+    position = models.PositiveIntegerField(default=0)  # Gallery order, lowest first
     uploaded_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        ordering = ['position', 'uploaded_at']
+        indexes = [
+            models.Index(fields=['recipe', 'position']),
+        ]
+
     def __str__(self):
         return f"Image for {self.recipe.title}"
+
+
+class SimilarRecipe(models.Model):
+    """One of a recipe's top-K neighbours by likes and ratings; see recipes/recommendations.py"""
+    recipe = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='similar_recipes')
+    similar = models.ForeignKey(Recipe, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()  # Cosine similarity, 0-1
+
+    class Meta:
+        unique_together = ('recipe', 'similar')
+        indexes = [
+            models.Index(fields=['recipe', '-score']),
+        ]
+
+
+class SimilarityChange(models.Model):
+    """A recipe whose likes or ratings changed since its neighbours were computed"""
+    recipe = models.OneToOneField(Recipe, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    changed_at = models.DateTimeField(default=timezone.now)
+
+
+class TrendingEpoch(models.Model):
+    """The single row holding the time the stored trending scores are relative to"""
+    epoch = models.DateTimeField(default=timezone.now)
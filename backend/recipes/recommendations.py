@@ -0,0 +1,200 @@
+"""
+"Similar recipes" from likes and ratings (item-item collaborative filtering).
+
+Every user is a sparse vector over recipes: a like counts 1, a rating
+``r`` counts ``r / 5`` and a user who did both counts the larger value. Two
+recipes are similar when the same users liked or rated them, measured by
+the cosine of their columns in that user x recipe matrix::
+
+    score(i, j) = sum_u m[u][i] * m[u][j] / (|m[.][i]| * |m[.][j]|)
+
+The matrix is held as dicts of dicts (a row per user, a column per recipe),
+so the dot products of a recipe with all others cost one pass over the rows
+of the users who touched it; recipes nobody shares never meet. The top
+``SIMILAR_RECIPES_TOP_K`` neighbours of each recipe are stored in
+``SimilarRecipe``, indexed by ``(recipe, -score)``, so the endpoint is one
+index range read.
+
+The like, unlike, rate and batch views call ``mark_changed()`` in their
+transaction. ``refresh_similar_recipes()`` (the ``refresh_similar_recipes``
+command, run from cron) then recomputes only those recipes, loading just the
+rows and columns they reach, and patches their new scores into the lists of
+the recipes they are similar to. A patched list can miss a neighbour that
+was pushed out of its top-K earlier; ``full=True`` rebuilds every list from
+scratch and is meant to run e.g. nightly.
+"""
+
+import heapq
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from interactions.models import Like, Rating
+from .models import SimilarityChange, SimilarRecipe
+
+
+LIKE_WEIGHT = 1.0
+RATING_SCALE = 5.0
+
+
+def _top_k():
+    return getattr(settings, 'SIMILAR_RECIPES_TOP_K', 20)
+
+
+def mark_changed(recipe_ids):
+    """Queue recipes whose likes or ratings changed for the next refresh"""
+    if not recipe_ids:
+        return
+    now = timezone.now()
+    SimilarityChange.objects.bulk_create(
+        [SimilarityChange(recipe_id=recipe_id, changed_at=now) for recipe_id in recipe_ids],
+        update_conflicts=True,
+        unique_fields=['recipe'],
+        update_fields=['changed_at'],
+    )
+
+
+def load_rows(**filters):
+    """User id -> {recipe id: weight} for the likes and ratings matching ``filters``"""
+    rows = defaultdict(dict)
+    for user_id, recipe_id in Like.objects.filter(**filters).values_list('user_id', 'recipe_id').iterator():
+        rows[user_id][recipe_id] = LIKE_WEIGHT
+    ratings = Rating.objects.filter(**filters).values_list('user_id', 'recipe_id', 'rating')
+    for user_id, recipe_id, rating in ratings.iterator():
+        row = rows[user_id]
+        row[recipe_id] = max(row.get(recipe_id, 0.0), rating / RATING_SCALE)
+    return rows
+
+
+def transpose(rows):
+    """Recipe id -> {user id: weight}"""
+    columns = defaultdict(dict)
+    for user_id, row in rows.items():
+        for recipe_id, weight in row.items():
+            columns[recipe_id][user_id] = weight
+    return columns
+
+
+def norms(columns):
+    return {recipe_id: math.sqrt(sum(weight * weight for weight in column.values()))
+            for recipe_id, column in columns.items()}
+
+
+def similarities(recipe_id, column, rows, column_norms):
+    """
+    Cosine similarity of one recipe with every recipe sharing a user with it.
+
+    Args:
+        recipe_id: The recipe
+        column: Its column, user id -> weight
+        rows: The full rows of at least the users in ``column``
+        column_norms: Norms of the full columns of every recipe in those rows
+    """
+    dots = defaultdict(float)
+    for user_id, weight in column.items():
+        for other_id, other_weight in rows[user_id].items():
+            if other_id != recipe_id:
+                dots[other_id] += weight * other_weight
+    norm = column_norms[recipe_id]
+    return {other_id: dot / (norm * column_norms[other_id]) for other_id, dot in dots.items()}
+
+
+def top_neighbours(scores, k):
+    """The ``k`` best ``(recipe id, score)`` pairs; ties go to the older recipe"""
+    return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+
+
+def _create(neighbours):
+    SimilarRecipe.objects.bulk_create(
+        [SimilarRecipe(recipe_id=recipe_id, similar_id=similar_id, score=score)
+         for recipe_id, pairs in neighbours.items() for similar_id, score in pairs],
+        batch_size=1000,
+    )
+
+
+def rebuild_all():
+    """Recompute every recipe's neighbours from the whole matrix"""
+    k = _top_k()
+    rows = load_rows()
+    columns = transpose(rows)
+    column_norms = norms(columns)
+    neighbours = {
+        recipe_id: top_neighbours(similarities(recipe_id, column, rows, column_norms), k)
+        for recipe_id, column in columns.items()
+    }
+    with transaction.atomic():
+        SimilarRecipe.objects.all().delete()
+        _create(neighbours)
+    return len(neighbours)
+
+
+def refresh_changed(changed_ids):
+    """
+    Recompute the neighbours of ``changed_ids`` and patch their scores into
+    the lists that contain them or should now contain them.
+
+    Returns:
+        int: Number of neighbour lists rewritten
+    """
+    k = _top_k()
+    changed_ids = set(changed_ids)
+    # Rows of every user who touched a changed recipe, then the full columns of
+    # every recipe in those rows (for their norms)
+    users = set(load_rows(recipe_id__in=changed_ids))
+    rows = load_rows(user_id__in=users) if users else {}
+    reached = {recipe_id for row in rows.values() for recipe_id in row}
+    columns = transpose(load_rows(recipe_id__in=reached)) if reached else {}
+    column_norms = norms(columns)
+
+    scores = {recipe_id: similarities(recipe_id, columns[recipe_id], rows, column_norms)
+              for recipe_id in changed_ids if recipe_id in columns}
+    neighbours = {recipe_id: top_neighbours(scores.get(recipe_id, {}), k) for recipe_id in changed_ids}
+
+    # Lists of other recipes that hold a changed recipe or may now take one
+    others = reached | set(SimilarRecipe.objects.filter(similar_id__in=changed_ids)
+                           .values_list('recipe_id', flat=True))
+    others -= changed_ids
+    stored = defaultdict(dict)
+    for recipe_id, similar_id, score in SimilarRecipe.objects.filter(recipe_id__in=others).values_list(
+            'recipe_id', 'similar_id', 'score'):
+        stored[recipe_id][similar_id] = score
+    for recipe_id in others:
+        current = stored[recipe_id]
+        patched = {similar_id: score for similar_id, score in current.items() if similar_id not in changed_ids}
+        for changed_id in changed_ids:
+            score = scores.get(changed_id, {}).get(recipe_id)
+            if score:
+                patched[changed_id] = score
+        patched = dict(top_neighbours(patched, k))
+        if patched != current:
+            neighbours[recipe_id] = list(patched.items())
+
+    with transaction.atomic():
+        SimilarRecipe.objects.filter(recipe_id__in=list(neighbours)).delete()
+        _create(neighbours)
+    return len(neighbours)
+
+
+def refresh_similar_recipes(full=False):
+    """
+    Bring the stored neighbour lists up to date.
+
+    Args:
+        full: Rebuild every list instead of only the changed recipes'
+
+    Returns:
+        int: Number of neighbour lists rewritten
+    """
+    # Changes marked while the refresh runs get a later changed_at and are kept
+    started = timezone.now()
+    if full:
+        count = rebuild_all()
+    else:
+        changed_ids = list(SimilarityChange.objects.filter(changed_at__lte=started).values_list('recipe_id', flat=True))
+        if not changed_ids:
+            return 0
+        count = refresh_changed(changed_ids)
+    SimilarityChange.objects.filter(changed_at__lte=started).delete()
+    return count
@@ -0,0 +1,154 @@
+"""
+Query planning for recipe search.
+
+``plan_search()`` turns the raw ``q`` parameter into a bounded set of
+substring predicates before any SQL is built:
+
+1. Normalize: Unicode NFKC, lower case, split on anything that is not a
+   letter, digit, apostrophe or hyphen, and drop duplicates.
+2. Drop stop words (unless nothing else is left), terms shorter than
+   ``SEARCH_MIN_TERM_LENGTH`` and terms contained in another term: a recipe
+   that matches "tomatoes" in a column also matches "tomato" there.
+3. Keep the first ``SEARCH_MAX_TERMS`` terms.
+4. Estimate the cost: every term is one ``icontains`` predicate per
+   searched column, weighted by how much text the column holds.
+5. Pick a mode. An empty ``q`` lists every recipe (``all``); a ``q`` whose
+   terms were all dropped, like ``!!!`` or ``a b c``, matches nothing
+   (``none``). ``full`` searches title, description and ingredients;
+   ``title`` searches titles only and is used when ``full`` is over
+   ``SEARCH_MAX_COST`` or ``SEARCH_MAX_PREDICATES``, or when the request has
+   less than ``SEARCH_FULL_MIN_TIME_LEFT`` seconds of its deadline left. A
+   query that is over budget even then, or longer than
+   ``SEARCH_MAX_QUERY_LENGTH``, is rejected.
+
+Every term must match (AND); each term may match any searched column (OR).
+The plan is returned with the results, so clients can tell which terms
+were ignored and why.
+"""
+
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db.models import Q
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from tastestack.overload import time_left
+
+
+# Relative cost of a substring scan of each column, roughly its average length
+COLUMN_COSTS = {
+    'full': {'title': 1, 'description': 4, 'ingredients': 3},
+    'title': {'title': 1},
+}
+
+STOP_WORDS = frozenset('''
+a an and are as at be by for from how in into is it of on or the to with without
+recipe recipes
+'''.split())
+
+_TERM = re.compile(r"[\w'-]+")
+
+
+class SearchQueryTooComplex(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'The search query is too complex. Use fewer or shorter words.'
+    default_code = 'search_query_too_complex'
+
+
+def normalize_terms(query):
+    """Lower-cased, de-duplicated words of ``query`` in their original order"""
+    words = _TERM.findall(unicodedata.normalize('NFKC', query).lower())
+    return list(dict.fromkeys(word.strip("'-") for word in words if word.strip("'-")))
+
+
+class SearchPlan:
+    """The terms, mode and estimated cost of one search"""
+
+    def __init__(self, query):
+        self.query = query
+        self.max_cost = getattr(settings, 'SEARCH_MAX_COST', 32)
+        self.max_predicates = getattr(settings, 'SEARCH_MAX_PREDICATES', 12)
+        self.dropped = {}
+        self.reason = None
+
+        terms = normalize_terms(query)
+        kept = [term for term in terms if term not in STOP_WORDS]
+        self.drop('stop_word', [term for term in terms if term in STOP_WORDS] if kept else [])
+        terms = kept or terms
+
+        min_length = getattr(settings, 'SEARCH_MIN_TERM_LENGTH', 2)
+        self.drop('too_short', [term for term in terms if len(term) < min_length])
+        terms = [term for term in terms if len(term) >= min_length]
+
+        contained = [term for term in terms if any(term != other and term in other for other in terms)]
+        self.drop('contained', contained)
+        terms = [term for term in terms if term not in contained]
+
+        max_terms = getattr(settings, 'SEARCH_MAX_TERMS', 8)
+        self.drop('over_limit', terms[max_terms:])
+        self.terms = terms[:max_terms]
+        self.mode = self.choose_mode()
+
+    def drop(self, reason, terms):
+        if terms:
+            self.dropped[reason] = terms
+
+    def cost(self, mode):
+        return sum(COLUMN_COSTS[mode].values()) * len(self.terms)
+
+    def predicates(self, mode):
+        return len(COLUMN_COSTS[mode]) * len(self.terms)
+
+    def fits(self, mode):
+        return self.cost(mode) <= self.max_cost and self.predicates(mode) <= self.max_predicates
+
+    def choose_mode(self):
+        if not self.terms:
+            return 'none' if self.query.strip() else 'all'
+        remaining = time_left()
+        if remaining is not None and remaining < getattr(settings, 'SEARCH_FULL_MIN_TIME_LEFT', 1.0):
+            self.reason = 'deadline'
+        elif not self.fits('full'):
+            self.reason = 'over_budget'
+        else:
+            return 'full'
+        if not self.fits('title'):
+            raise SearchQueryTooComplex()
+        return 'title'
+
+    def filter(self):
+        """The ``Q`` object of the plan: every term in any searched column"""
+        if self.mode == 'none':
+            # Resolved to an empty result without running a query
+            return Q(pk__in=[])
+        condition = Q()
+        for term in self.terms:
+            condition &= Q(*[(f'{column}__icontains', term) for column in COLUMN_COSTS[self.mode]],
+                           _connector=Q.OR)
+        return condition
+
+    def as_dict(self):
+        """The budget decisions, returned to the client with the results"""
+        return {
+            'terms': self.terms,
+            'mode': self.mode,
+            'fallback_reason': self.reason,
+            'dropped': self.dropped,
+            'cost': self.cost(self.mode) if self.terms else 0,
+            'max_cost': self.max_cost,
+            'predicates': self.predicates(self.mode) if self.terms else 0,
+        }
+
+
+def plan_search(query):
+    """
+    Plan the search for a raw ``q`` parameter.
+
+    Raises:
+        SearchQueryTooComplex: The query is longer than ``SEARCH_MAX_QUERY_LENGTH``
+            or over budget even when searching titles only
+    """
+    if len(query) > getattr(settings, 'SEARCH_MAX_QUERY_LENGTH', 200):
+        raise SearchQueryTooComplex()
+    return SearchPlan(query)
@@ -1,14 +1,34 @@
+import asyncio
 from rest_framework import serializers
+from django.db import models
 from .models import Recipe, RecipeImage
 from accounts.serializers import UserSerializer
 from interactions.models import Rating, Like, Comment
+from tastestack.async_api import alist
+from tastestack.uploads import BoundedImageField
 import json
 
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeImage
-        fields = ('id', 'image', 'uploaded_at')
+        fields = ('id', 'image', 'thumbnail', 'position', 'uploaded_at')
+
+
+class RecipeImageUploadSerializer(serializers.Serializer):
+    """Validates a single file of a gallery upload"""
+    image = BoundedImageField()
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Looks up the viewer's likes and ratings once for the whole list"""
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        viewer_fields = {'is_liked', 'user_rating'} & set(self.child.fields)
+        if viewer_fields and 'liked_recipe_ids' not in self.context:
+            self.context.update(get_viewer_context(self.context.get('request'), [recipe.id for recipe in recipes]))
+        return super().to_representation(recipes)
 
 
 class RecipeSerializer(serializers.ModelSerializer):
@@ -29,9 +49,21 @@ class RecipeSerializer(serializers.ModelSerializer):
             'likes_count', 'is_liked', 'user_rating'
         )
         read_only_fields = ('id', 'author', 'created_at', 'updated_at', 'images', 'average_rating', 'likes_count', 'is_liked', 'user_rating')
+        list_serializer_class = RecipeListSerializer
+
+    def __init__(self, *args, **kwargs):
+        # Optional sparse fieldset, e.g. fields=['id', 'title']
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
     
     def get_is_liked(self, obj):
         """Check if the current user has liked this recipe"""
+        # Precomputed by get_viewer_context() for many recipes at once
+        if 'liked_recipe_ids' in self.context:
+            return obj.id in self.context['liked_recipe_ids']
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return Like.objects.filter(user=request.user, recipe=obj).exists()
@@ -39,6 +71,8 @@ class RecipeSerializer(serializers.ModelSerializer):
     
     def get_user_rating(self, obj):
         """Get the current user's rating for this recipe"""
+        if 'user_ratings' in self.context:
+            return self.context['user_ratings'].get(obj.id)
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             rating = Rating.objects.filter(user=request.user, recipe=obj).first()
@@ -55,7 +89,44 @@ class RecipeSerializer(serializers.ModelSerializer):
         return None
 
 
+def get_viewer_context(request, recipe_ids):
+    """
+    Look up the requesting user's likes and ratings for many recipes at once.
+
+    Pass the result as serializer context so ``is_liked`` and ``user_rating``
+    do not run one query per recipe.
+
+    Returns:
+        dict: ``liked_recipe_ids`` (set) and ``user_ratings`` (recipe id -> rating)
+    """
+    if not (request and request.user.is_authenticated) or not recipe_ids:
+        return {'liked_recipe_ids': set(), 'user_ratings': {}}
+
+    return {
+        'liked_recipe_ids': set(Like.objects.filter(
+            user=request.user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', flat=True)),
+        'user_ratings': dict(Rating.objects.filter(
+            user=request.user, recipe_id__in=recipe_ids
+        ).values_list('recipe_id', 'rating')),
+    }
+
+
+async def aget_viewer_context(user, recipe_ids):
+    """Async ``get_viewer_context()`` for an already authenticated user (or None)"""
+    if user is None or not user.is_authenticated or not recipe_ids:
+        return {'liked_recipe_ids': set(), 'user_ratings': {}}
+
+    liked, ratings = await asyncio.gather(
+        alist(Like.objects.filter(user=user, recipe_id__in=recipe_ids).values_list('recipe_id', flat=True)),
+        alist(Rating.objects.filter(user=user, recipe_id__in=recipe_ids).values_list('recipe_id', 'rating')),
+    )
+    return {'liked_recipe_ids': set(liked), 'user_ratings': dict(ratings)}
+
+
 class RecipeCreateSerializer(serializers.ModelSerializer):
+    image = BoundedImageField(required=False, allow_null=True)
+
     class Meta:
         model = Recipe
         fields = (
@@ -78,6 +149,8 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
 
 class RecipeUpdateSerializer(serializers.ModelSerializer):
+    image = BoundedImageField(required=False, allow_null=True)
+
     class Meta:
         model = Recipe
         fields = (
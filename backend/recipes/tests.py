@@ -1,3 +1,753 @@
-from django.test import TestCase
+import fcntl
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from django.core.handlers.asgi import ASGIHandler
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.db import OperationalError, connection, transaction
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+from rest_framework_simplejwt.tokens import RefreshToken
+from tastestack import overload, ratelimit
+from tastestack.profiling import StackSampler
+from tastestack.overload import DeadlineExceeded, LoadSheddingMiddleware, StatementDeadline, _deadline
+from tastestack.queries import instrument_queries
+from tastestack.test_utils import QueryBudgetTestCase, TasteStackTestCase, make_image_file
+from accounts.models import User
+from interactions.models import Comment, Like, Rating
+from . import content_index, trending
+from .images import render_thumbnail
+from .models import Recipe, RecipeImage, SimilarityChange, SimilarRecipe, TrendingEpoch
+from .recommendations import refresh_similar_recipes
+from .search import SearchQueryTooComplex, plan_search
 
-# Create your tests here.
+
+class RecipeQueryBudgetTests(QueryBudgetTestCase):
+    """Every URL in recipes/urls.py must not run more queries as data grows"""
+
+    def test_recipe_list(self):
+        self.assertConstantGet(reverse('recipe-list-create'))
+
+    def test_recipe_list_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assertConstantGet(reverse('recipe-list-create'))
+
+    def test_recipe_create(self):
+        data = {
+            'title': 'New Recipe', 'description': 'Fresh', 'ingredients': ['salt'],
+            'instructions': ['Cook'], 'prep_time': 5, 'cook_time': 5, 'servings': 1, 'difficulty': 'Easy',
+        }
+        self.assertConstantQueries(
+            lambda: lambda: self.client.post(reverse('recipe-list-create'), data, format='json'), 201
+        )
+
+    def test_recipe_detail(self):
+        self.assertConstantGet(reverse('recipe-detail', args=[self.recipe.pk]))
+
+    def test_recipe_update(self):
+        self.assertConstantQueries(
+            lambda: lambda: self.client.patch(reverse('recipe-detail', args=[self.recipe.pk]),
+                                              {'title': 'Renamed'}, format='json')
+        )
+
+    def test_recipe_delete(self):
+        def prepare():
+            recipe = self.create_recipe(self.owner, 'Doomed')
+            return lambda: self.client.delete(reverse('recipe-detail', args=[recipe.pk]))
+        self.assertConstantQueries(prepare, 204)
+
+    def test_rate_recipe(self):
+        self.assertConstantQueries(
+            lambda: lambda: self.client.post(reverse('rate-recipe', args=[self.recipe.pk]),
+                                             {'rating': 5}, format='json'), 201
+        )
+
+    def test_recipe_images(self):
+        self.assertConstantGet(reverse('recipe-images', args=[self.recipe.pk]))
+
+    def test_upload_recipe_images(self):
+        def prepare():
+            files = [make_image_file('a.png'), make_image_file('b.png')]
+            return lambda: self.client.post(reverse('upload-recipe-images', args=[self.recipe.pk]),
+                                            {'images': files}, format='multipart')
+        self.assertConstantQueries(prepare, 201)
+
+    def test_reorder_recipe_images(self):
+        def prepare():
+            order = list(self.recipe.images.values_list('id', flat=True))[::-1]
+            return lambda: self.client.post(reverse('reorder-recipe-images', args=[self.recipe.pk]),
+                                            {'order': order}, format='json')
+        self.assertConstantQueries(prepare)
+
+    def test_delete_recipe_image(self):
+        def prepare():
+            image = RecipeImage.objects.create(recipe=self.recipe, image='recipe_images/doomed.png')
+            return lambda: self.client.delete(reverse('delete-recipe-image', args=[self.recipe.pk, image.pk]))
+        self.assertConstantQueries(prepare, 204)
+
+    def test_recipes_batch(self):
+        def prepare():
+            ids = ','.join(str(pk) for pk in Recipe.objects.values_list('id', flat=True))
+            return lambda: self.client.get(f"{reverse('recipes-batch')}?ids={ids}")
+        self.assertConstantQueries(prepare)
+
+    def test_similar_recipes(self):
+        def prepare():
+            refresh_similar_recipes(full=True)
+            return lambda: self.client.get(reverse('similar-recipes', args=[self.recipe.pk]))
+        self.assertConstantQueries(prepare)
+
+    def test_trending_recipes(self):
+        self.assertConstantGet(f"{reverse('trending-recipes')}?window=week")
+
+    def test_search_recipes(self):
+        self.assertConstantGet(f"{reverse('search-recipes')}?q=recipe")
+
+    def test_my_recipes(self):
+        self.assertConstantGet(reverse('my-recipes'))
+
+    def test_platform_statistics(self):
+        self.assertConstantGet(reverse('platform-statistics'))
+
+
+class AsyncReadViewTests(TasteStackTestCase):
+    """The async read endpoints under ASGI"""
+
+    def setUp(self):
+        super().setUp()
+        self.async_client = AsyncClient()
+        self.headers = {'Authorization': f'Bearer {RefreshToken.for_user(self.viewer).access_token}'}
+
+    @override_settings(DEBUG=True)
+    def test_middleware_chain_is_async(self):
+        # In DEBUG, Django logs every middleware it has to adapt to the other mode
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    async def test_read_endpoints(self):
+        await Like.objects.acreate(user=self.viewer, recipe=self.recipe)
+        await Comment.objects.acreate(user=self.viewer, recipe=self.recipe, content='Tasty')
+        paths = [
+            reverse('recipe-detail', args=[self.recipe.pk]),
+            f"{reverse('search-recipes')}?q=recipe",
+            reverse('get-recipe-comments', args=[self.recipe.pk]),
+            reverse('public_profile', args=[self.owner.pk]),
+        ]
+        for path in paths:
+            response = await self.async_client.get(path, headers=self.headers)
+            self.assertEqual(response.status_code, 200, path)
+            # Queries run by the async ORM on worker threads are still measured
+            self.assertNotIn('desc="0 queries"', response['Server-Timing'], path)
+
+        response = await self.async_client.get(paths[0], headers=self.headers)
+        self.assertTrue(json.loads(response.content)['is_liked'])
+
+    async def test_errors(self):
+        response = await self.async_client.get(reverse('recipe-detail', args=[0]))
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(reverse('search-recipes'))
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.post(reverse('search-recipes'), headers=self.headers)
+        self.assertEqual(response.status_code, 405)
+
+    async def test_writes_use_sync_view(self):
+        response = await self.async_client.patch(
+            reverse('recipe-detail', args=[self.recipe.pk]), {'title': 'Renamed'},
+            content_type='application/json', headers=self.headers,
+        )
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(RATELIMIT_ENABLED=True, RATELIMIT_STORE='tastestack.ratelimit.LocalStore',
+                       RATELIMIT_RATES={'search': {'user': '2/min', 'ip': '1/min'}})
+    async def test_search_is_limited_per_user(self):
+        ratelimit.get_store().clear()
+        path = f"{reverse('search-recipes')}?q=recipe"
+        for _ in range(2):
+            self.assertEqual((await self.async_client.get(path, headers=self.headers)).status_code, 200)
+        response = await self.async_client.get(path, headers=self.headers)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual((response['Retry-After'], response['X-RateLimit-Remaining']), ('30', '0'))
+
+        # Without a token the request draws from the IP bucket
+        self.assertEqual((await self.async_client.get(path)).status_code, 401)
+        self.assertEqual((await self.async_client.get(path)).status_code, 429)
+
+    @override_settings(RATELIMIT_ENABLED=True, RATELIMIT_RATES={'search': {'ip': '5/min'}})
+    async def test_blocking_store_is_called_off_the_event_loop(self):
+        class BlockingStore:
+            """A store with only the synchronous take(), like a network client"""
+            threads = []
+
+            def take(self, key, capacity, period):
+                self.threads.append(threading.get_ident())
+                return True, capacity - 1
+
+        previous, ratelimit._store = ratelimit._store, BlockingStore()
+        self.addCleanup(setattr, ratelimit, '_store', previous)
+        request = RequestFactory().get(reverse('search-recipes'))
+        allowed, headers = await ratelimit.acheck(request, 'search')
+        self.assertEqual((allowed, headers['X-RateLimit-Remaining']), (True, '4'))
+        self.assertNotEqual(BlockingStore.threads, [threading.get_ident()])
+
+
+class LoadSheddingTests(TasteStackTestCase):
+    """Requests are shed by priority and bounded by their deadline"""
+
+    def queued_for(self, seconds):
+        return {'HTTP_X_REQUEST_START': f't={time.time() - seconds:.3f}'}
+
+    def test_stale_requests_are_shed_by_priority(self):
+        self.client.force_authenticate(None)
+        response = self.client.get(reverse('search-recipes'), **self.queued_for(6))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+
+        # Sign-in is critical and keeps its 30 second budget
+        response = self.client.post(reverse('login'), {'email': 'owner@example.com', 'password': 'ownerpass123'},
+                                    format='json', **self.queued_for(6))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.post(reverse('login'), {}, format='json', **self.queued_for(31)).status_code, 503)
+
+    @override_settings(LOAD_SHEDDING_MAX_IN_FLIGHT=10)
+    def test_in_flight_limit_by_priority(self):
+        middleware = LoadSheddingMiddleware(lambda request: HttpResponse())
+        middleware.in_flight = 7
+        factory = RequestFactory()
+        self.assertEqual(middleware(factory.get(reverse('search-recipes'))).status_code, 503)
+        self.assertEqual(middleware(factory.get(reverse('recipe-list-create'))).status_code, 200)
+        self.assertEqual(middleware(factory.post(reverse('login'))).status_code, 200)
+        self.assertEqual(middleware.in_flight, 7)
+
+    def test_statements_after_the_deadline_are_not_run(self):
+        def slow_view(request):
+            time.sleep(0.06)
+            return Recipe.objects.count()
+
+        middleware = LoadSheddingMiddleware(slow_view)
+        request = RequestFactory().get(reverse('recipe-list-create'), **self.queued_for(14.95))
+        with self.assertRaises(DeadlineExceeded) as raised:
+            middleware(request)
+        self.assertEqual(middleware.process_exception(request, raised.exception).status_code, 503)
+
+    def test_postgresql_timeout_is_set_once_per_transaction(self):
+        class PostgreSQLConnection:
+            """Stands in for a PostgreSQL connection, with this connection's transaction state"""
+            vendor = 'postgresql'
+            in_atomic_block = property(lambda self: connection.in_atomic_block)
+            run_on_commit = property(lambda self: connection.run_on_commit)
+            on_commit = staticmethod(connection.on_commit)
+
+        statements = []
+
+        def execute(sql, params, many, context):
+            statements.append(sql)
+
+        def run(wrapper, count=1):
+            del statements[:]
+            for _ in range(count):
+                wrapper(execute, 'SELECT 1', None, False, context)
+            return sum(sql.startswith('SET statement_timeout') for sql in statements), len(statements)
+
+        context = {'connection': PostgreSQLConnection()}
+        overload.reset_statement_timeout(context['connection'])
+        short, long = StatementDeadline(time.monotonic() + 30), StatementDeadline(time.monotonic() + 60)
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                self.assertEqual(run(short, 5), (1, 6))
+                # A rollback to a savepoint undoes the SET made after it
+                with self.assertRaises(DeadlineExceeded), transaction.atomic():
+                    self.assertEqual(run(long), (1, 2))
+                    raise DeadlineExceeded()
+                self.assertEqual(run(long, 3), (1, 4))
+        # The committed SET stays on the connection
+        self.assertEqual(run(long, 3), (0, 3))
+
+    def test_sqlite_statement_is_interrupted(self):
+        endless = 'WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) SELECT count(*) FROM n'
+        with instrument_queries(StatementDeadline(time.monotonic() + 0.05)):
+            with self.assertRaises(OperationalError), connection.cursor() as cursor:
+                cursor.execute(endless)
+
+
+class ImageUploadTests(TasteStackTestCase):
+    """Gallery uploads are validated before decoding and thumbnailed without loading streamed files"""
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+    def test_streamed_uploads_are_thumbnailed_from_disk(self):
+        files = [make_image_file('a.png', (800, 600)), make_image_file('b.png')]
+        response = self.client.post(reverse('upload-recipe-images', args=[self.recipe.pk]),
+                                    {'images': files}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        for recipe_image in self.recipe.images.all():
+            with Image.open(recipe_image.thumbnail) as thumbnail:
+                self.assertEqual(thumbnail.format, 'JPEG')
+                self.assertLessEqual(max(thumbnail.size), 400)
+
+    def upload(self, *files):
+        return self.client.post(reverse('upload-recipe-images', args=[self.recipe.pk]),
+                                {'images': list(files)}, format='multipart')
+
+    def image_file(self, name, image, image_format):
+        output = io.BytesIO()
+        image.save(output, image_format)
+        return SimpleUploadedFile(name, output.getvalue())
+
+    @override_settings(IMAGE_UPLOAD_MAX_SIZES={'default': 1024})
+    def test_oversize_file_is_rejected(self):
+        response = self.upload(make_image_file('big.png', (400, 400)))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('The maximum size is 1.0 KB', str(response.data['results'][0]['errors']))
+
+    @override_settings(UPLOAD_MAX_REQUEST_SIZE=1024)
+    def test_request_over_content_length_limit_is_rejected(self):
+        response = self.upload(make_image_file('big.png', (400, 400)))
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(self.recipe.images.exists())
+
+    def test_decompression_bomb_is_rejected_before_decoding(self):
+        # 81 megapixels in a few kilobytes
+        bomb = self.image_file('bomb.png', Image.new('1', (9000, 9000)), 'PNG')
+        self.assertLess(bomb.size, 100 * 1024)
+        response = self.upload(bomb)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exceed the maximum', str(response.data['results'][0]['errors']))
+
+    def test_disallowed_format_is_rejected(self):
+        response = self.upload(self.image_file('photo.bmp', Image.new('RGB', (16, 16)), 'BMP'))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Unsupported image format "BMP"', str(response.data['results'][0]['errors']))
+
+    def header_only_png(self, name, size):
+        """A PNG whose header declares ``size`` but whose pixel data cannot be decoded"""
+        data = self.image_file(name, Image.new('RGB', size), 'PNG').read()
+        return SimpleUploadedFile(name, data[:data.index(b'IDAT') + 4] + bytes(64), 'image/png')
+
+    @override_settings(IMAGE_UPLOAD_MAX_PIXELS=10_000)
+    def test_pixel_limit_applies_to_recipe_and_profile_images(self):
+        # 40,000 pixels: over the configured limit, far under Pillow's bomb threshold. Decoding the
+        # broken pixel data would fail as an invalid image, so the limit is checked from the header
+        response = self.client.post(reverse('recipe-list-create'), {
+            'title': 'Large', 'description': 'Too many pixels', 'ingredients': '["salt"]',
+            'instructions': '["Stir"]', 'prep_time': 1, 'cook_time': 1, 'servings': 1, 'difficulty': 'Easy',
+            'image': self.header_only_png('recipe.png', (200, 200)),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exceed the maximum', str(response.data['image']))
+
+        response = self.client.put(reverse('update_profile'),
+                                   {'profile_picture': self.header_only_png('me.png', (200, 200))},
+                                   format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('exceed the maximum', str(response.data['profile_picture']))
+        self.owner.refresh_from_db()
+        self.assertFalse(self.owner.profile_picture)
+
+    def test_render_thumbnail_from_path(self):
+        with tempfile.NamedTemporaryFile(suffix='.png') as f:
+            f.write(make_image_file(size=(800, 600)).read())
+            f.flush()
+            with Image.open(io.BytesIO(render_thumbnail(f.name))) as thumbnail:
+                self.assertEqual(thumbnail.size, (400, 300))
+
+
+class ProfilingTests(SimpleTestCase):
+    """Profiles sample the threads that run the view"""
+
+    def test_sampler_sees_other_threads(self):
+        done = threading.Event()
+
+        def view_thread_work():
+            done.wait(5)
+
+        worker = threading.Thread(target=view_thread_work, name='view worker')
+        worker.start()
+        sampler = StackSampler(None, 0.001)
+        sampler.start()
+        try:
+            while not sampler.samples:
+                time.sleep(0.001)
+        finally:
+            sampler.stop()
+            done.set()
+            worker.join()
+        stacks = [stack for stack in sampler.stacks if stack.startswith('thread:view_worker;')]
+        self.assertTrue(stacks)
+        self.assertIn(';recipes/tests.py:view_thread_work;', stacks[0])
+        self.assertFalse([stack for stack in sampler.stacks if stack.startswith('thread:tastestack-profiler')])
+
+
+class SearchPlanTests(TasteStackTestCase):
+    """Search queries are normalized and kept within a cost budget"""
+
+    def test_terms_are_normalized(self):
+        plan = plan_search('The  TOMATO soup, with Tomatoes and a soup  ')
+        self.assertEqual(plan.terms, ['soup', 'tomatoes'])
+        self.assertEqual(plan.dropped, {'stop_word': ['the', 'with', 'and', 'a'], 'contained': ['tomato']})
+        self.assertEqual((plan.mode, plan.as_dict()['predicates']), ('full', 6))
+
+        # A query made only of stop words still searches for them
+        self.assertEqual(plan_search('the').terms, ['the'])
+        self.assertEqual(plan_search('').mode, 'all')
+        # ...but a query whose terms were all dropped matches nothing
+        for query in ('x', '!!!', 'a b c'):
+            self.assertEqual(plan_search(query).mode, 'none', query)
+
+    @override_settings(SEARCH_MAX_TERMS=8, SEARCH_MAX_COST=32, SEARCH_MAX_PREDICATES=12)
+    def test_over_budget_falls_back_to_titles(self):
+        plan = plan_search('rice beans corn peas kale leek okra yam taro')
+        self.assertEqual(plan.dropped, {'over_limit': ['taro']})
+        self.assertEqual(plan.as_dict(), {
+            'terms': ['rice', 'beans', 'corn', 'peas', 'kale', 'leek', 'okra', 'yam'],
+            'mode': 'title', 'fallback_reason': 'over_budget', 'dropped': {'over_limit': ['taro']},
+            'cost': 8, 'max_cost': 32, 'predicates': 8,
+        })
+
+        with override_settings(SEARCH_MAX_PREDICATES=4):
+            with self.assertRaises(SearchQueryTooComplex):
+                plan_search('rice beans corn peas kale')
+
+    def test_little_time_left_falls_back_to_titles(self):
+        token = _deadline.set(time.monotonic() + 0.5)
+        try:
+            plan = plan_search('soup')
+        finally:
+            _deadline.reset(token)
+        self.assertEqual((plan.mode, plan.reason), ('title', 'deadline'))
+
+    def test_search_endpoint(self):
+        self.create_recipe(self.owner, 'Tomato Soup')
+        self.create_recipe(self.owner, 'Onion Soup')
+        data = self.client.get(reverse('search-recipes'), {'q': 'soup tomato'}).json()
+        self.assertEqual([recipe['title'] for recipe in data['results']], ['Tomato Soup'])
+        self.assertEqual(data['plan']['terms'], ['soup', 'tomato'])
+
+        response = self.client.get(reverse('search-recipes'), {'q': 'soup ' * 100})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'], SearchQueryTooComplex.default_detail)
+
+        data = self.client.get(reverse('search-recipes'), {'q': '!!!'}).json()
+        self.assertEqual((data['results'], data['count'], data['plan']['mode']), ([], 0, 'none'))
+
+    def test_search_is_paginated(self):
+        for number in range(3):
+            self.create_recipe(self.owner, f'Soup {number}')
+        data = self.client.get(reverse('search-recipes'), {'q': 'soup', 'page': 2, 'page_size': 2}).json()
+        self.assertEqual([recipe['title'] for recipe in data['results']], ['Soup 0'])
+        self.assertEqual((data['count'], data['page'], data['page_size']), (3, 2, 2))
+
+
+class SimilarRecipesTests(TasteStackTestCase):
+    """Item-item neighbours from likes and ratings, and their incremental refresh"""
+
+    def setUp(self):
+        super().setUp()
+        self.soup = self.create_recipe(self.owner, 'Soup')
+        self.stew = self.create_recipe(self.owner, 'Stew')
+        self.cake = self.create_recipe(self.owner, 'Cake')
+        self.users = [User.objects.create(username=f'cf{i}', email=f'cf{i}@example.com') for i in range(3)]
+
+    def neighbours(self, recipe):
+        return list(SimilarRecipe.objects.filter(recipe=recipe).order_by('-score')
+                    .values_list('similar_id', 'score'))
+
+    def test_cosine_of_likes_and_ratings(self):
+        first, second, third = self.users
+        for user in (first, second):
+            Like.objects.create(user=user, recipe=self.soup)
+            Like.objects.create(user=user, recipe=self.stew)
+        Like.objects.create(user=third, recipe=self.soup)
+        Rating.objects.create(user=third, recipe=self.cake, rating=5)
+
+        self.assertEqual(refresh_similar_recipes(full=True), 3)
+        # soup = (1, 1, 1), stew = (1, 1, 0), cake = (0, 0, 1)
+        [(stew_id, stew_score), (cake_id, cake_score)] = self.neighbours(self.soup)
+        self.assertEqual((stew_id, cake_id), (self.stew.pk, self.cake.pk))
+        self.assertAlmostEqual(stew_score, 2 / (3 ** 0.5 * 2 ** 0.5))
+        self.assertAlmostEqual(cake_score, 1 / 3 ** 0.5)
+        self.assertEqual([pair[0] for pair in self.neighbours(self.stew)], [self.soup.pk])
+
+    def test_incremental_refresh_matches_full_rebuild(self):
+        first, second, third = self.users
+        Like.objects.create(user=first, recipe=self.soup)
+        Like.objects.create(user=first, recipe=self.stew)
+        refresh_similar_recipes(full=True)
+        self.assertEqual(refresh_similar_recipes(), 0)
+
+        self.client.force_authenticate(second)
+        self.client.post(reverse('like-recipe', args=[self.soup.pk]))
+        self.client.post(reverse('like-recipe', args=[self.cake.pk]))
+        self.client.force_authenticate(first)
+        self.client.post(reverse('unlike-recipe', args=[self.stew.pk]))
+        self.assertEqual(set(SimilarityChange.objects.values_list('recipe_id', flat=True)),
+                         {self.soup.pk, self.cake.pk, self.stew.pk})
+
+        refresh_similar_recipes()
+        self.assertFalse(SimilarityChange.objects.exists())
+        incremental = {recipe.pk: self.neighbours(recipe) for recipe in (self.soup, self.stew, self.cake)}
+        refresh_similar_recipes(full=True)
+        full = {recipe.pk: self.neighbours(recipe) for recipe in (self.soup, self.stew, self.cake)}
+        self.assertEqual(incremental, full)
+        self.assertEqual(full[self.stew.pk], [])
+
+    @override_settings(SIMILAR_RECIPES_TOP_K=1)
+    def test_endpoint(self):
+        for user in self.users:
+            Like.objects.create(user=user, recipe=self.soup)
+            Like.objects.create(user=user, recipe=self.stew)
+        Like.objects.create(user=self.users[0], recipe=self.cake)
+        refresh_similar_recipes(full=True)
+
+        data = self.client.get(reverse('similar-recipes', args=[self.soup.pk]), {'limit': 5}).data
+        self.assertEqual([(recipe['id'], recipe['title'], recipe['score']) for recipe in data['results']],
+                         [(self.stew.pk, 'Stew', 1.0)])
+        self.assertEqual(self.client.get(reverse('similar-recipes', args=[self.recipe.pk])).data, {'results': []})
+        self.assertEqual(self.client.get(reverse('similar-recipes', args=[999999])).status_code, 404)
+
+
+class ContentIndexTests(TasteStackTestCase):
+    """TF-IDF neighbours from the memory-mapped index and its delta log"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        override = override_settings(CONTENT_INDEX_PATH=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.soup = self.create_text_recipe('Tomato Soup', ['tomatoes', 'onion', 'basil'], 'Simmer', 'soup')
+        self.pasta = self.create_text_recipe('Tomato Pasta', ['tomatoes', 'pasta', 'basil'], 'Drain', 'italian')
+        self.cake = self.create_text_recipe('Chocolate Cake', ['chocolate', 'sugar', 'butter'], 'Chill', 'dessert')
+
+    def create_text_recipe(self, title, ingredients, instruction, category):
+        recipe = self.create_recipe(self.owner, title)
+        Recipe.objects.filter(pk=recipe.pk).update(ingredients=ingredients, instructions=[instruction],
+                                                   category=category)
+        recipe.refresh_from_db()
+        return recipe
+
+    def test_build_and_nearest(self):
+        self.assertEqual(content_index.build_index(), Recipe.objects.count())
+        index = content_index.get_index()
+        self.assertEqual((index.base.doc_weights.format, index.base.post_docs.format), ('f', 'I'))
+        self.assertAlmostEqual(sum(weight * weight for weight in index.vector(self.soup.pk).values()), 1, places=5)
+
+        [(recipe_id, score)] = content_index.nearest(self.soup.pk, 5)
+        self.assertEqual(recipe_id, self.pasta.pk)
+        self.assertTrue(0 < score < 1)
+        self.assertEqual(content_index.nearest(999999, 5), [])
+
+    def test_created_and_updated_recipes_are_indexed_on_commit(self):
+        content_index.build_index()
+        data = {
+            'title': 'Chocolate Mousse', 'description': 'Airy', 'ingredients': ['chocolate', 'cream', 'sugar'],
+            'instructions': ['Whisk'], 'prep_time': 5, 'cook_time': 0, 'servings': 2, 'difficulty': 'Easy',
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('recipe-list-create'), data, format='json')
+        mousse_id = Recipe.objects.get(title='Chocolate Mousse').pk
+        self.assertEqual(content_index.nearest(mousse_id, 1)[0][0], self.cake.pk)
+        self.assertEqual(content_index.nearest(self.cake.pk, 1)[0][0], mousse_id)
+
+        # The delta vector replaces the file's vector of an updated recipe
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(reverse('recipe-detail', args=[self.pasta.pk]),
+                              {'title': 'Chocolate Pasta', 'ingredients': ['chocolate', 'pasta']}, format='json')
+        self.assertNotIn(self.pasta.pk, dict(content_index.nearest(self.soup.pk, 5)))
+
+        # A build folds the delta log into the file
+        content_index.build_index()
+        self.assertEqual(os.path.getsize(os.path.join(content_index._directory(), content_index.DELTA_FILE)), 0)
+        self.assertEqual(content_index.get_index().delta, {})
+        self.assertIn(mousse_id, dict(content_index.nearest(self.cake.pk, 5)))
+
+    def test_append_waits_for_a_trim_and_lands_in_the_new_log(self):
+        content_index.build_index()
+        path = os.path.join(content_index._directory(), content_index.DELTA_FILE)
+        fd = content_index._lock_delta(path, fcntl.LOCK_EX)
+        thread = threading.Thread(target=content_index.index_recipe, args=(self.cake,))
+        thread.start()
+        thread.join(0.2)
+        self.assertTrue(thread.is_alive())
+
+        # Replace the log as a trim does, then release the lock
+        with open(f'{path}.new', 'wb'):
+            pass
+        os.replace(f'{path}.new', path)
+        os.close(fd)
+        thread.join()
+        self.assertEqual(list(content_index.get_index().delta), [self.cake.pk])
+
+    def test_similar_endpoint_falls_back_to_content(self):
+        content_index.build_index()
+        results = self.client.get(reverse('similar-recipes', args=[self.soup.pk])).data['results']
+        self.assertEqual([(recipe['id'], recipe['source']) for recipe in results], [(self.pasta.pk, 'content')])
+
+
+class TrendingTests(TasteStackTestCase):
+    """Time-decayed trending scores, updated by interactions and renormalized by a job"""
+
+    def setUp(self):
+        super().setUp()
+        self.fresh = self.create_recipe(self.owner, 'Fresh')
+        self.client.force_authenticate(self.viewer)
+
+    def scores(self, window='day'):
+        results = self.client.get(reverse('trending-recipes'), {'window': window}).data['results']
+        return {recipe['id']: recipe['trending_score'] for recipe in results}
+
+    def test_interactions_update_scores(self):
+        self.client.post(reverse('like-recipe', args=[self.recipe.pk]))
+        self.client.post(reverse('like-recipe', args=[self.recipe.pk]))
+        self.client.post(reverse('rate-recipe', args=[self.recipe.pk]), {'rating': 4}, format='json')
+        self.client.post(reverse('rate-recipe', args=[self.recipe.pk]), {'rating': 5}, format='json')
+        self.client.post(reverse('add-comment', args=[self.recipe.pk]), {'content': 'Great'}, format='json')
+        # One like, one rating and one comment
+        self.assertAlmostEqual(self.scores()[self.recipe.pk], 4, places=3)
+
+        self.client.post(reverse('unlike-recipe', args=[self.recipe.pk]))
+        comment = Comment.objects.get(recipe=self.recipe)
+        self.client.force_authenticate(self.owner)
+        self.client.post(reverse('hide-comment', args=[self.recipe.pk, comment.pk]))
+        self.client.delete(reverse('delete-comment', args=[self.recipe.pk, comment.pk]))
+        self.assertAlmostEqual(self.scores()[self.recipe.pk], 1, places=3)
+
+    def test_batch_counts_only_changes(self):
+        Like.objects.create(user=self.viewer, recipe=self.recipe)
+        operations = [{'op': 'like', 'recipe': self.recipe.pk}, {'op': 'like', 'recipe': self.fresh.pk},
+                      {'op': 'rate', 'recipe': self.fresh.pk, 'rating': 3}]
+        self.client.post(reverse('batch-interactions'), {'operations': operations}, format='json')
+        self.assertEqual(self.scores(), {self.fresh.pk: 2.0})
+
+    def test_windows_decay_at_different_rates(self):
+        day_ago = timezone.now() - timedelta(days=1)
+        trending.record([trending.Interaction(self.recipe.pk, 'like', day_ago)] * 2)
+        trending.record([trending.Interaction(self.fresh.pk, 'like')])
+
+        day, week = self.scores('day'), self.scores('week')
+        self.assertEqual(list(day), [self.fresh.pk, self.recipe.pk])
+        self.assertEqual(list(week), [self.recipe.pk, self.fresh.pk])
+        self.assertAlmostEqual(day[self.recipe.pk], 2 * math.exp(-1), places=3)
+        self.assertAlmostEqual(week[self.recipe.pk], 2 * math.exp(-1 / 7), places=3)
+        self.assertEqual(self.client.get(reverse('trending-recipes'), {'window': 'month'}).status_code, 400)
+
+    def test_renormalize_and_rebuild_keep_the_scores(self):
+        TrendingEpoch.objects.update(epoch=timezone.now() - timedelta(days=3))
+        self.client.post(reverse('like-recipe', args=[self.recipe.pk]))
+        self.client.post(reverse('add-comment', args=[self.fresh.pk]), {'content': 'Nice'}, format='json')
+        before = self.scores('week')
+        self.assertGreater(Recipe.objects.get(pk=self.recipe.pk).trending_day, 10)
+
+        self.assertEqual(trending.renormalize(), 2)
+        self.assertAlmostEqual(Recipe.objects.get(pk=self.recipe.pk).trending_day, 1, places=3)
+        for recipe_id, score in self.scores('week').items():
+            self.assertAlmostEqual(score, before[recipe_id], places=3)
+
+        self.assertEqual(trending.rebuild(), 2)
+        for recipe_id, score in self.scores('week').items():
+            self.assertAlmostEqual(score, before[recipe_id], places=3)
+
+    def test_increment_racing_a_renormalization_uses_the_new_epoch(self):
+        trending.get_epoch(refresh=True)
+        # Another process moves the epoch back; this process still has the old one
+        TrendingEpoch.objects.update(epoch=timezone.now() - timedelta(days=1))
+        trending.record([trending.Interaction(self.recipe.pk, 'like')])
+        self.assertAlmostEqual(Recipe.objects.get(pk=self.recipe.pk).trending_day, math.e, places=3)
+
+    def test_old_epoch_is_renormalized_on_demand(self):
+        # Far past the overflow of exp(age / tau) for the day window
+        TrendingEpoch.objects.update(epoch=timezone.now() - timedelta(days=800))
+        trending.get_epoch(refresh=True)
+        self.client.post(reverse('like-recipe', args=[self.recipe.pk]))
+        self.assertLess(timezone.now() - TrendingEpoch.objects.get().epoch, timedelta(minutes=1))
+        self.assertAlmostEqual(self.scores()[self.recipe.pk], 1, places=3)
+
+    @override_settings(SCHEDULED_JOBS=[{'command': 'renormalize_trending', 'every': 60},
+                                       {'command': 'no_such_command', 'every': 60}])
+    def test_scheduled_jobs(self):
+        TrendingEpoch.objects.update(epoch=timezone.now() - timedelta(days=3))
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('run_scheduled_jobs', '--once', stdout=stdout, stderr=stderr)
+        self.assertLess(timezone.now() - TrendingEpoch.objects.get().epoch, timedelta(minutes=1))
+        self.assertIn('renormalize_trending finished', stdout.getvalue())
+        self.assertIn('no_such_command failed', stderr.getvalue())
+
+
+class ImportExportTests(TasteStackTestCase):
+    """NDJSON export and import of recipes with their interactions"""
+
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        override = override_settings(CONTENT_INDEX_PATH=directory)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.path = os.path.join(directory, 'recipes.ndjson')
+        Like.objects.create(user=self.viewer, recipe=self.recipe)
+        Rating.objects.create(user=self.viewer, recipe=self.recipe, rating=4)
+        Comment.objects.create(user=self.viewer, recipe=self.recipe, content='Lovely')
+
+    def test_round_trip(self):
+        call_command('export_recipes', self.path, stdout=io.StringIO())
+        with open(self.path, encoding='utf-8') as f:
+            [exported] = [json.loads(line) for line in f]
+        # The same user twice on a recipe is dropped by the unique constraints
+        exported['ratings'].append(exported['ratings'][0])
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(exported) + '\n')
+        Recipe.objects.all().delete()
+
+        stdout = io.StringIO()
+        call_command('import_recipes', self.path, stdout=stdout)
+        self.assertIn('Ratings: 1, Likes: 1, Comments: 1', stdout.getvalue())
+
+        recipe = Recipe.objects.get()
+        call_command('export_recipes', self.path, stdout=io.StringIO())
+        with open(self.path, encoding='utf-8') as f:
+            [imported] = [json.loads(line) for line in f]
+        exported['ratings'].pop()
+        self.assertEqual({**imported, 'id': None}, {**exported, 'id': None})
+
+        # Imported interactions reach trending, similar recipes and the content index
+        self.assertAlmostEqual(trending.current_scores([recipe], 'week')[recipe.pk], 4, places=3)
+        self.assertTrue(SimilarityChange.objects.filter(recipe=recipe).exists())
+        self.assertIsNotNone(content_index.get_index().vector(recipe.pk))
+
+    def test_sizes_must_be_positive(self):
+        with self.assertRaisesMessage(CommandError, '--chunk-size must be at least 1'):
+            call_command('export_recipes', self.path, chunk_size=0, stdout=io.StringIO())
+        with self.assertRaisesMessage(CommandError, '--batch-size must be at least 1'):
+            call_command('import_recipes', self.path, batch_size=0, stdout=io.StringIO())
+
+
+class SeedScaleTests(TasteStackTestCase):
+    """The synthetic dataset of ``seed_scale``"""
+
+    def seed(self, **options):
+        call_command('seed_scale', users=5, recipes=20, likes=60, follows=5, seed=1, days=7,
+                     stdout=io.StringIO(), **options)
+
+    def test_derived_state_is_rebuilt(self):
+        self.seed()
+        self.assertTrue(Recipe.objects.filter(trending_day__gt=0).exists())
+        self.assertTrue(SimilarRecipe.objects.exists())
+        self.assertFalse(SimilarityChange.objects.exists())
+        liked = Like.objects.values_list('recipe_id', flat=True).first()
+        self.assertIsNotNone(content_index.get_index().vector(liked))
+
+    def test_numbers_continue_after_deleted_users(self):
+        self.seed()
+        self.viewer.delete()
+        self.seed()
+        self.assertEqual(set(User.objects.filter(username__startswith='seed_user_').values_list('username', flat=True)),
+                         {f'seed_user_{number}' for number in range(10)})
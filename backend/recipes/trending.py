@@ -0,0 +1,192 @@
+"""
+Trending recipes from time-decayed likes, ratings and comments.
+
+Every interaction adds its weight (``TRENDING_WEIGHTS``) to a recipe's
+score, and every weight decays as ``exp(-age / tau)``, with one ``tau`` per
+window (``TRENDING_DECAY_SECONDS``): after a day, a like counts 1/e of a
+fresh one in the ``day`` ranking and still 87% in the ``week`` ranking.
+
+Decaying every score as time passes would mean rewriting every row. Since
+all scores decay by the same factor, they are instead stored relative to a
+shared epoch ``e`` (``TrendingEpoch``): an interaction at time ``t`` adds
+``weight * exp((t - e) / tau)``, and the ranking by stored value is the
+ranking by decayed score at any later time. The views therefore update a
+recipe with one ``UPDATE ... SET trending_day = trending_day + x``, and
+``GET /api/recipes/trending/`` reads the ``(-trending_day)`` or
+``(-trending_week)`` index. The real score is the stored one times
+``exp(-(now - e) / tau)``.
+
+Stored values grow by a factor ``e`` every ``tau``, so the
+``renormalize_trending`` command moves the epoch to the present and scales
+every score down accordingly, e.g. daily (a float overflows after about
+700 ``tau``). Should it not run, ``record()`` renormalizes itself once the
+epoch is ``TRENDING_RENORMALIZE_AFTER`` times the shortest ``tau`` old. With ``--rebuild`` it recomputes the scores from the
+interactions instead, which also drops what increments cannot see, like
+likes removed through the admin.
+
+Updates name the epoch they were computed against, so an increment racing
+with a renormalization is retried against the new epoch instead of being
+added at the wrong scale.
+"""
+
+import math
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Exists, F, FloatField, Q, Value, When
+from django.utils import timezone
+from interactions.models import Comment, Like, Rating
+from .models import Recipe, TrendingEpoch
+
+
+WINDOWS = {'day': 'trending_day', 'week': 'trending_week'}
+
+DEFAULT_DECAY_SECONDS = {'day': 86400, 'week': 7 * 86400}
+DEFAULT_WEIGHTS = {'like': 1.0, 'rating': 1.0, 'comment': 2.0}
+
+# Scores below this (relative to the epoch) are dropped by a renormalization
+NEGLIGIBLE = 1e-6
+# Decay periods after which math.exp() of them overflows a float
+MAX_PERIODS = 700
+
+Interaction = namedtuple('Interaction', 'recipe_id kind at removed', defaults=(None, False))
+Interaction.__doc__ = """A like, rating or comment added (or removed) at ``at`` (default now)"""
+
+_epoch = None  # This process' copy of TrendingEpoch.epoch
+
+
+def decay_seconds():
+    return {**DEFAULT_DECAY_SECONDS, **getattr(settings, 'TRENDING_DECAY_SECONDS', {})}
+
+
+def weights():
+    return {**DEFAULT_WEIGHTS, **getattr(settings, 'TRENDING_WEIGHTS', {})}
+
+
+def renormalize_after():
+    """Epoch age in seconds past which ``record()`` renormalizes first"""
+    return getattr(settings, 'TRENDING_RENORMALIZE_AFTER', 30) * min(decay_seconds().values())
+
+
+def get_epoch(refresh=False):
+    global _epoch
+    if _epoch is None or refresh:
+        _epoch = TrendingEpoch.objects.values_list('epoch', flat=True).get(pk=1)
+    return _epoch
+
+
+def contributions(interactions, epoch):
+    """Recipe id -> {column: amount to add} for ``interactions``, relative to ``epoch``"""
+    now = timezone.now()
+    taus = decay_seconds()
+    kind_weights = weights()
+    totals = defaultdict(lambda: dict.fromkeys(WINDOWS.values(), 0.0))
+    for interaction in interactions:
+        age = ((interaction.at or now) - epoch).total_seconds()
+        weight = -kind_weights[interaction.kind] if interaction.removed else kind_weights[interaction.kind]
+        for window, column in WINDOWS.items():
+            totals[interaction.recipe_id][column] += weight * math.exp(age / taus[window])
+    return totals
+
+
+def record(interactions):
+    """
+    Add interactions to their recipes' trending scores, in one UPDATE.
+
+    Call it in the transaction that writes the interactions; removals should
+    pass the removed row's ``created_at`` so that exactly its remaining
+    contribution is taken back.
+    """
+    if not interactions:
+        return
+    if (timezone.now() - get_epoch()).total_seconds() > renormalize_after():
+        # Another process may have renormalized already
+        if (timezone.now() - get_epoch(refresh=True)).total_seconds() > renormalize_after():
+            renormalize()
+    for refresh in (False, True):
+        epoch = get_epoch(refresh)
+        totals = contributions(interactions, epoch)
+        updates = {
+            column: F(column) + Case(
+                *[When(pk=recipe_id, then=Value(amounts[column])) for recipe_id, amounts in totals.items()],
+                default=Value(0.0), output_field=FloatField(),
+            )
+            for column in WINDOWS.values()
+        }
+        updated = Recipe.objects.filter(
+            Exists(TrendingEpoch.objects.filter(pk=1, epoch=epoch)), pk__in=list(totals),
+        ).update(**updates)
+        # Nothing updated: the epoch moved (or the recipes are gone)
+        if updated or refresh:
+            return
+
+
+def current_scores(recipes, window):
+    """Decayed scores, recipe id -> score, of recipes loaded with their trending columns"""
+    column = WINDOWS[window]
+    factor = math.exp(-(timezone.now() - get_epoch(refresh=True)).total_seconds() / decay_seconds()[window])
+    return {recipe.id: getattr(recipe, column) * factor for recipe in recipes}
+
+
+def renormalize():
+    """
+    Move the epoch to now and scale the stored scores to match.
+
+    Returns:
+        int: Number of recipes with a score
+    """
+    taus = decay_seconds()
+    with transaction.atomic():
+        row = TrendingEpoch.objects.select_for_update().get(pk=1)
+        now = timezone.now()
+        elapsed = (now - row.epoch).total_seconds()
+        updates = {}
+        for window, column in WINDOWS.items():
+            periods = elapsed / taus[window]
+            if periods > MAX_PERIODS:
+                # Every score has decayed away
+                updates[column] = Value(0.0)
+                continue
+            scaled = F(column) * Value(math.exp(-periods))
+            updates[column] = Case(When(Q(**{f'{column}__lt': NEGLIGIBLE * math.exp(periods)}),
+                                        then=Value(0.0)),
+                                   default=scaled, output_field=FloatField())
+        count = Recipe.objects.filter(~Q(trending_day=0) | ~Q(trending_week=0)).update(**updates)
+        row.epoch = now
+        row.save(update_fields=['epoch'])
+    get_epoch(refresh=True)
+    return count
+
+
+def rebuild():
+    """
+    Recompute every score from the likes, ratings and visible comments of
+    the last ``TRENDING_REBUILD_HORIZON`` week windows, relative to a new epoch.
+
+    Returns:
+        int: Number of recipes with a score
+    """
+    horizon = getattr(settings, 'TRENDING_REBUILD_HORIZON', 10) * decay_seconds()['week']
+    with transaction.atomic():
+        row = TrendingEpoch.objects.select_for_update().get(pk=1)
+        row.epoch = timezone.now()
+        since = row.epoch - timedelta(seconds=horizon)
+        interactions = [
+            *(Interaction(recipe_id, 'like', at) for recipe_id, at in
+              Like.objects.filter(created_at__gte=since).values_list('recipe_id', 'created_at').iterator()),
+            *(Interaction(recipe_id, 'rating', at) for recipe_id, at in
+              Rating.objects.filter(created_at__gte=since).values_list('recipe_id', 'created_at').iterator()),
+            *(Interaction(recipe_id, 'comment', at) for recipe_id, at in
+              Comment.objects.filter(created_at__gte=since, hidden=False)
+              .values_list('recipe_id', 'created_at').iterator()),
+        ]
+        totals = contributions(interactions, row.epoch)
+
+        Recipe.objects.filter(~Q(trending_day=0) | ~Q(trending_week=0)).update(trending_day=0, trending_week=0)
+        recipes = [Recipe(pk=recipe_id, **amounts) for recipe_id, amounts in totals.items()]
+        Recipe.objects.bulk_update(recipes, list(WINDOWS.values()), batch_size=500)
+        row.save(update_fields=['epoch'])
+    get_epoch(refresh=True)
+    return len(totals)
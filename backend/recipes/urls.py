@@ -1,11 +1,22 @@
 from django.urls import path
-from .views.main import RecipeListCreateView, RecipeDetailView, rate_recipe, search_recipes, my_recipes
+from .views.main import RecipeListCreateView, recipe_detail, rate_recipe, search_recipes, my_recipes
 from .views.stats import platform_statistics
+from .views.batch import recipes_batch
+from .views.similar import similar_recipes
+from .views.ranking import trending_recipes
+from .views.gallery import recipe_images, upload_recipe_images, reorder_recipe_images, delete_recipe_image
 
 urlpatterns = [
     path('', RecipeListCreateView.as_view(), name='recipe-list-create'),
-    path('<int:pk>/', RecipeDetailView.as_view(), name='recipe-detail'),
+    path('<int:pk>/', recipe_detail, name='recipe-detail'),
     path('<int:pk>/rate/', rate_recipe, name='rate-recipe'),
+    path('<int:pk>/similar/', similar_recipes, name='similar-recipes'),
+    path('<int:pk>/images/', recipe_images, name='recipe-images'),
+    path('<int:pk>/images/upload/', upload_recipe_images, name='upload-recipe-images'),
+    path('<int:pk>/images/reorder/', reorder_recipe_images, name='reorder-recipe-images'),
+    path('<int:pk>/images/<int:image_id>/delete/', delete_recipe_image, name='delete-recipe-image'),
+    path('batch/', recipes_batch, name='recipes-batch'),
+    path('trending/', trending_recipes, name='trending-recipes'),
     path('search/', search_recipes, name='search-recipes'),
     path('my-recipes/', my_recipes, name='my-recipes'),
     path('statistics/', platform_statistics, name='platform-statistics'),
@@ -0,0 +1,71 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from django.conf import settings
+from ..models import Recipe
+from ..serializers import RecipeSerializer, get_viewer_context
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def recipes_batch(request):
+    """
+    Fetch many recipes by id in one request.
+
+    ``GET /api/recipes/batch/?ids=3,1,2&fields=id,title,likes_count``
+
+    All recipes are loaded with a single ``in_bulk`` plus one query per
+    prefetch and viewer lookup, regardless of how many ids are requested.
+    Results keep the order of ``ids``; ids that do not exist are listed in
+    ``missing``.
+    """
+    raw_ids = request.GET.get('ids', '')
+    try:
+        ids = [int(value) for value in raw_ids.split(',') if value.strip()]
+    except ValueError:
+        return Response({'error': 'ids must be a comma-separated list of integers'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    # Drop duplicates but keep the requested order
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        return Response({'error': 'ids is required'}, status=status.HTTP_400_BAD_REQUEST)
+
+    max_ids = getattr(settings, 'RECIPE_BATCH_MAX_IDS', 100)
+    if len(ids) > max_ids:
+        return Response({'error': f'At most {max_ids} ids can be requested at once'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    fields = None
+    requested_fields = request.GET.get('fields')
+    if requested_fields:
+        fields = [field.strip() for field in requested_fields.split(',') if field.strip()]
+        unknown = sorted(set(fields) - set(RecipeSerializer.Meta.fields))
+        if unknown:
+            return Response({'error': f'Unknown fields: {", ".join(unknown)}'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+    def wants(field_name):
+        return fields is None or field_name in fields
+
+    queryset = Recipe.objects.all()
+    if wants('author'):
+        queryset = queryset.select_related('author')
+    if wants('images'):
+        queryset = queryset.prefetch_related('images')
+    if wants('likes_count') or wants('average_rating'):
+        queryset = queryset.with_stats()
+
+    recipes = queryset.in_bulk(ids)
+    found = [recipes[recipe_id] for recipe_id in ids if recipe_id in recipes]
+
+    context = {'request': request}
+    if wants('is_liked') or wants('user_rating'):
+        context.update(get_viewer_context(request, list(recipes)))
+
+    serializer = RecipeSerializer(found, many=True, context=context, fields=fields)
+    return Response({
+        'results': serializer.data,
+        'missing': [recipe_id for recipe_id in ids if recipe_id not in recipes],
+    })
@@ -0,0 +1,202 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.response import Response
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from ..images import generate_thumbnails
+from ..models import Recipe, RecipeImage
+from ..serializers import RecipeImageSerializer, RecipeImageUploadSerializer
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def recipe_images(request, pk):
+    """List a recipe's gallery images in display order"""
+    if not Recipe.objects.filter(pk=pk).exists():
+        return Response({'error': 'Recipe not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    images = RecipeImage.objects.filter(recipe_id=pk)
+    serializer = RecipeImageSerializer(images, many=True, context={'request': request})
+    return Response(serializer.data)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_recipe_images(request, pk):
+    """
+    Upload several gallery images in one multipart request.
+
+    Every file under the ``images`` key is validated on its own, thumbnails
+    are generated in parallel and all valid images are inserted with a single
+    ``bulk_create``. The response lists the outcome of each file in the order
+    it was sent.
+    """
+    try:
+        recipe = Recipe.objects.get(pk=pk)
+    except Recipe.DoesNotExist:
+        return Response({'error': 'Recipe not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    # Check if user is the author of the recipe
+    if recipe.author_id != request.user.id:
+        return Response(
+            {'error': 'You do not have permission to add images to this recipe'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    files = request.FILES.getlist('images')
+    if not files:
+        return Response({'error': 'No images were uploaded'}, status=status.HTTP_400_BAD_REQUEST)
+
+    max_uploads = getattr(settings, 'RECIPE_GALLERY_MAX_UPLOADS', 10)
+    if len(files) > max_uploads:
+        return Response(
+            {'error': f'You can upload at most {max_uploads} images at once'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    results = [None] * len(files)
+    valid = []
+    for index, uploaded_file in enumerate(files):
+        serializer = RecipeImageUploadSerializer(data={'image': uploaded_file})
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data['image']))
+        else:
+            results[index] = {
+                'index': index,
+                'filename': uploaded_file.name,
+                'status': 'error',
+                'errors': serializer.errors['image'],
+            }
+
+    thumbnails = generate_thumbnails([image for _, image in valid])
+
+    with transaction.atomic():
+        # Lock the recipe row so concurrent uploads get distinct positions
+        Recipe.objects.select_for_update().filter(pk=recipe.pk).first()
+        last_position = recipe.images.aggregate(last=Max('position'))['last']
+        next_position = 0 if last_position is None else last_position + 1
+
+        new_images = []
+        created_indexes = []
+        for (index, image), thumbnail in zip(valid, thumbnails):
+            if isinstance(thumbnail, Exception):
+                results[index] = {
+                    'index': index,
+                    'filename': image.name,
+                    'status': 'error',
+                    'errors': ['Could not process this image.'],
+                }
+                continue
+            new_images.append(RecipeImage(
+                recipe=recipe,
+                image=image,
+                thumbnail=thumbnail,
+                position=next_position,
+            ))
+            created_indexes.append(index)
+            next_position += 1
+
+        created = RecipeImage.objects.bulk_create(new_images)
+
+    for index, recipe_image in zip(created_indexes, created):
+        results[index] = {
+            'index': index,
+            'filename': files[index].name,
+            'status': 'created',
+            'image': RecipeImageSerializer(recipe_image, context={'request': request}).data,
+        }
+
+    created_count = len(created)
+    failed_count = len(files) - created_count
+    if failed_count == 0:
+        response_status = status.HTTP_201_CREATED
+    elif created_count == 0:
+        response_status = status.HTTP_400_BAD_REQUEST
+    else:
+        response_status = status.HTTP_207_MULTI_STATUS
+
+    return Response({
+        'results': results,
+        'created': created_count,
+        'failed': failed_count,
+    }, status=response_status)
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def reorder_recipe_images(request, pk):
+    """
+    Reorder a recipe's gallery.
+
+    Expects ``{"order": [image_id, ...]}``. Listed images come first in the
+    given order; any images not listed keep their relative order after them.
+    """
+    try:
+        recipe = Recipe.objects.get(pk=pk)
+    except Recipe.DoesNotExist:
+        return Response({'error': 'Recipe not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    if recipe.author_id != request.user.id:
+        return Response(
+            {'error': 'You do not have permission to reorder images of this recipe'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    order = request.data.get('order')
+    if not isinstance(order, list):
+        return Response({'error': 'order must be a list of image ids'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        order = [int(image_id) for image_id in order]
+    except (TypeError, ValueError):
+        return Response({'error': 'order must be a list of image ids'}, status=status.HTTP_400_BAD_REQUEST)
+
+    with transaction.atomic():
+        images = {image.id: image for image in recipe.images.select_for_update()}
+
+        unknown_ids = [image_id for image_id in order if image_id not in images]
+        if unknown_ids:
+            return Response(
+                {'error': 'Some images do not belong to this recipe', 'unknown_ids': unknown_ids},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        ordered_ids = list(dict.fromkeys(order))
+        listed = set(ordered_ids)
+        remaining = sorted(
+            (image for image_id, image in images.items() if image_id not in listed),
+            key=lambda image: (image.position, image.uploaded_at)
+        )
+        ordered = [images[image_id] for image_id in ordered_ids] + remaining
+
+        changed = []
+        for position, image in enumerate(ordered):
+            if image.position != position:
+                image.position = position
+                changed.append(image)
+        RecipeImage.objects.bulk_update(changed, ['position'])
+
+    serializer = RecipeImageSerializer(ordered, many=True, context={'request': request})
+    return Response(serializer.data)
+
+
+@api_view(['DELETE'])
+@permission_classes([IsAuthenticated])
+def delete_recipe_image(request, pk, image_id):
+    try:
+        image = RecipeImage.objects.select_related('recipe').get(pk=image_id, recipe_id=pk)
+    except RecipeImage.DoesNotExist:
+        return Response({'error': 'Image not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    if image.recipe.author_id != request.user.id:
+        return Response(
+            {'error': 'You do not have permission to delete this image'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    image.image.delete(save=False)
+    if image.thumbnail:
+        image.thumbnail.delete(save=False)
+    image.delete()
+    return Response({'message': 'Image deleted successfully'}, status=status.HTTP_204_NO_CONTENT)
@@ -1,13 +1,22 @@
+import asyncio
 from rest_framework import generics, status, filters
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
-from django.db import models
+from django.db import models, transaction
 from django_filters.rest_framework import DjangoFilterBackend
+from ..content_index import index_recipe
 from ..models import Recipe
-from ..serializers import RecipeSerializer, RecipeCreateSerializer, RecipeUpdateSerializer
+from ..recommendations import mark_changed
+from .. import trending
+from ..trending import Interaction
+from ..search import plan_search
+from ..serializers import RecipeSerializer, RecipeCreateSerializer, RecipeUpdateSerializer, aget_viewer_context
 from interactions.models import Rating
+from interactions.events import publish_recipe_activity
 from interactions.serializers import RatingSerializer
+from tastestack.async_api import alist, async_api_view, json_response
+from tastestack.ratelimit import rate_limit
 
 
 class RecipeListCreateView(generics.ListCreateAPIView):
@@ -17,7 +26,7 @@ class RecipeListCreateView(generics.ListCreateAPIView):
     filterset_fields = ['difficulty']
     
     def get_queryset(self):
-        queryset = Recipe.objects.select_related('author').all()
+        queryset = Recipe.objects.select_related('author').prefetch_related('images').with_stats()
         
         # Category filter
         category = self.request.query_params.get('category', None)
@@ -64,11 +73,8 @@ class RecipeListCreateView(generics.ListCreateAPIView):
         if min_rating:
             try:
                 min_rating_float = float(min_rating)
-                # Filter recipes with average rating >= min_rating
-                from django.db.models import Avg
-                queryset = queryset.annotate(
-                    avg_rating=Avg('ratings__rating')
-                ).filter(avg_rating__gte=min_rating_float)
+                # Filter recipes with average rating >= min_rating (annotated by with_stats)
+                queryset = queryset.filter(avg_rating__gte=min_rating_float)
             except ValueError:
                 pass
         
@@ -88,11 +94,12 @@ class RecipeListCreateView(generics.ListCreateAPIView):
         return [AllowAny()]
     
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        transaction.on_commit(lambda: index_recipe(recipe))
 
 
 class RecipeDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Recipe.objects.select_related('author').all()
+    queryset = Recipe.objects.select_related('author').prefetch_related('images').with_stats()
     serializer_class = RecipeSerializer
     permission_classes = [AllowAny]
     
@@ -117,6 +124,10 @@ class RecipeDetailView(generics.RetrieveUpdateDestroyAPIView):
         self.perform_update(serializer)
         
         return Response(serializer.data)
+
+    def perform_update(self, serializer):
+        recipe = serializer.save()
+        transaction.on_commit(lambda: index_recipe(recipe))
     
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -132,6 +143,21 @@ class RecipeDetailView(generics.RetrieveUpdateDestroyAPIView):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+@async_api_view(['GET'], permission_classes=[AllowAny], sync_view=RecipeDetailView.as_view())
+async def recipe_detail(request, pk):
+    """Serve GET on the async ORM; updates and deletes go to RecipeDetailView"""
+    try:
+        recipe, viewer_context = await asyncio.gather(
+            RecipeDetailView.queryset.aget(pk=pk),
+            aget_viewer_context(request.user, [pk]),
+        )
+    except Recipe.DoesNotExist:
+        return json_response({'detail': 'No Recipe matches the given query.'}, status.HTTP_404_NOT_FOUND)
+
+    serializer = RecipeSerializer(recipe, context={'request': request, **viewer_context})
+    return json_response(serializer.data)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def rate_recipe(request, pk):
@@ -143,33 +169,48 @@ def rate_recipe(request, pk):
     serializer = RatingSerializer(data={'recipe': recipe.id, 'rating': request.data.get('rating')}, 
                                  context={'request': request})
     if serializer.is_valid():
-        serializer.save()
+        rating = serializer.save()
+        if serializer.created:
+            trending.record([Interaction(recipe.id, 'rating', rating.created_at)])
+        mark_changed([recipe.id])
+        publish_recipe_activity(request.user, {recipe.id: {'type': 'rating', 'rating': rating.rating}})
         # Return updated recipe with new average rating
         recipe_serializer = RecipeSerializer(recipe)
         return Response(recipe_serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-@api_view(['GET'])
-def search_recipes(request):
-    query = request.GET.get('q', '')
-    if query:
-        recipes = Recipe.objects.select_related('author').filter(
-            models.Q(title__icontains=query) |
-            models.Q(description__icontains=query) |
-            models.Q(ingredients__icontains=query)
-        ).distinct()
-    else:
-        recipes = Recipe.objects.select_related('author').all()
-    
+MAX_SEARCH_PAGE_SIZE = 100
+
+
+def _positive_int(value, default):
+    try:
+        return max(int(value), 1)
+    except (TypeError, ValueError):
+        return default
+
+
+@rate_limit('search')
+@async_api_view(['GET'])
+async def search_recipes(request):
+    # Bounded predicates for q; see recipes/search.py
+    plan = plan_search(request.GET.get('q', ''))
+    recipes = Recipe.objects.select_related('author').filter(plan.filter())
+    recipes = recipes.prefetch_related('images').with_stats().order_by('-created_at', '-id')
+
     # Apply pagination
-    page = request.GET.get('page', 1)
-    page_size = request.GET.get('page_size', 12)
-    
-    serializer = RecipeSerializer(recipes, many=True)
-    return Response({
+    page = _positive_int(request.GET.get('page'), 1)
+    page_size = min(_positive_int(request.GET.get('page_size'), 12), MAX_SEARCH_PAGE_SIZE)
+    offset = (page - 1) * page_size
+
+    results, count = await asyncio.gather(alist(recipes[offset:offset + page_size]), recipes.acount())
+    serializer = RecipeSerializer(results, many=True)
+    return json_response({
         'results': serializer.data,
-        'count': recipes.count(),
+        'count': count,
+        'page': page,
+        'page_size': page_size,
+        'plan': plan.as_dict(),
     })
 
 
@@ -178,7 +219,9 @@ def search_recipes(request):
 def my_recipes(request):
     """Get current user's recipes"""
     user = request.user
-    recipes = Recipe.objects.select_related('author').filter(author=user).order_by('-created_at')
+    recipes = Recipe.objects.select_related('author').prefetch_related('images').with_stats().filter(
+        author=user
+    ).order_by('-created_at')
     
     # Apply pagination
     page = request.GET.get('page', 1)
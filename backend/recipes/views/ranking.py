@@ -0,0 +1,42 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from django.conf import settings
+from .. import trending
+from ..models import Recipe
+from ..serializers import RecipeSerializer
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def trending_recipes(request):
+    """
+    Recipes with the most recent likes, ratings and comments.
+
+    ``GET /api/recipes/trending/?window=week&limit=20``
+
+    ``window`` is ``day`` (the default) or ``week``: how fast interactions
+    fade. Recipes come from the index on their stored trending score, best
+    first, with ``trending_score`` decayed to now.
+    """
+    window = request.GET.get('window', 'day')
+    if window not in trending.WINDOWS:
+        return Response({'error': f'window must be one of: {", ".join(trending.WINDOWS)}'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    max_limit = getattr(settings, 'TRENDING_MAX_LIMIT', 50)
+    try:
+        limit = min(max(int(request.GET.get('limit', 20)), 1), max_limit)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    column = trending.WINDOWS[window]
+    recipes = list(
+        Recipe.objects.filter(**{f'{column}__gt': 0}).order_by(f'-{column}', 'id')
+        .select_related('author').prefetch_related('images').with_stats()[:limit]
+    )
+    scores = trending.current_scores(recipes, window)
+    serializer = RecipeSerializer(recipes, many=True, context={'request': request})
+    results = [{**data, 'trending_score': round(scores[recipe.id], 4)}
+               for recipe, data in zip(recipes, serializer.data)]
+    return Response({'window': window, 'results': results})
@@ -0,0 +1,56 @@
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from django.conf import settings
+from .. import content_index
+from ..models import Recipe, SimilarRecipe
+from ..serializers import RecipeSerializer
+
+
+SIMILAR_FIELDS = ['id', 'title', 'image', 'category', 'difficulty', 'prep_time', 'cook_time', 'author']
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def similar_recipes(request, pk):
+    """
+    Recipes liked and rated by the same users as this one, best first,
+    followed by recipes with similar text when there are not enough of those.
+
+    ``GET /api/recipes/<id>/similar/?limit=10``
+
+    Reads the neighbours stored by ``refresh_similar_recipes`` with one
+    index range scan; content neighbours (``source: content``) come from the
+    memory-mapped TF-IDF index and cost one more query to load. A recipe
+    without any neighbours costs one more query to tell it apart from a
+    missing recipe.
+    """
+    max_limit = getattr(settings, 'SIMILAR_RECIPES_TOP_K', 20)
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), max_limit)
+    except ValueError:
+        return Response({'error': 'limit must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+
+    entries = list(SimilarRecipe.objects.filter(recipe_id=pk).select_related('similar__author')
+                   .order_by('-score', 'similar_id')[:limit])
+    neighbours = [(entry.similar, entry.score, 'likes') for entry in entries]
+
+    if len(neighbours) < limit:
+        seen = {entry.similar_id for entry in entries}
+        # Extra candidates make up for recipes already listed or deleted since indexing
+        scores = [(recipe_id, score) for recipe_id, score in content_index.nearest(pk, 2 * limit)
+                  if recipe_id not in seen]
+        if scores:
+            recipes = Recipe.objects.select_related('author').in_bulk([recipe_id for recipe_id, _ in scores])
+            neighbours += [(recipes[recipe_id], score, 'content')
+                           for recipe_id, score in scores if recipe_id in recipes][:limit - len(neighbours)]
+
+    if not neighbours and not Recipe.objects.filter(pk=pk).exists():
+        return Response({'error': 'Recipe not found'}, status=status.HTTP_404_NOT_FOUND)
+
+    serializer = RecipeSerializer([recipe for recipe, _, _ in neighbours], many=True,
+                                  context={'request': request}, fields=SIMILAR_FIELDS)
+    results = [{**data, 'score': round(score, 4), 'source': source}
+               for (_, score, source), data in zip(neighbours, serializer.data)]
+    return Response({'results': results})
@@ -0,0 +1,126 @@
+"""
+Helpers for async API views.
+
+DRF views are synchronous, so the async read endpoints are plain Django
+async views. ``async_api_view`` gives them what ``@api_view`` gives the
+rest of the API: the configured authentication classes (with
+``APIClient.force_authenticate()`` support), permission classes, JSON error
+responses in DRF's format and ``405`` for other methods. Responses are rendered with the
+renderer DRF uses for JSON, so clients see the same payloads as before.
+
+Inside an async view, use only the async ORM (``aget``, ``acount``,
+``async for``...); serializers must be given fully loaded objects, because a
+lazy query from the event loop raises ``SynchronousOnlyOperation``.
+"""
+
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+from .metrics import TimedJSONRenderer
+
+
+def _authenticate(request):
+    """Run the configured authentication classes, like DRF's ``Request``"""
+    if hasattr(request, '_force_auth_user') or hasattr(request, '_force_auth_token'):
+        return getattr(request, '_force_auth_user', None)
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        result = authentication_class().authenticate(request)
+        if result is not None:
+            return result[0]
+    return None
+
+
+async def authenticate(request):
+    """
+    Resolve the user of a request without blocking the event loop.
+
+    Returns:
+        The authenticated user, or None for an anonymous request
+
+    Raises:
+        AuthenticationFailed: The request carries an invalid token
+    """
+    return await sync_to_async(_authenticate)(request)
+
+
+def json_response(data, status=200, headers=None):
+    """Render ``data`` as a DRF JSON response would be"""
+    return HttpResponse(
+        TimedJSONRenderer().render(data),
+        status=status,
+        content_type='application/json',
+        headers=headers,
+    )
+
+
+def error_response(exc):
+    """Response for an ``APIException``, as DRF's exception handler builds it"""
+    data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    headers = {}
+    if exc.status_code == 401:
+        authenticators = api_settings.DEFAULT_AUTHENTICATION_CLASSES
+        if authenticators:
+            headers['WWW-Authenticate'] = authenticators[0]().authenticate_header(None)
+    return json_response(data, exc.status_code, headers)
+
+
+async def alist(queryset):
+    """Evaluate a queryset with the async ORM"""
+    return [obj async for obj in queryset]
+
+
+def check_permissions(request, permission_classes):
+    """Raise like ``APIView.check_permissions()`` if a permission is denied"""
+    for permission_class in permission_classes:
+        permission = permission_class()
+        if not permission.has_permission(request, None):
+            if not request.user.is_authenticated:
+                raise exceptions.NotAuthenticated()
+            raise exceptions.PermissionDenied(getattr(permission, 'message', None))
+
+
+def async_api_view(http_method_names=('GET',), permission_classes=None, sync_view=None):
+    """
+    Decorator turning an ``async def`` function into an API view.
+
+    ``request.user`` is set to the authenticated user (or ``AnonymousUser``)
+    and the permissions are checked before the view runs.
+
+    Args:
+        http_method_names: Methods served by the async view; ``HEAD`` is
+            served with ``GET``
+        permission_classes: Permission classes, defaulting to
+            ``DEFAULT_PERMISSION_CLASSES`` like ``@api_view``
+        sync_view: Optional sync view that handles every other method, e.g.
+            the DRF view that still serves writes on the same URL
+    """
+    allowed = {method.upper() for method in http_method_names}
+    if 'GET' in allowed:
+        allowed.add('HEAD')
+    fallback = sync_to_async(sync_view) if sync_view is not None else None
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapped(request, *args, **kwargs):
+            if request.method not in allowed:
+                if fallback is not None:
+                    return await fallback(request, *args, **kwargs)
+                response = error_response(exceptions.MethodNotAllowed(request.method))
+                response['Allow'] = ', '.join(sorted(allowed))
+                return response
+            try:
+                request.user = await authenticate(request) or AnonymousUser()
+                check_permissions(request, permission_classes if permission_classes is not None
+                                  else api_settings.DEFAULT_PERMISSION_CLASSES)
+                return await view(request, *args, **kwargs)
+            except Http404 as exc:
+                return error_response(exceptions.NotFound(*exc.args))
+            except exceptions.APIException as exc:
+                return error_response(exc)
+        return csrf_exempt(wrapped)
+    return decorator
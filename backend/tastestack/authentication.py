@@ -0,0 +1,129 @@
+"""
+JWT authentication without a user query on every request.
+
+``JWTAuthentication`` loads the user row for every authenticated request,
+even when the view only needs the user's id. ``CachedJWTAuthentication``
+keeps a snapshot of that row in the Django cache under the token's ``jti``
+for ``AUTH_USER_CACHE_SECONDS``, so only the first request made with a
+token reads the users table.
+
+The snapshot leaves out the password hash: the user built from it loads the
+password lazily if a view needs it, and saving that user writes only the
+loaded fields. Views that change a user call ``invalidate_cached_user()``,
+which bumps a per-user version stored next to the snapshots so that every
+token of that user reloads the row. Other changes (e.g. through the admin)
+are picked up when the snapshot expires. Use a shared cache backend with
+several worker processes, like the replica pins do.
+
+``TokenUserAuthentication`` skips the user entirely and returns a
+``TokenUser`` that only knows the id in the token; enable it with
+``@authentication_classes`` on views that only filter by the user's id.
+"""
+
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import router
+from rest_framework_simplejwt.authentication import JWTAuthentication, JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from .metrics import record_cache_hit, record_cache_miss
+
+
+def _entry_key(jti):
+    return f'auth-user:{jti}'
+
+
+def _version_key(user_id):
+    return f'auth-user-version:{user_id}'
+
+
+def _cache_seconds():
+    return getattr(settings, 'AUTH_USER_CACHE_SECONDS', 60)
+
+
+def _snapshot_fields():
+    return [field.attname for field in get_user_model()._meta.concrete_fields if field.attname != 'password']
+
+
+def token_user_id(request):
+    """
+    User id of the request's valid bearer token, or None.
+
+    For middleware that needs the user before DRF authenticates the request;
+    the result is kept on the request, so the token is only decoded once.
+    """
+    if not hasattr(request, '_token_user_id'):
+        user_id = None
+        parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+        if len(parts) == 2 and parts[0] == 'Bearer':
+            try:
+                user_id = AccessToken(parts[1]).get(api_settings.USER_ID_CLAIM)
+            except TokenError:
+                pass
+        request._token_user_id = user_id
+    return request._token_user_id
+
+
+def invalidate_cached_user(user):
+    """Make every token of ``user`` reload the user row on its next request"""
+    user_id = getattr(user, api_settings.USER_ID_FIELD)
+    cache.set(_version_key(user_id), uuid.uuid4().hex, _cache_seconds())
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    ``JWTAuthentication`` resolving each token's user from the cache.
+
+    Settings:
+        AUTH_USER_CACHE_SECONDS: How long a token's user snapshot is kept;
+            0 loads the user on every request (default 60)
+    """
+
+    def get_user(self, validated_token):
+        timeout = _cache_seconds()
+        jti = validated_token.get(api_settings.JTI_CLAIM)
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        if not timeout or jti is None or user_id is None:
+            return super().get_user(validated_token)
+
+        entry_key, version_key = _entry_key(jti), _version_key(user_id)
+        cached = cache.get_many([entry_key, version_key])
+        version = cached.get(version_key)
+        entry = cached.get(entry_key)
+        if entry is not None and entry['version'] == version:
+            record_cache_hit()
+            # A user bound to its database saves only the loaded fields (see Model.save())
+            user = self.user_model.from_db(router.db_for_read(self.user_model), _snapshot_fields(), entry['values'])
+            return self.check_user(user, entry['password_hash'], validated_token)
+
+        record_cache_miss()
+        user = super().get_user(validated_token)
+        cache.set(entry_key, {
+            'version': version,
+            # Raw values as loaded (file fields still hold their name, not a FieldFile)
+            'values': [user.__dict__[name] for name in _snapshot_fields()],
+            'password_hash': get_md5_hash_password(user.password) if api_settings.CHECK_REVOKE_TOKEN else None,
+        }, timeout)
+        return user
+
+    def check_user(self, user, password_hash, validated_token):
+        """The checks ``JWTAuthentication.get_user()`` runs on a loaded user"""
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != password_hash:
+            raise AuthenticationFailed("The user's password has been changed.", code='password_changed')
+        return user
+
+
+class TokenUserAuthentication(JWTStatelessUserAuthentication):
+    """
+    Authenticate as a ``TokenUser`` built from the token alone.
+
+    ``request.user`` is not a model instance: filter with ``user_id=request.user.id``,
+    not ``user=request.user``. Inactive users keep access until their token expires.
+    """
@@ -0,0 +1,253 @@
+"""
+Database latency and throughput probes used by ``checkdb --benchmark``.
+
+Every probe returns the same shape (operation count, operations per second
+and p50/p95/p99/max latency in milliseconds), so reports taken on SQLite, a
+local PostgreSQL and a managed PostgreSQL can be compared side by side.
+Inserts run inside a transaction that is rolled back, so the benchmark
+leaves no rows behind.
+"""
+
+import random
+import time
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.test import Client
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from accounts.models import User
+from recipes.models import Recipe
+from interactions.models import Comment
+from .queries import instrument_queries
+from .stats import percentile
+
+
+# Searched for when the hot recipe's title has no word to search for
+FALLBACK_SEARCH_TERM = 'chicken'
+
+
+class _Rollback(Exception):
+    pass
+
+
+def summarize(durations, wall_time=None):
+    """Summarize a list of per-operation durations in seconds"""
+    values = sorted(durations)
+    if not values:
+        return {'operations': 0}
+    wall_time = wall_time if wall_time is not None else sum(values)
+    return {
+        'operations': len(values),
+        'ops_per_s': round(len(values) / wall_time, 1) if wall_time else None,
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3),
+    }
+
+
+def _timed(operation, iterations):
+    durations = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        op_started = time.perf_counter()
+        operation()
+        durations.append(time.perf_counter() - op_started)
+    return summarize(durations, time.perf_counter() - started)
+
+
+def connect_latency(alias, samples):
+    connection = connections[alias]
+    durations = []
+    for _ in range(samples):
+        connection.close()
+        started = time.perf_counter()
+        connection.ensure_connection()
+        durations.append(time.perf_counter() - started)
+    return summarize(durations)
+
+
+def round_trip(alias, iterations):
+    connection = connections[alias]
+    connection.ensure_connection()
+
+    def select_one():
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+    return _timed(select_one, iterations)
+
+
+def point_lookups(alias, recipe_ids, iterations, rng):
+    queryset = Recipe.objects.using(alias)
+    return _timed(lambda: queryset.get(pk=rng.choice(recipe_ids)), iterations)
+
+
+def range_scans(alias, recipe_count, iterations, rng, page_size=50):
+    queryset = Recipe.objects.using(alias).order_by('-created_at')
+
+    def scan():
+        offset = rng.randrange(max(1, recipe_count - page_size))
+        list(queryset[offset:offset + page_size])
+    return _timed(scan, iterations)
+
+
+def inserts(alias, user_id, recipe_ids, rows, rng):
+    """Single-row and bulk insert throughput of comments, rolled back afterwards"""
+    results = {}
+    try:
+        with transaction.atomic(using=alias):
+            manager = Comment.objects.using(alias)
+            results['insert_single'] = _timed(
+                lambda: manager.create(user_id=user_id, recipe_id=rng.choice(recipe_ids), content='benchmark'),
+                rows,
+            )
+            batch = [Comment(user_id=user_id, recipe_id=rng.choice(recipe_ids), content='benchmark')
+                     for _ in range(rows)]
+            started = time.perf_counter()
+            manager.bulk_create(batch, batch_size=500)
+            elapsed = time.perf_counter() - started
+            results['insert_bulk'] = {
+                'operations': rows,
+                'ops_per_s': round(rows / elapsed, 1) if elapsed else None,
+                'total_ms': round(elapsed * 1000, 3),
+            }
+            raise _Rollback
+    except _Rollback:
+        pass
+    return results
+
+
+class StatementRecorder:
+    """``connection.execute_wrapper`` keeping the SELECT statements a view runs"""
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip()[:6].upper() == 'SELECT':
+            self.statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def view_paths(recipe_id, user_id, search_term):
+    """The read endpoints whose queries are replayed"""
+    return {
+        'recipe_list': '/api/recipes/',
+        'recipe_detail': f'/api/recipes/{recipe_id}/',
+        'search': f'/api/recipes/search/?q={search_term}',
+        'statistics': '/api/recipes/statistics/',
+        'comments': f'/api/interactions/recipes/{recipe_id}/comments/',
+        'public_profile': f'/api/auth/profile/{user_id}/',
+        'dashboard': '/api/auth/dashboard-stats/',
+    }
+
+
+def request_host():
+    """A host that ``ALLOWED_HOSTS`` accepts, for the replayed requests"""
+    for host in settings.ALLOWED_HOSTS:
+        # '.example.com' allows example.com and its subdomains
+        host = host.lstrip('.')
+        if host and host != '*':
+            return host
+    return 'localhost'
+
+
+def record_view_queries(user, paths):
+    """
+    Call each view once and collect the SELECT statements it ran.
+
+    Returns:
+        tuple: View name -> statements, and view name -> status code of the
+        views that failed and are left out
+    """
+    client = Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}',
+                    HTTP_HOST=request_host())
+    recorded, failed = {}, {}
+    for name, path in paths.items():
+        with instrument_queries(StatementRecorder()) as recorder:
+            response = client.get(path)
+        if response.status_code < 400:
+            recorded[name] = recorder.statements
+        else:
+            failed[name] = response.status_code
+    return recorded, failed
+
+
+def replay(alias, statements, iterations):
+    """
+    Replay a view's statements against ``alias``.
+
+    Returns the summary of the whole set (one view's database work per
+    operation) and the slowest single statement by median.
+    """
+    connection = connections[alias]
+    per_statement = [[] for _ in statements]
+    durations = []
+    for _ in range(iterations):
+        run_started = time.perf_counter()
+        for index, (sql, params) in enumerate(statements):
+            started = time.perf_counter()
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                cursor.fetchall()
+            per_statement[index].append(time.perf_counter() - started)
+        durations.append(time.perf_counter() - run_started)
+
+    result = summarize(durations)
+    result['statements'] = len(statements)
+    if statements:
+        medians = [percentile(sorted(values), 0.5) for values in per_statement]
+        slowest = max(range(len(statements)), key=lambda index: medians[index])
+        result['slowest_statement'] = {
+            'p50_ms': round(medians[slowest] * 1000, 3),
+            'sql': statements[slowest][0][:300],
+        }
+    return result
+
+
+def run_benchmark(alias='default', iterations=200, samples=10, rows=500, replay_iterations=20, seed=None):
+    """
+    Run every probe against ``alias`` and return the results.
+
+    Lookups, scans and replays need data; run ``seed_scale`` first for
+    realistic numbers. Inserts only run against the primary.
+    """
+    rng = random.Random(seed)
+    connection = connections[alias]
+    results = {
+        'meta': {
+            'alias': alias,
+            'vendor': connection.vendor,
+            'host': connection.settings_dict.get('HOST') or None,
+            'name': str(connection.settings_dict.get('NAME')),
+            'iterations': iterations,
+            'timestamp': timezone.now().isoformat(),
+        },
+        'connect': connect_latency(alias, samples),
+        'round_trip': round_trip(alias, iterations),
+    }
+
+    recipe_ids = list(Recipe.objects.using(alias).values_list('id', flat=True)[:10000])
+    user = User.objects.using(alias).order_by('id').first()
+    results['meta']['recipes'] = Recipe.objects.using(alias).count()
+    if not recipe_ids or user is None:
+        results['skipped'] = 'No recipes or users: run python manage.py seed_scale for lookup, scan and replay probes'
+        return results
+
+    results['point_lookup'] = point_lookups(alias, recipe_ids, iterations, rng)
+    results['range_scan'] = range_scans(alias, results['meta']['recipes'], iterations, rng)
+    if alias == 'default':
+        results.update(inserts(alias, user.id, recipe_ids, rows, rng))
+
+    # The most-liked recipe and its author exercise the heaviest paths
+    hot_recipe = Recipe.objects.using(alias).with_stats().order_by('-num_likes').first()
+    words = hot_recipe.title.split()
+    search_term = words[-1].lower() if words else FALLBACK_SEARCH_TERM
+    recorded, failed = record_view_queries(user, view_paths(hot_recipe.id, hot_recipe.author_id, search_term))
+    results['replay'] = {name: replay(alias, statements, replay_iterations)
+                         for name, statements in recorded.items()}
+    if failed:
+        results['replay_failed'] = failed
+    return results
@@ -0,0 +1,170 @@
+"""
+Read replica routing for TasteStack.
+
+``ReplicaRouter`` sends writes (and migrations) to ``default`` and spreads
+reads over the replica aliases built from ``DATABASE_REPLICA_URLS``, either
+round-robin or to the replica with the fewest queries in flight in this
+process (``DATABASE_REPLICA_STRATEGY``).
+
+Reads go to the primary instead when they could observe replication lag:
+
+* for the rest of the request after a write (or of a ``routing_scope()``
+  block, e.g. in a management command)
+* for the whole of every non-GET/HEAD/OPTIONS request
+* for ``DATABASE_REPLICA_PIN_SECONDS`` after a user's successful write
+  request, so that the user sees their own changes on the next page load.
+  The pin is kept in the Django cache, so use a shared cache backend when
+  running several worker processes.
+"""
+
+import contextvars
+import itertools
+import threading
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from .authentication import token_user_id
+from .metrics import record_cache_hit, record_cache_miss
+from .middleware import WrappingMiddleware
+from .queries import instrument_queries
+
+
+PRIMARY = 'default'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# State of the current routing_scope(), shared with the threads the request's
+# queries run on (they get a copy of the context, not of the object)
+_scope = contextvars.ContextVar('db_routing_scope', default=None)
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != PRIMARY]
+
+
+class _RoutingScope:
+    __slots__ = ('primary',)
+
+    def __init__(self, primary):
+        self.primary = primary
+
+
+@contextmanager
+def routing_scope(primary=False):
+    """
+    Keep the reads of the block on the primary after its first write.
+
+    ``ReplicaPinningMiddleware`` opens one per request. Outside a scope,
+    writes do not affect the routing of later reads.
+
+    Args:
+        primary: Send every read of the block to the primary
+    """
+    token = _scope.set(_RoutingScope(primary))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def use_primary():
+    """Send the remaining reads of the current routing scope to the primary"""
+    scope = _scope.get()
+    if scope is not None:
+        scope.primary = True
+
+
+def _pin_key(user_id):
+    return f'db-primary-pin:{user_id}'
+
+
+class InFlightCounter:
+    """``connection.execute_wrapper`` counting the queries running on a replica"""
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def __call__(self, execute, sql, params, many, context):
+        with _in_flight_lock:
+            _in_flight[self.alias] = _in_flight.get(self.alias, 0) + 1
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            with _in_flight_lock:
+                _in_flight[self.alias] -= 1
+
+
+class ReplicaRouter:
+    """
+    Route reads to replicas and everything else to the primary.
+
+    Settings:
+        DATABASE_REPLICA_STRATEGY: 'round_robin' or 'least_loaded' (default 'round_robin')
+    """
+
+    def __init__(self):
+        self.replicas = replica_aliases()
+        self.strategy = getattr(settings, 'DATABASE_REPLICA_STRATEGY', 'round_robin')
+        self._cycle = itertools.cycle(self.replicas)
+        self._cycle_lock = threading.Lock()
+
+    def db_for_read(self, model, **hints):
+        scope = _scope.get()
+        if not self.replicas or (scope is not None and scope.primary):
+            return PRIMARY
+        if self.strategy == 'least_loaded':
+            with _in_flight_lock:
+                return min(self.replicas, key=lambda alias: _in_flight.get(alias, 0))
+        with self._cycle_lock:
+            return next(self._cycle)
+
+    def db_for_write(self, model, **hints):
+        use_primary()
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive schema changes through replication
+        return db == PRIMARY
+
+
+class ReplicaPinningMiddleware(WrappingMiddleware):
+    """
+    Keep reads on the primary where a replica could return stale data.
+
+    Settings:
+        DATABASE_REPLICA_PIN_SECONDS: How long a user's reads stay on the primary after a write (default 10)
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.replicas = replica_aliases()
+        self.pin_seconds = getattr(settings, 'DATABASE_REPLICA_PIN_SECONDS', 10)
+
+    def handle(self, request):
+        if not self.replicas:
+            return (yield)
+
+        user_id = token_user_id(request)
+        is_write = request.method not in SAFE_METHODS
+        pinned = is_write
+        if not pinned and user_id is not None:
+            pinned = cache.get(_pin_key(user_id)) is not None
+            if pinned:
+                record_cache_hit()
+            else:
+                record_cache_miss()
+
+        with routing_scope(pinned), ExitStack() as stack:
+            for alias in self.replicas:
+                stack.enter_context(instrument_queries(InFlightCounter(alias), aliases=[alias]))
+            response = yield
+
+        if is_write and user_id is not None and response.status_code < 400:
+            cache.set(_pin_key(user_id), True, self.pin_seconds)
+        return response
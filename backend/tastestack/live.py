@@ -0,0 +1,262 @@
+"""
+Live updates over Server-Sent Events.
+
+Views publish small JSON events to named channels (``recipe:<id>``,
+``user:<id>``) with ``publish()`` once their transaction has committed, and
+``event_stream()`` serves the events of some channels to a browser
+``EventSource``. In between sits ``broker``, an in-process pub/sub that
+hands each event to the subscribers of its channel.
+
+Subscribers are async generators waiting on a bounded queue, so an idle
+viewer costs one suspended coroutine and a timer for the next heartbeat
+comment (``LIVE_UPDATES_HEARTBEAT_SECONDS``). A viewer that does not keep up
+fills its queue (``LIVE_UPDATES_QUEUE_SIZE``); its backlog is then dropped
+and replaced by one ``resync`` event, telling the client to refetch instead
+of letting memory grow. Streams are closed after
+``LIVE_UPDATES_MAX_STREAM_SECONDS`` and the browser reconnects, which
+spreads long-lived connections over the workers.
+
+With several worker processes, set ``LIVE_UPDATES_BACKEND`` to
+``tastestack.live.RedisBackend`` so that events published in one process
+reach subscribers in all of them.
+
+Streams need ASGI: under WSGI every open stream would hold a worker thread.
+"""
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger('tastestack.live')
+
+RESYNC = 'event: resync\ndata: {}\n\n'
+HEARTBEAT = ': heartbeat\n\n'
+
+
+def format_event(event_type, data):
+    """Encode one Server-Sent Event"""
+    return f'event: {event_type}\ndata: {json.dumps(data, separators=(",", ":"), cls=DjangoJSONEncoder)}\n\n'
+
+
+class Subscription:
+    """The queue of encoded events waiting to be sent to one client"""
+
+    def __init__(self, channels, loop, max_queue):
+        self.channels = channels
+        self.loop = loop
+        self.queue = asyncio.Queue(max_queue)
+
+    def deliver(self, message):
+        """Queue a message; runs on the subscriber's event loop"""
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow client: drop the backlog and have it refetch instead
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+
+class Broker:
+    """In-process pub/sub between publishing threads and streaming coroutines"""
+
+    def __init__(self):
+        self._channels = defaultdict(set)
+        self._lock = threading.Lock()
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    backend_class = import_string(getattr(settings, 'LIVE_UPDATES_BACKEND', 'tastestack.live.LocalBackend'))
+                    backend = backend_class(self)
+                    backend.start()
+                    self._backend = backend
+        return self._backend
+
+    def has_listeners(self):
+        """Whether a published event could reach anyone, so publishers can skip building it"""
+        return not getattr(self.backend, 'local', False) or bool(self._channels)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len({subscription for subscribers in self._channels.values() for subscription in subscribers})
+
+    def subscribe(self, channels, max_queue):
+        """Subscribe the running event loop to ``channels``"""
+        self.backend  # Start listening for other processes' events
+        subscription = Subscription(tuple(channels), asyncio.get_running_loop(), max_queue)
+        with self._lock:
+            for channel in subscription.channels:
+                self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in subscription.channels:
+                subscribers = self._channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._channels[channel]
+
+    def dispatch(self, channel, message):
+        """Hand an encoded message to this process' subscribers; safe from any thread"""
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        by_loop = defaultdict(list)
+        for subscription in subscribers:
+            by_loop[subscription.loop].append(subscription)
+        for loop, group in by_loop.items():
+            try:
+                loop.call_soon_threadsafe(_deliver_all, group, message)
+            except RuntimeError:
+                # The loop has been closed; its streams are gone
+                for subscription in group:
+                    self.unsubscribe(subscription)
+
+    def publish(self, channel, event_type, data):
+        self.backend.publish(channel, format_event(event_type, data))
+
+
+def _deliver_all(subscriptions, message):
+    for subscription in subscriptions:
+        subscription.deliver(message)
+
+
+class LocalBackend:
+    """Deliver events to the subscribers of this process only"""
+
+    local = True
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def start(self):
+        pass
+
+    def publish(self, channel, message):
+        self.broker.dispatch(channel, message)
+
+
+class RedisBackend:
+    """
+    Fan events out to every process through Redis pub/sub.
+
+    Settings:
+        LIVE_UPDATES_REDIS_URL: Redis server (default redis://localhost:6379/0)
+    """
+
+    PREFIX = 'tastestack:live:'
+
+    def __init__(self, broker):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured('tastestack.live.RedisBackend requires the redis package '
+                                       '(pip install -r requirements-prod.txt)')
+        self.broker = broker
+        self.redis = redis
+        self.client = redis.Redis.from_url(getattr(settings, 'LIVE_UPDATES_REDIS_URL', 'redis://localhost:6379/0'))
+
+    def start(self):
+        threading.Thread(target=self.listen, name='tastestack-live-redis', daemon=True).start()
+
+    def publish(self, channel, message):
+        self.client.publish(self.PREFIX + channel, message)
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.PREFIX + '*')
+                for item in pubsub.listen():
+                    if item['type'] == 'pmessage':
+                        channel = item['channel'].decode()[len(self.PREFIX):]
+                        self.broker.dispatch(channel, item['data'].decode())
+            except self.redis.RedisError as e:
+                logger.warning('Live updates lost the Redis connection (%s), reconnecting', e)
+                time.sleep(1)
+
+
+broker = Broker()
+
+
+def is_enabled():
+    return getattr(settings, 'LIVE_UPDATES_ENABLED', True)
+
+
+def publish(channel, event_type, data):
+    """
+    Publish an event to the subscribers of ``channel``.
+
+    Call it once the write it reports has committed (``transaction.on_commit``).
+    Delivery is best effort: a failure is logged, never raised to the writer.
+
+    Args:
+        channel: e.g. ``recipe:12`` or ``user:3``
+        event_type: The SSE event name the client listens for
+        data: JSON-serializable payload; keep it small, it is sent to every subscriber
+    """
+    if not is_enabled():
+        return
+    try:
+        broker.publish(channel, event_type, data)
+    except Exception:
+        logger.exception('Could not publish %s event to %s', event_type, channel)
+
+
+async def _stream(channels):
+    heartbeat = getattr(settings, 'LIVE_UPDATES_HEARTBEAT_SECONDS', 15)
+    subscription = broker.subscribe(channels, getattr(settings, 'LIVE_UPDATES_QUEUE_SIZE', 100))
+    loop = subscription.loop
+    deadline = loop.time() + getattr(settings, 'LIVE_UPDATES_MAX_STREAM_SECONDS', 3600)
+    try:
+        yield f'retry: {getattr(settings, "LIVE_UPDATES_RETRY_MS", 3000)}\n' + format_event('ready', {'channels': channels})
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                yield await asyncio.wait_for(subscription.queue.get(), min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                yield HEARTBEAT
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def event_stream(request, channels):
+    """
+    Stream the events of ``channels`` as ``text/event-stream``.
+
+    Returns a 503 response instead when the process already serves
+    ``LIVE_UPDATES_MAX_SUBSCRIBERS`` streams, when live updates are disabled
+    or when the server does not run under ASGI.
+    """
+    from .async_api import json_response
+
+    if not is_enabled():
+        return json_response({'error': 'Live updates are disabled'}, 503)
+    if not isinstance(request, ASGIRequest):
+        return json_response({'error': 'Live updates require an ASGI server'}, 503)
+    if broker.subscriber_count >= getattr(settings, 'LIVE_UPDATES_MAX_SUBSCRIBERS', 10000):
+        return json_response({'error': 'Too many live update streams, retry later'}, 503, {'Retry-After': '30'})
+
+    response = StreamingHttpResponse(_stream(list(channels)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Keep nginx from buffering the stream
+    return response
@@ -0,0 +1,259 @@
+"""
+Per-request performance instrumentation for TasteStack.
+
+``RequestMetricsMiddleware`` times a sample of requests and records, for each
+one, the total time, the number and duration of SQL queries (through
+``queries.instrument_queries``), the time spent rendering the response and
+cache hits and misses (reported by ``CachedJWTAuthentication`` and the
+replica pin lookup through ``record_cache_hit()``/``record_cache_miss()``). The numbers are sent back in a ``Server-Timing``
+header and aggregated into per-view latency histograms kept in process
+memory. Each worker process keeps its own numbers.
+
+The aggregates are served by the views in ``metrics_views``.
+"""
+
+import contextvars
+import random
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+from .middleware import WrappingMiddleware
+from .queries import instrument_queries
+
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Measurements collected while handling one request"""
+
+    __slots__ = ('started', 'queries', 'sql_time', 'render_time', 'cache_hits', 'cache_misses')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.render_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+
+def current_metrics():
+    """Return the metrics of the request being handled, or None if it is not sampled"""
+    return _current.get()
+
+
+def record_cache_hit():
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += 1
+
+
+def record_cache_miss():
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_misses += 1
+
+
+class QueryTimer:
+    """``connection.execute_wrapper`` that counts and times SQL statements"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.metrics.queries += 1
+            self.metrics.sql_time += time.perf_counter() - started
+
+
+class TimedJSONRenderer(JSONRenderer):
+    """JSONRenderer that records how long rendering took"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(data, accepted_media_type, renderer_context)
+        started = time.perf_counter()
+        try:
+            return super().render(data, accepted_media_type, renderer_context)
+        finally:
+            metrics.render_time += time.perf_counter() - started
+
+
+class ViewStats:
+    __slots__ = ('count', 'errors', 'total_ms', 'sql_ms', 'queries', 'render_ms', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total_ms = 0.0
+        self.sql_ms = 0.0
+        self.queries = 0
+        self.render_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+
+class MetricsRegistry:
+    """Thread-safe in-process aggregation of request metrics per view"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self.started = time.time()
+
+    def observe(self, view, status_code, total_ms, metrics):
+        bucket = len(LATENCY_BUCKETS_MS)
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if total_ms <= bound:
+                bucket = index
+                break
+
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = ViewStats()
+            stats.count += 1
+            if status_code >= 500:
+                stats.errors += 1
+            stats.total_ms += total_ms
+            stats.sql_ms += metrics.sql_time * 1000
+            stats.queries += metrics.queries
+            stats.render_ms += metrics.render_time * 1000
+            stats.buckets[bucket] += 1
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+            self.started = time.time()
+
+    def snapshot(self):
+        """Return a JSON-serializable copy of the aggregates"""
+        with self._lock:
+            views = {name: (stats.count, stats.errors, stats.total_ms, stats.sql_ms, stats.queries,
+                            stats.render_ms, list(stats.buckets))
+                     for name, stats in self._views.items()}
+
+        result = {}
+        for name, (count, errors, total_ms, sql_ms, queries, render_ms, buckets) in sorted(views.items()):
+            result[name] = {
+                'requests': count,
+                'errors': errors,
+                'mean_ms': round(total_ms / count, 2),
+                'mean_sql_ms': round(sql_ms / count, 2),
+                'mean_queries': round(queries / count, 2),
+                'mean_render_ms': round(render_ms / count, 2),
+                'p50_ms': self._quantile(buckets, count, 0.50),
+                'p95_ms': self._quantile(buckets, count, 0.95),
+                'p99_ms': self._quantile(buckets, count, 0.99),
+                'histogram': {
+                    **{f'le_{bound}': buckets[index] for index, bound in enumerate(LATENCY_BUCKETS_MS)},
+                    'le_inf': buckets[-1],
+                },
+            }
+        return result
+
+    @staticmethod
+    def _quantile(buckets, count, fraction):
+        """Upper bound of the bucket holding the given quantile"""
+        target = fraction * count
+        seen = 0
+        for index, bucket_count in enumerate(buckets):
+            seen += bucket_count
+            if seen >= target:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else None
+        return None
+
+    def prometheus(self):
+        """Render the aggregates in the Prometheus text exposition format"""
+        with self._lock:
+            views = {name: (stats.count, stats.errors, stats.total_ms, stats.sql_ms, stats.queries,
+                            stats.render_ms, list(stats.buckets))
+                     for name, stats in self._views.items()}
+
+        lines = [
+            '# HELP tastestack_request_duration_seconds Request latency per view (sampled)',
+            '# TYPE tastestack_request_duration_seconds histogram',
+        ]
+        for name, (count, errors, total_ms, sql_ms, queries, render_ms, buckets) in sorted(views.items()):
+            label = _escape_label(name)
+            cumulative = 0
+            for index, bound in enumerate(LATENCY_BUCKETS_MS):
+                cumulative += buckets[index]
+                lines.append(f'tastestack_request_duration_seconds_bucket{{view="{label}",le="{bound / 1000}"}} {cumulative}')
+            cumulative += buckets[-1]
+            lines.append(f'tastestack_request_duration_seconds_bucket{{view="{label}",le="+Inf"}} {cumulative}')
+            lines.append(f'tastestack_request_duration_seconds_sum{{view="{label}"}} {total_ms / 1000:.6f}')
+            lines.append(f'tastestack_request_duration_seconds_count{{view="{label}"}} {count}')
+
+        counters = (
+            ('tastestack_request_errors_total', 'Sampled requests that returned a 5xx status', 1),
+            ('tastestack_sql_queries_total', 'SQL queries run by sampled requests', 4),
+            ('tastestack_sql_duration_seconds_total', 'Time spent in SQL by sampled requests', 3),
+            ('tastestack_render_duration_seconds_total', 'Time spent rendering sampled responses', 5),
+        )
+        for metric, description, position in counters:
+            lines.append(f'# HELP {metric} {description}')
+            lines.append(f'# TYPE {metric} counter')
+            for name, values in sorted(views.items()):
+                value = values[position]
+                if metric.endswith('_seconds_total'):
+                    value = f'{value / 1000:.6f}'
+                lines.append(f'{metric}{{view="{_escape_label(name)}"}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+class RequestMetricsMiddleware(WrappingMiddleware):
+    """
+    Time a sample of requests and report them in a ``Server-Timing`` header.
+
+    Settings:
+        PERF_METRICS_ENABLED: Turn the middleware on or off (default True)
+        PERF_METRICS_SAMPLE_RATE: Fraction of requests to measure (default 1.0)
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = getattr(settings, 'PERF_METRICS_ENABLED', True)
+        self.sample_rate = getattr(settings, 'PERF_METRICS_SAMPLE_RATE', 1.0)
+
+    def handle(self, request):
+        if not self.enabled or (self.sample_rate < 1 and random.random() >= self.sample_rate):
+            return (yield)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with instrument_queries(QueryTimer(metrics)):
+                response = yield
+        finally:
+            _current.reset(token)
+
+        total_ms = (time.perf_counter() - metrics.started) * 1000
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={total_ms:.1f}',
+            f'db;dur={metrics.sql_time * 1000:.1f};desc="{metrics.queries} queries"',
+            f'render;dur={metrics.render_time * 1000:.1f}',
+            f'cache;desc="hits={metrics.cache_hits} misses={metrics.cache_misses}"',
+        ])
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        view = resolver_match.view_name if resolver_match and resolver_match.view_name else 'unresolved'
+        registry.observe(view, response.status_code, total_ms, metrics)
+        return response
@@ -0,0 +1,126 @@
+"""
+Endpoints serving the aggregates collected by ``RequestMetricsMiddleware``.
+
+``/api/metrics/`` returns JSON and is limited to admin users.
+``/api/metrics/prometheus/`` returns the Prometheus text exposition format
+and also accepts ``PERF_METRICS_SCRAPE_TOKEN`` as a bearer token so a scraper
+does not need a user account. ``/api/metrics/slow-queries/`` lists the recent
+entries of the slow query log and ``/api/metrics/profiles/`` the request
+profiles recorded by ``ProfilingMiddleware``.
+"""
+
+import hmac
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from rest_framework.decorators import api_view, authentication_classes, permission_classes
+from rest_framework.permissions import BasePermission, IsAdminUser
+from rest_framework.response import Response
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from .metrics import registry
+from . import profiling, slow_queries
+
+
+def _has_scrape_token(request):
+    token = getattr(settings, 'PERF_METRICS_SCRAPE_TOKEN', '')
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and hmac.compare_digest(header, f'Bearer {token}')
+
+
+class ScrapeTokenAuthentication(JWTAuthentication):
+    """JWT authentication that leaves the scrape token alone instead of rejecting it"""
+
+    def authenticate(self, request):
+        if _has_scrape_token(request):
+            return None
+        return super().authenticate(request)
+
+
+class IsAdminOrScrapeToken(BasePermission):
+    """Admin users, or clients presenting ``PERF_METRICS_SCRAPE_TOKEN`` as a bearer token"""
+
+    def has_permission(self, request, view):
+        if request.user and request.user.is_staff:
+            return True
+        return _has_scrape_token(request)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def metrics_summary(request):
+    """Per-view latency histograms of this worker process (DELETE resets them)"""
+    if request.method == 'DELETE':
+        registry.reset()
+        return Response(status=204)
+    return Response({
+        'since': registry.started,
+        'sample_rate': getattr(settings, 'PERF_METRICS_SAMPLE_RATE', 1.0),
+        'views': registry.snapshot(),
+    })
+
+
+@api_view(['GET'])
+@authentication_classes([ScrapeTokenAuthentication])
+@permission_classes([IsAdminOrScrapeToken])
+def metrics_prometheus(request):
+    """The same aggregates in the Prometheus text exposition format"""
+    return HttpResponse(registry.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAdminUser])
+def slow_query_log(request):
+    """Most recent slow queries of this worker process, newest first (DELETE clears them)"""
+    if request.method == 'DELETE':
+        slow_queries.buffer.clear()
+        return Response(status=204)
+
+    records = slow_queries.buffer.snapshot()
+    view = request.query_params.get('view')
+    if view:
+        records = [record for record in records if record['view'] == view]
+    return Response({
+        'threshold_ms': getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200),
+        'count': len(records),
+        'results': records,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_list(request):
+    """Stored request profiles, newest first"""
+    profiles = profiling.list_profiles()
+    return Response({'count': len(profiles), 'results': profiles})
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def profile_token(request):
+    """Issue a signed value for the X-Profile header that profiles the requests carrying it"""
+    return Response({
+        'header': 'X-Profile',
+        'token': profiling.issue_token(request.user),
+        'expires_in': getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600),
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_detail(request, profile_id):
+    """Request details and top allocation sites of one profile"""
+    metadata = profiling.load_profile(profile_id)
+    if metadata is None:
+        return Response({'error': 'Profile not found'}, status=404)
+    return Response(metadata)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_flamegraph(request, profile_id):
+    """Download the collapsed stacks of one profile (input for flamegraph.pl or speedscope)"""
+    path = profiling.collapsed_path(profile_id)
+    if path is None:
+        return Response({'error': 'Profile not found'}, status=404)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=f'{profile_id}.collapsed',
+                        content_type='text/plain')
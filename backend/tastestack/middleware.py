@@ -0,0 +1,99 @@
+"""
+Base class for the project middleware that wraps the rest of the chain.
+
+Django only runs a request asynchronously under ASGI when every middleware
+in ``MIDDLEWARE`` supports it; a single sync-only middleware makes each
+request hold a worker thread for its whole duration, async views included.
+``WrappingMiddleware`` lets a middleware write its logic once, as a
+generator, and runs it in whichever mode the chain needs.
+"""
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+
+class WrappingMiddleware:
+    """
+    Middleware whose logic is a ``handle(request)`` generator.
+
+    Code before ``response = yield`` runs before the rest of the chain, the
+    response (or exception) of the chain is sent back in at the ``yield`` and
+    the generator returns the response to pass on. Returning before the
+    ``yield`` answers the request without calling the rest of the chain::
+
+        def handle(self, request):
+            started = time.perf_counter()
+            response = yield
+            response['X-Elapsed'] = f'{time.perf_counter() - started:.3f}'
+            return response
+
+    Context managers and ``try``/``finally`` blocks around the ``yield``
+    work as they would around a call to ``get_response``.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def handle(self, request):
+        return (yield)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        handler = self.handle(request)
+        try:
+            next(handler)
+            try:
+                response = self.get_response(request)
+            except Exception as exc:
+                handler.throw(exc)
+            else:
+                handler.send(response)
+        except StopIteration as stop:
+            return stop.value
+        raise RuntimeError(f'{type(self).__name__}.handle() must yield at most once')
+
+    async def __acall__(self, request):
+        handler = self.handle(request)
+        try:
+            next(handler)
+            try:
+                response = await self.get_response(request)
+            except Exception as exc:
+                handler.throw(exc)
+            else:
+                handler.send(response)
+        except StopIteration as stop:
+            return stop.value
+        raise RuntimeError(f'{type(self).__name__}.handle() must yield at most once')
+
+
+class AsyncWhiteNoiseMiddleware(WrappingMiddleware):
+    """
+    ``WhiteNoiseMiddleware`` that also runs in async mode.
+
+    WhiteNoise 6 only provides a sync middleware. Static files are looked up
+    and served exactly as it does; every other request passes through.
+    """
+
+    def __init__(self, get_response):
+        from whitenoise.middleware import WhiteNoiseMiddleware
+
+        super().__init__(get_response)
+        self.whitenoise = WhiteNoiseMiddleware(get_response)
+
+    def handle(self, request):
+        whitenoise = self.whitenoise
+        if whitenoise.autorefresh:
+            static_file = whitenoise.find_file(request.path_info)
+        else:
+            static_file = whitenoise.files.get(request.path_info)
+        if static_file is not None:
+            return whitenoise.serve(static_file, request)
+        return (yield)
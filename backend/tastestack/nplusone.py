@@ -0,0 +1,207 @@
+"""
+N+1 query detection for development and tests.
+
+While a request is handled, ``NPlusOneMiddleware`` groups every ``SELECT``
+by fingerprint and by the line of project code that triggered it. When one
+group repeats more than ``NPLUSONE_THRESHOLD`` times, the request has an N+1
+pattern: the report names the call site, shows the stack of project frames
+and, when the queries come from a lazy relation access such as
+``like.recipe.title``, suggests the ``select_related``/``prefetch_related``
+that avoids them.
+
+``NPLUSONE_DETECTION`` chooses what happens: ``'off'``, ``'warn'`` (a
+``NPlusOneWarning`` plus a log entry) or ``'raise'`` (``NPlusOneError``).
+It defaults to ``'warn'`` when DEBUG is on, and the project test runner
+(``tastestack.test_runner``) switches it to ``NPLUSONE_TEST_DETECTION``
+(default ``'raise'``) so that tests fail on new N+1 queries.
+
+``detect_nplusone()`` applies the same check to any block of code.
+"""
+
+import logging
+import os
+import sys
+import warnings
+from contextlib import contextmanager
+
+from django.conf import settings
+from .middleware import WrappingMiddleware
+from .queries import fingerprint, instrument_queries
+
+
+logger = logging.getLogger('tastestack.nplusone')
+
+# Frames of the detector, the query dispatcher and the middleware and query
+# wrappers around every request are not call sites
+_INSTRUMENTATION_MODULES = ('nplusone', 'queries', 'middleware', 'metrics', 'overload', 'slow_queries',
+                            'profiling', 'db_router', 'uploads', 'async_api')
+_INSTRUMENTATION_FILES = {os.path.join(os.path.dirname(os.path.abspath(__file__)), f'{name}.py')
+                          for name in _INSTRUMENTATION_MODULES}
+_PROJECT_DIR = os.path.abspath(str(settings.BASE_DIR)) + os.sep
+_RELATED_DESCRIPTORS = os.path.join('django', 'db', 'models', 'fields', 'related_descriptors.py')
+_LIBRARY_DIRS = ('site-packages', 'dist-packages')
+
+# Project frames shown in a report
+STACK_DEPTH = 8
+
+
+class NPlusOneError(AssertionError):
+    """Raised in ``'raise'`` mode when a request repeats a query too often"""
+
+
+class NPlusOneWarning(UserWarning):
+    """Emitted in ``'warn'`` mode when a request repeats a query too often"""
+
+
+def _is_project_frame(filename):
+    filename = os.path.abspath(filename)
+    return (filename.startswith(_PROJECT_DIR) and filename not in _INSTRUMENTATION_FILES
+            and not any(part in filename for part in _LIBRARY_DIRS))
+
+
+def _describe_relation(descriptor):
+    """
+    Suggest the fix for a lazy load triggered by a related descriptor or manager.
+
+    Returns a string such as ``Comment: select_related('recipe')``, or None if
+    the object is not one of Django's relation accessors.
+    """
+    field = getattr(descriptor, 'field', None)
+    related = getattr(descriptor, 'related', None)
+    instance = getattr(descriptor, 'instance', None)
+
+    if instance is not None and hasattr(descriptor, 'prefetch_cache_name'):
+        # Many-to-many manager
+        return f"{type(instance).__name__}: prefetch_related('{descriptor.prefetch_cache_name}')"
+    if instance is not None and field is not None:
+        # Reverse foreign key manager, e.g. recipe.images.all()
+        return f"{type(instance).__name__}: prefetch_related('{field.remote_field.get_accessor_name()}')"
+    if field is not None and (field.many_to_one or field.one_to_one):
+        # Forward foreign key or one-to-one, e.g. like.recipe
+        return f"{field.model.__name__}: select_related('{field.name}')"
+    if related is not None and getattr(related, 'one_to_one', False):
+        # Reverse one-to-one
+        return f"{related.model.__name__}: select_related('{related.get_accessor_name()}')"
+    return None
+
+
+def _inspect_stack():
+    """Return (call site, project stack, suggestion) for the query being executed"""
+    call_site = None
+    stack = []
+    suggestion = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if suggestion is None and filename.endswith(_RELATED_DESCRIPTORS):
+            suggestion = _describe_relation(frame.f_locals.get('self'))
+        elif _is_project_frame(filename):
+            location = (os.path.relpath(filename, _PROJECT_DIR), frame.f_lineno, frame.f_code.co_name)
+            if call_site is None:
+                call_site = location
+            if len(stack) < STACK_DEPTH:
+                stack.append(location)
+        frame = frame.f_back
+    return call_site, stack, suggestion
+
+
+class QueryGroup:
+    __slots__ = ('fingerprint', 'call_site', 'count', 'stack', 'suggestion')
+
+    def __init__(self, fingerprint, call_site, stack, suggestion):
+        self.fingerprint = fingerprint
+        self.call_site = call_site
+        self.count = 0
+        self.stack = stack
+        self.suggestion = suggestion
+
+
+class NPlusOneDetector:
+    """``connection.execute_wrapper`` grouping SELECTs by fingerprint and call site"""
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.groups = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        if not many and sql.lstrip()[:6].upper() == 'SELECT':
+            call_site, stack, suggestion = _inspect_stack()
+            key = (fingerprint(sql), call_site)
+            group = self.groups.get(key)
+            if group is None:
+                group = self.groups[key] = QueryGroup(key[0], call_site, stack, suggestion)
+            group.count += 1
+        return execute(sql, params, many, context)
+
+    def offenders(self):
+        return sorted((group for group in self.groups.values() if group.count > self.threshold),
+                      key=lambda group: group.count, reverse=True)
+
+    def report(self, label):
+        """Describe the groups over the threshold, or return None if there are none"""
+        offenders = self.offenders()
+        if not offenders:
+            return None
+
+        lines = [f'N+1 queries in {label}:']
+        for group in offenders:
+            if group.call_site:
+                path, line, function = group.call_site
+                lines.append(f'  {group.count}x from {path}:{line} in {function}')
+            else:
+                lines.append(f'  {group.count}x from outside the project code')
+            lines.append(f'    {group.fingerprint[:300]}')
+            if group.suggestion:
+                lines.append(f'    Suggestion: {group.suggestion} on the queryset that loaded these objects')
+            else:
+                lines.append('    Suggestion: load these rows in one query for all objects '
+                             '(annotate, prefetch_related or pass them through the serializer context)')
+            lines.append('    Stack (innermost first):')
+            for path, line, function in group.stack:
+                lines.append(f'      {path}:{line} in {function}')
+        return '\n'.join(lines)
+
+
+def get_mode():
+    return getattr(settings, 'NPLUSONE_DETECTION', 'off')
+
+
+def handle_report(report, mode):
+    if report is None:
+        return
+    if mode == 'raise':
+        raise NPlusOneError(report)
+    logger.warning(report)
+    warnings.warn(report, NPlusOneWarning, stacklevel=2)
+
+
+@contextmanager
+def detect_nplusone(label='block', threshold=None, mode='raise'):
+    """Check the queries run inside the block, e.g. in a test that does not go through a view"""
+    detector = NPlusOneDetector(threshold if threshold is not None else getattr(settings, 'NPLUSONE_THRESHOLD', 5))
+    with instrument_queries(detector):
+        yield detector
+    handle_report(detector.report(label), mode)
+
+
+class NPlusOneMiddleware(WrappingMiddleware):
+    """
+    Report requests that repeat the same query more than ``NPLUSONE_THRESHOLD`` times.
+
+    Settings:
+        NPLUSONE_DETECTION: 'off', 'warn' or 'raise' (default 'warn' in DEBUG, else 'off')
+        NPLUSONE_THRESHOLD: Repeats of one query allowed per request (default 5)
+    """
+
+    def handle(self, request):
+        # Read on every request so override_settings and the test runner apply
+        mode = get_mode()
+        if mode not in ('warn', 'raise'):
+            return (yield)
+
+        detector = NPlusOneDetector(getattr(settings, 'NPLUSONE_THRESHOLD', 5))
+        with instrument_queries(detector):
+            response = yield
+        handle_report(detector.report(f'{request.method} {request.path}'), mode)
+        return response
+
@@ -0,0 +1,253 @@
+"""
+Load shedding and request deadlines.
+
+When the database slows down, requests queue in front of the workers and
+each one still runs to completion long after its client gave up, which
+keeps the queue growing. ``LoadSheddingMiddleware`` gives every request a
+time budget instead, counted from ``X-Request-Start`` (set by the proxy
+when it accepted the connection) or from the moment the worker picked it
+up, and:
+
+* answers ``503`` right away when the budget is already spent in the queue,
+  or when the process has too many requests in flight for the request's
+  priority class (``LOAD_SHEDDING_MAX_IN_FLIGHT``)
+* bounds every SQL statement by the time left: PostgreSQL gets a
+  ``statement_timeout``, SQLite an interrupt, and a statement that would
+  start after the deadline is not run at all. The view then fails with
+  ``503`` instead of holding the worker.
+
+Priority classes (``LOAD_SHEDDING_CLASSES``) have their own budget and
+in-flight share, so anonymous search and statistics are shed long before
+writes and sign-ins.
+
+``time_left()`` tells a view how much of its budget remains, e.g. to pick a
+cheaper plan.
+"""
+
+import contextvars
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.backends.signals import connection_created
+from .async_api import json_response
+from .authentication import token_user_id
+from .middleware import WrappingMiddleware
+from .queries import instrument_queries
+
+
+logger = logging.getLogger('tastestack.overload')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+DEFAULT_CLASSES = {
+    'critical': {'deadline': 30, 'in_flight_share': 1.0},
+    'normal': {'deadline': 15, 'in_flight_share': 0.85},
+    'low': {'deadline': 5, 'in_flight_share': 0.6},
+}
+
+# PostgreSQL timeouts are rounded down to this many ms so that most requests
+# find the right value already set on their connection
+TIMEOUT_GRANULARITY_MS = 1000
+
+# time.monotonic() deadline of the current request
+_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before a statement could start"""
+
+
+def time_left():
+    """Seconds left in the current request's budget, or None outside a request"""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def parse_request_start(value):
+    """
+    Epoch seconds of an ``X-Request-Start`` header, or None.
+
+    Accepts ``t=<epoch>`` or a bare epoch in seconds, milliseconds or
+    microseconds, as nginx, HAProxy and Heroku-style routers send it.
+    """
+    value = value.strip()
+    if value.startswith('t='):
+        value = value[2:]
+    try:
+        started = float(value)
+    except ValueError:
+        return None
+    if started > 1e14:
+        return started / 1e6
+    if started > 1e11:
+        return started / 1e3
+    return started
+
+
+def reset_statement_timeout(connection, **kwargs):
+    """A new connection starts with the server's default timeout"""
+    connection.tastestack_statement_timeout_ms = None
+    connection.tastestack_transaction_timeout = None
+
+
+def current_statement_timeout(connection):
+    """
+    The ``statement_timeout`` last set on a PostgreSQL connection, in ms.
+
+    Returns:
+        int: The timeout, or None when unknown (never set, or undone by a
+        rollback)
+    """
+    session = getattr(connection, 'tastestack_statement_timeout_ms', None)
+    if not connection.in_atomic_block:
+        return session
+    pending = getattr(connection, 'tastestack_transaction_timeout', None)
+    if pending is None:
+        return session
+    wanted, committed = pending
+    # A rollback, also to a savepoint, drops the callbacks queued after it along with the SET
+    if any(func is committed for _, func, _ in connection.run_on_commit):
+        return wanted
+    return None
+
+
+connection_created.connect(reset_statement_timeout, dispatch_uid='tastestack.overload.reset_statement_timeout')
+
+
+class StatementDeadline:
+    """``execute_wrapper`` bounding each statement by the time left before ``deadline``"""
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+
+    def __call__(self, execute, sql, params, many, context):
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        connection = context['connection']
+        if connection.vendor == 'postgresql':
+            self.limit_postgresql(execute, connection, int(remaining * 1000), context)
+        elif connection.vendor == 'sqlite':
+            raw = connection.connection
+            # The handler runs every 10000 VM instructions; a true value interrupts the statement
+            raw.set_progress_handler(lambda: time.monotonic() > self.deadline, 10000)
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                raw.set_progress_handler(None, 0)
+        return execute(sql, params, many, context)
+
+    def limit_postgresql(self, execute, connection, remaining_ms, context):
+        wanted = max(1, remaining_ms // TIMEOUT_GRANULARITY_MS * TIMEOUT_GRANULARITY_MS or remaining_ms)
+        current = current_statement_timeout(connection)
+        if current is not None and wanted <= current <= remaining_ms:
+            return
+        execute('SET statement_timeout = %s', (wanted,), False, context)
+        if not connection.in_atomic_block:
+            connection.tastestack_statement_timeout_ms = wanted
+            return
+
+        # Inside a transaction the SET holds until a rollback undoes it, and
+        # stays on the connection once the transaction commits
+        def committed():
+            connection.tastestack_statement_timeout_ms = wanted
+            if connection.tastestack_transaction_timeout is pending:
+                connection.tastestack_transaction_timeout = None
+
+        pending = (wanted, committed)
+        connection.tastestack_transaction_timeout = pending
+        connection.on_commit(committed)
+
+
+class LoadSheddingMiddleware(WrappingMiddleware):
+    """
+    Shed requests that cannot finish in time and give the others a deadline.
+
+    Settings:
+        LOAD_SHEDDING_ENABLED: Turn shedding and statement deadlines on (default True)
+        LOAD_SHEDDING_CLASSES: Priority class -> ``{'deadline': seconds,
+            'in_flight_share': fraction of LOAD_SHEDDING_MAX_IN_FLIGHT}``
+        LOAD_SHEDDING_MAX_IN_FLIGHT: Requests in flight per process at which
+            ``critical`` requests are shed; 0 disables in-flight shedding
+        LOAD_SHEDDING_CRITICAL_PATHS: Path prefixes whose requests are ``critical``
+            like every write (sign-in, registration, token refresh)
+        LOAD_SHEDDING_LOW_PRIORITY_PATHS: Path prefixes whose anonymous reads are ``low``
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = getattr(settings, 'LOAD_SHEDDING_ENABLED', True)
+        self.classes = {**DEFAULT_CLASSES, **getattr(settings, 'LOAD_SHEDDING_CLASSES', {})}
+        self.max_in_flight = getattr(settings, 'LOAD_SHEDDING_MAX_IN_FLIGHT', 0)
+        self.critical_paths = tuple(getattr(settings, 'LOAD_SHEDDING_CRITICAL_PATHS', ()))
+        self.low_priority_paths = tuple(getattr(settings, 'LOAD_SHEDDING_LOW_PRIORITY_PATHS', ()))
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def priority(self, request):
+        if request.method not in SAFE_METHODS or request.path.startswith(self.critical_paths):
+            return 'critical'
+        if request.path.startswith(self.low_priority_paths) and token_user_id(request) is None:
+            return 'low'
+        return 'normal'
+
+    def shed(self, request, priority, reason):
+        logger.info('Shed %s %s (%s priority): %s', request.method, request.path, priority, reason)
+        return json_response({'detail': 'The server is overloaded, please retry shortly.'}, 503,
+                             {'Retry-After': '1'})
+
+    def handle(self, request):
+        if not self.enabled:
+            return (yield)
+
+        priority = self.priority(request)
+        budget = self.classes[priority]['deadline']
+        queued = 0.0
+        started = parse_request_start(request.META.get('HTTP_X_REQUEST_START', ''))
+        if started is not None:
+            queued = max(0.0, time.time() - started)
+        if queued >= budget:
+            return self.shed(request, priority, f'queued {queued:.2f}s')
+
+        limit = self.max_in_flight * self.classes[priority]['in_flight_share']
+        with self._lock:
+            in_flight = self.in_flight
+            overloaded = self.max_in_flight and in_flight >= limit
+            if not overloaded:
+                self.in_flight += 1
+        if overloaded:
+            return self.shed(request, priority, f'{in_flight} requests in flight')
+
+        deadline = time.monotonic() + budget - queued
+        request.load_shedding_priority = priority
+        request.load_shedding_deadline = deadline
+        token = _deadline.set(deadline)
+        try:
+            with instrument_queries(StatementDeadline(deadline)):
+                response = yield
+        finally:
+            _deadline.reset(token)
+            with self._lock:
+                self.in_flight -= 1
+        return response
+
+    def process_exception(self, request, exception):
+        # Statements stopped by the deadline, or by the database timeout set from it
+        if _is_timeout(exception, getattr(request, 'load_shedding_deadline', None)):
+            return self.shed(request, request.load_shedding_priority, 'deadline exceeded')
+        return None
+
+
+def _is_timeout(exception, deadline):
+    if isinstance(exception, DeadlineExceeded):
+        return True
+    if deadline is None or not isinstance(exception, DatabaseError):
+        return False
+    cause = exception.__cause__
+    # PostgreSQL query_canceled (psycopg 3 and 2), SQLite interrupt
+    if getattr(cause, 'sqlstate', None) == '57014' or getattr(cause, 'pgcode', None) == '57014':
+        return True
+    return 'interrupted' in str(exception) and time.monotonic() >= deadline
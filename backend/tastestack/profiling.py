@@ -0,0 +1,302 @@
+"""
+On-demand profiling of live requests.
+
+``ProfilingMiddleware`` profiles a request when it carries a valid
+``X-Profile`` header (a signed token issued to admins by
+``/api/metrics/profiles/token/``) or when it is the Nth request to a view
+(``PROFILING_SAMPLE_EVERY``). While the request runs, a background thread
+samples the stack of the request thread every ``PROFILING_INTERVAL_MS``
+milliseconds and ``tracemalloc`` tracks allocations.
+
+Each profile is stored in ``PROFILING_DIR`` as two files:
+
+* ``<id>.collapsed``: collapsed stacks (``frame;frame;frame count``), the
+  input format of flamegraph.pl, speedscope and similar tools
+* ``<id>.json``: request details and the top allocation sites
+
+Only one request is profiled at a time per process, because ``tracemalloc``
+is process-wide; requests arriving meanwhile run normally. Under WSGI the
+view runs on the request's thread, which is the one sampled. Under ASGI it
+runs on the event loop, on the threads sync views are moved to and on the
+async ORM's worker threads, so every thread is sampled and each stack is
+rooted at its thread's name (``thread:<name>``). Idle threads and other
+requests running meanwhile appear in those samples too.
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.urls import Resolver404, resolve
+from .middleware import WrappingMiddleware
+
+
+HEADER = 'HTTP_X_PROFILE'
+SIGNING_SALT = 'tastestack.profiling'
+
+_PROFILE_ID = re.compile(r'^[0-9]{8}T[0-9]{6}-[0-9a-f]{8}$')
+_profile_lock = threading.Lock()
+_view_counters = Counter()
+_counter_lock = threading.Lock()
+
+
+def get_profile_dir():
+    return str(getattr(settings, 'PROFILING_DIR', os.path.join(settings.BASE_DIR, 'logs', 'profiles')))
+
+
+def issue_token(user):
+    """Return a signed ``X-Profile`` header value"""
+    return signing.dumps({'user': user.pk}, salt=SIGNING_SALT)
+
+
+def has_valid_token(request):
+    value = request.META.get(HEADER)
+    if not value:
+        return False
+    try:
+        signing.loads(value, salt=SIGNING_SALT, max_age=getattr(settings, 'PROFILING_TOKEN_MAX_AGE', 3600))
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def is_valid_profile_id(profile_id):
+    return bool(_PROFILE_ID.match(profile_id))
+
+
+def _short_path(filename):
+    """Path relative to site-packages or to the project"""
+    for marker in ('site-packages' + os.sep, 'dist-packages' + os.sep):
+        if marker in filename:
+            return filename.split(marker, 1)[1]
+    base_dir = str(settings.BASE_DIR) + os.sep
+    return filename[len(base_dir):] if filename.startswith(base_dir) else filename
+
+
+def _frame_label(code):
+    """``path:function`` label for a code object, safe for the collapsed format"""
+    return f'{_short_path(code.co_filename)}:{code.co_name}'.replace(';', ':').replace(' ', '_')
+
+
+class StackSampler(threading.Thread):
+    """
+    Sample thread stacks at a fixed interval and count collapsed stacks.
+
+    Args:
+        thread_id: The thread to sample, or None for every other thread, with
+            each stack rooted at ``thread:<name>``
+        interval: Seconds between samples
+    """
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='tastestack-profiler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                frame = frames.get(self.thread_id)
+                if frame is not None:
+                    self.stacks[';'.join(self.labels(frame))] += 1
+                    self.samples += 1
+                continue
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in frames.items():
+                if thread_id != self.ident:
+                    root = f"thread:{names.get(thread_id, thread_id)}".replace(';', ':').replace(' ', '_')
+                    self.stacks[';'.join([root, *self.labels(frame)])] += 1
+            self.samples += 1
+
+    @staticmethod
+    def labels(frame):
+        """Frame labels of a stack, outermost first"""
+        labels = []
+        while frame is not None:
+            labels.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        return reversed(labels)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class ProfilingMiddleware(WrappingMiddleware):
+    """
+    Profile requests carrying a signed ``X-Profile`` header or every Nth request to a view.
+
+    Settings:
+        PROFILING_ENABLED: Turn the middleware on or off (default True)
+        PROFILING_SAMPLE_EVERY: Profile every Nth request to each view, 0 to disable (default 0)
+        PROFILING_SAMPLE_VIEWS: View names eligible for sampling, empty for all (default empty)
+        PROFILING_INTERVAL_MS: Stack sampling interval (default 5)
+        PROFILING_TOP_ALLOCATIONS: Allocation sites kept per profile (default 25)
+        PROFILING_MAX_PROFILES: Older profiles beyond this count are deleted (default 50)
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = getattr(settings, 'PROFILING_ENABLED', True)
+        self.sample_every = getattr(settings, 'PROFILING_SAMPLE_EVERY', 0)
+        self.sample_views = set(getattr(settings, 'PROFILING_SAMPLE_VIEWS', []))
+        self.interval = getattr(settings, 'PROFILING_INTERVAL_MS', 5) / 1000
+        self.top_allocations = getattr(settings, 'PROFILING_TOP_ALLOCATIONS', 25)
+        self.max_profiles = getattr(settings, 'PROFILING_MAX_PROFILES', 50)
+
+    def handle(self, request):
+        if not self.enabled:
+            return (yield)
+
+        trigger = 'header' if has_valid_token(request) else self.sample_trigger(request)
+        if trigger is None or not _profile_lock.acquire(blocking=False):
+            return (yield)
+        try:
+            return (yield from self.profile(request, trigger))
+        finally:
+            _profile_lock.release()
+
+    def sample_trigger(self, request):
+        if self.sample_every <= 0:
+            return None
+        try:
+            view = resolve(request.path_info).view_name
+        except Resolver404:
+            return None
+        if self.sample_views and view not in self.sample_views:
+            return None
+        with _counter_lock:
+            _view_counters[view] += 1
+            count = _view_counters[view]
+        return 'sample' if count % self.sample_every == 0 else None
+
+    def profile(self, request, trigger):
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+
+        # Async views and the async ORM run on the event loop and worker threads
+        sampler = StackSampler(None if self.async_mode else threading.get_ident(), self.interval)
+        sampler.start()
+        started = time.perf_counter()
+        try:
+            response = yield
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            sampler.stop()
+            after = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+
+        profile_id = f"{datetime.now(dt_timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        resolver_match = getattr(request, 'resolver_match', None)
+        allocations = self.allocation_sites(before, after)
+        metadata = {
+            'id': profile_id,
+            'created_at': datetime.now(dt_timezone.utc).isoformat(),
+            'trigger': trigger,
+            'method': request.method,
+            'path': request.path,
+            'view': resolver_match.view_name if resolver_match else None,
+            'status_code': response.status_code,
+            'duration_ms': round(duration_ms, 2),
+            'samples': sampler.samples,
+            'interval_ms': self.interval * 1000,
+            'peak_traced_bytes': peak,
+            'allocations': allocations,
+        }
+        self.save(profile_id, sampler.stacks, metadata)
+        response['X-Profile-Id'] = profile_id
+        return response
+
+    def allocation_sites(self, before, after):
+        """Top source lines by memory allocated during the request"""
+        filters = [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+        after = after.filter_traces(filters)
+        before = before.filter_traces(filters)
+        sites = []
+        for stat in after.compare_to(before, 'lineno')[:self.top_allocations]:
+            if stat.size_diff <= 0:
+                continue
+            frame = stat.traceback[0]
+            sites.append({
+                'location': f'{_short_path(frame.filename)}:{frame.lineno}',
+                'size_bytes': stat.size_diff,
+                'count': stat.count_diff,
+            })
+        return sites
+
+    def save(self, profile_id, stacks, metadata):
+        directory = get_profile_dir()
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f'{profile_id}.collapsed'), 'w', encoding='utf-8') as f:
+            for stack, count in stacks.most_common():
+                f.write(f'{stack} {count}\n')
+        with open(os.path.join(directory, f'{profile_id}.json'), 'w', encoding='utf-8') as f:
+            json.dump(metadata, f, indent=2)
+        self.prune(directory)
+
+    def prune(self, directory):
+        profiles = sorted(name[:-5] for name in os.listdir(directory) if name.endswith('.json'))
+        for profile_id in profiles[:max(0, len(profiles) - self.max_profiles)]:
+            for suffix in ('.json', '.collapsed'):
+                try:
+                    os.remove(os.path.join(directory, profile_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+
+def list_profiles():
+    """Metadata of the stored profiles without the allocation lists, newest first"""
+    directory = get_profile_dir()
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted(os.listdir(directory), reverse=True):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, name), encoding='utf-8') as f:
+                metadata = json.load(f)
+        except (OSError, ValueError):
+            continue
+        metadata.pop('allocations', None)
+        profiles.append(metadata)
+    return profiles
+
+
+def load_profile(profile_id):
+    """Return the metadata of one profile, or None if it does not exist"""
+    if not is_valid_profile_id(profile_id):
+        return None
+    try:
+        with open(os.path.join(get_profile_dir(), f'{profile_id}.json'), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def collapsed_path(profile_id):
+    """Path of the collapsed-stack file of a profile, or None if it does not exist"""
+    if not is_valid_profile_id(profile_id):
+        return None
+    path = os.path.join(get_profile_dir(), f'{profile_id}.collapsed')
+    return path if os.path.exists(path) else None
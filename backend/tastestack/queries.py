@@ -0,0 +1,90 @@
+"""
+SQL helpers shared by the query instrumentation and the query-budget tests.
+
+``instrument_queries()`` is how the middleware wraps SQL statements. Like
+``connection.execute_wrapper()`` it runs a wrapper around every statement of
+a block, but the active wrappers live in a context variable instead of on
+the thread's connection objects. Queries the async ORM runs on a
+``sync_to_async`` worker thread are therefore wrapped too, because the
+worker runs in a copy of the caller's context.
+"""
+
+import contextvars
+import functools
+import re
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """
+    Normalize a SQL statement so that queries differing only in their
+    parameters share a fingerprint.
+
+    Literals become ``?``, ``IN`` lists collapse to ``(...)`` and whitespace
+    is squashed, e.g. ``SELECT ... WHERE "id" = 42`` and
+    ``SELECT ... WHERE "id" = 7`` both become ``SELECT ... WHERE "id" = ?``.
+    """
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _IN_LIST.sub('(...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def count_fingerprints(statements):
+    """Return a Counter of fingerprints for an iterable of SQL strings"""
+    return Counter(fingerprint(sql) for sql in statements)
+
+
+# (wrapper, aliases) pairs, innermost first
+_active_wrappers = contextvars.ContextVar('query_wrappers', default=())
+
+
+def _dispatch(execute, sql, params, many, context):
+    """Run a statement through the wrappers registered in the current context"""
+    alias = context['connection'].alias
+    for wrapper, aliases in _active_wrappers.get():
+        if aliases is None or alias in aliases:
+            execute = functools.partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def install_dispatcher(connection, **kwargs):
+    """Add the dispatcher to a connection once, under any ``execute_wrapper()`` blocks"""
+    # Inserted first because execute_wrapper() pops the last wrapper on exit
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _dispatch)
+
+
+# Covers connections opened later on other threads, e.g. sync_to_async workers
+connection_created.connect(install_dispatcher, dispatch_uid='tastestack.queries.install_dispatcher')
+
+
+@contextmanager
+def instrument_queries(wrapper, aliases=None):
+    """
+    Run ``wrapper`` around every SQL statement executed in the block.
+
+    Args:
+        wrapper: An ``execute_wrapper``-style callable
+            ``(execute, sql, params, many, context)``
+        aliases: Database aliases to wrap, or None for all of them
+    """
+    for alias in connections:
+        install_dispatcher(connections[alias])
+    aliases = frozenset(aliases) if aliases is not None else None
+    token = _active_wrappers.set(_active_wrappers.get() + ((wrapper, aliases),))
+    try:
+        yield wrapper
+    finally:
+        _active_wrappers.reset(token)
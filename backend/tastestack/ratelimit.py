@@ -0,0 +1,281 @@
+"""
+Token bucket rate limiting for expensive and authentication endpoints.
+
+Views opt in with ``@rate_limit(scope)``; ``RATELIMIT_RATES`` gives each
+scope a rate per user and/or per client IP, e.g.::
+
+    RATELIMIT_RATES = {
+        'search': {'user': '120/min', 'ip': '60/min'},
+        'login': {'ip': '10/min'},
+    }
+
+A request with a valid bearer token draws from its user's bucket, any other
+request from its IP's bucket. A bucket holds up to N tokens and refills at N
+per period, so clients may burst up to N requests and then sustain the
+rate. Requests over the limit get ``429`` with ``Retry-After``; every
+limited response carries ``X-RateLimit-Limit`` and ``X-RateLimit-Remaining``.
+
+Buckets live in ``RATELIMIT_STORE``: ``tastestack.ratelimit.LocalStore``
+keeps them in process memory (a few microseconds per request, but every
+worker process counts separately), ``tastestack.ratelimit.RedisStore``
+shares them between processes (async views reach it through
+``redis.asyncio``, so the round trip does not block the event loop). A
+failing store lets requests through.
+
+Behind reverse proxies, set ``RATELIMIT_TRUSTED_PROXIES`` to their number
+so that the client IP is read from ``X-Forwarded-For``. It defaults to 1 on
+Railway and Heroku, whose router sits in front of every deploy.
+"""
+
+import asyncio
+import logging
+import math
+import threading
+import time
+import weakref
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+from .authentication import token_user_id
+
+
+logger = logging.getLogger('tastestack.ratelimit')
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """``'10/min'`` -> ``(10, 60)``: capacity and refill period in seconds"""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period.strip()[0].lower()]
+
+
+class LocalStore:
+    """
+    Buckets in this process' memory.
+
+    Settings:
+        RATELIMIT_LOCAL_MAX_KEYS: Buckets kept before full ones are dropped (default 100000)
+    """
+
+    def __init__(self):
+        self.max_keys = getattr(settings, 'RATELIMIT_LOCAL_MAX_KEYS', 100000)
+        self._buckets = {}  # key -> (tokens, updated, time the bucket is full again)
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, period):
+        """Take one token; returns (allowed, tokens left)"""
+        now = time.monotonic()
+        refill = capacity / period
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                tokens = capacity
+                if len(self._buckets) >= self.max_keys:
+                    self._evict(now)
+            else:
+                tokens = min(capacity, bucket[0] + (now - bucket[1]) * refill)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / refill)
+        return allowed, tokens
+
+    def _evict(self, now):
+        # A full bucket is the same as no bucket
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket[2] > now}
+        if len(self._buckets) >= self.max_keys:
+            self._buckets.clear()
+
+    async def atake(self, key, capacity, period):
+        # Memory only: no reason to leave the event loop
+        return self.take(key, capacity, period)
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class RedisStore:
+    """
+    Buckets in Redis, shared by every worker process.
+
+    Settings:
+        RATELIMIT_REDIS_URL: Redis server (default redis://localhost:6379/0)
+    """
+
+    PREFIX = 'tastestack:ratelimit:'
+
+    # Refill and take atomically; the key expires once the bucket is full again
+    SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill = capacity / tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * refill)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / refill * 1000) + 1000)
+return {allowed, tostring(tokens)}
+"""
+
+    def __init__(self):
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError:
+            raise ImproperlyConfigured('tastestack.ratelimit.RedisStore requires the redis package '
+                                       '(pip install -r requirements-prod.txt)')
+        self.redis = redis
+        self.url = getattr(settings, 'RATELIMIT_REDIS_URL', 'redis://localhost:6379/0')
+        self.script = redis.Redis.from_url(self.url).register_script(self.SCRIPT)
+        # redis.asyncio connections belong to the event loop that opened them
+        self._async_scripts = weakref.WeakKeyDictionary()
+
+    def take(self, key, capacity, period):
+        allowed, tokens = self.script(keys=[self.PREFIX + key], args=[capacity, period, time.time()])
+        return bool(allowed), float(tokens)
+
+    async def atake(self, key, capacity, period):
+        """``take()`` for async views, without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        script = self._async_scripts.get(loop)
+        if script is None:
+            script = self._async_scripts[loop] = (
+                self.redis.asyncio.Redis.from_url(self.url).register_script(self.SCRIPT))
+        allowed, tokens = await script(keys=[self.PREFIX + key], args=[capacity, period, time.time()])
+        return bool(allowed), float(tokens)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = import_string(getattr(settings, 'RATELIMIT_STORE', 'tastestack.ratelimit.LocalStore'))()
+    return _store
+
+
+def client_ip(request):
+    """The client address, skipping ``RATELIMIT_TRUSTED_PROXIES`` proxies"""
+    proxies = getattr(settings, 'RATELIMIT_TRUSTED_PROXIES', 0)
+    if proxies:
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _bucket(request, scope):
+    """``(rate, key)`` of the bucket ``request`` draws from in ``scope``, or None"""
+    if not getattr(settings, 'RATELIMIT_ENABLED', True):
+        return None
+    rates = getattr(settings, 'RATELIMIT_RATES', {}).get(scope, {})
+    user_id = token_user_id(request) if rates.get('user') else None
+    if user_id is not None:
+        return rates['user'], f'{scope}:user:{user_id}'
+    if rates.get('ip'):
+        return rates['ip'], f'{scope}:ip:{client_ip(request)}'
+    return None
+
+
+def _result(rate, allowed, tokens):
+    capacity, period = parse_rate(rate)
+    headers = {'X-RateLimit-Limit': rate, 'X-RateLimit-Remaining': str(int(tokens))}
+    if not allowed:
+        headers['Retry-After'] = str(math.ceil((1 - tokens) * period / capacity))
+    return allowed, headers
+
+
+def check(request, scope):
+    """
+    Take a token for ``request`` from its bucket in ``scope``.
+
+    Returns:
+        None when the scope is not limited, else ``(allowed, headers)``
+    """
+    bucket = _bucket(request, scope)
+    if bucket is None:
+        return None
+    rate, key = bucket
+    try:
+        allowed, tokens = get_store().take(key, *parse_rate(rate))
+    except Exception:
+        logger.exception('Rate limit store failed, letting the request through')
+        return None
+    return _result(rate, allowed, tokens)
+
+
+async def acheck(request, scope):
+    """``check()`` for async views; the store call does not block the event loop"""
+    bucket = _bucket(request, scope)
+    if bucket is None:
+        return None
+    rate, key = bucket
+    store = get_store()
+    # A store without atake() is called from a worker thread
+    take = getattr(store, 'atake', None) or sync_to_async(store.take)
+    try:
+        allowed, tokens = await take(key, *parse_rate(rate))
+    except Exception:
+        logger.exception('Rate limit store failed, letting the request through')
+        return None
+    return _result(rate, allowed, tokens)
+
+
+def _throttled(headers):
+    from .async_api import json_response
+
+    wait = headers['Retry-After']
+    return json_response({'detail': f'Request was throttled. Expected available in {wait} seconds.'}, 429, headers)
+
+
+def _add_headers(response, headers):
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def rate_limit(scope):
+    """
+    Decorator limiting a view (sync or async) to the rates of ``scope``.
+
+    Apply it outside ``@api_view``/``@async_api_view`` so that throttled
+    requests are answered before authentication and parsing.
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapped(request, *args, **kwargs):
+                result = await acheck(request, scope)
+                if result is None:
+                    return await view(request, *args, **kwargs)
+                allowed, headers = result
+                if not allowed:
+                    return _throttled(headers)
+                return _add_headers(await view(request, *args, **kwargs), headers)
+        else:
+            @wraps(view)
+            def wrapped(request, *args, **kwargs):
+                result = check(request, scope)
+                if result is None:
+                    return view(request, *args, **kwargs)
+                allowed, headers = result
+                if not allowed:
+                    return _throttled(headers)
+                return _add_headers(view(request, *args, **kwargs), headers)
+        return wrapped
+    return decorator
@@ -13,7 +13,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 from pathlib import Path
 import os
 from dotenv import load_dotenv
-from .db_config import get_database_config, print_database_info
+from .db_config import get_database_config, get_replica_configs, print_database_info
 
 # Load environment variables from .env file
 load_dotenv()
@@ -47,6 +47,7 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'rest_framework',
     'rest_framework_simplejwt',
+    'rest_framework_simplejwt.token_blacklist',
     'corsheaders',
     'accounts',
     'recipes',
@@ -55,8 +56,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    'tastestack.metrics.RequestMetricsMiddleware',
+    'tastestack.overload.LoadSheddingMiddleware',
+    'tastestack.slow_queries.SlowQueryLogMiddleware',
+    'tastestack.nplusone.NPlusOneMiddleware',
+    'tastestack.profiling.ProfilingMiddleware',
+    'tastestack.db_router.ReplicaPinningMiddleware',
+    'tastestack.uploads.UploadSizeLimitMiddleware',
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'tastestack.middleware.AsyncWhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     # 'django.middleware.csrf.CsrfViewMiddleware',  # Temporarily disabled for API debugging
@@ -111,6 +119,11 @@ except Exception as e:
         }
     }
 
+# Read replicas (DATABASE_REPLICA_URLS); reads are routed by tastestack.db_router
+DATABASES.update(get_replica_configs())
+if len(DATABASES) > 1:
+    DATABASE_ROUTERS = ['tastestack.db_router.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -164,11 +177,15 @@ AUTH_USER_MODEL = 'accounts.User'
 # Django REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'tastestack.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_RENDERER_CLASSES': (
+        'tastestack.metrics.TimedJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 12
 }
@@ -179,8 +196,9 @@ from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
-    'ROTATE_REFRESH_TOKENS': False,
-    'BLACKLIST_AFTER_ROTATION': False,
+    # Each refresh returns a new refresh token and blacklists the one it used
+    'ROTATE_REFRESH_TOKENS': os.getenv('JWT_ROTATE_REFRESH_TOKENS', 'True').lower() == 'true',
+    'BLACKLIST_AFTER_ROTATION': os.getenv('JWT_BLACKLIST_AFTER_ROTATION', 'True').lower() == 'true',
     'UPDATE_LAST_LOGIN': False,
     
     'ALGORITHM': 'HS256',
@@ -243,3 +261,196 @@ CORS_ALLOWED_METHODS = [
 # Media files (for recipe images) - configurable via environment
 MEDIA_URL = os.getenv('MEDIA_URL', '/media/')
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Upload limits - configurable via environment
+# Files above the memory threshold are streamed to a temporary file instead of RAM
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv('UPLOAD_MEMORY_THRESHOLD', 1024 * 1024))
+UPLOAD_MAX_REQUEST_SIZE = int(os.getenv('UPLOAD_MAX_REQUEST_SIZE', 20 * 1024 * 1024))
+IMAGE_UPLOAD_MAX_SIZES = {
+    'default': int(os.getenv('IMAGE_UPLOAD_MAX_SIZE', 5 * 1024 * 1024)),
+    'image': int(os.getenv('RECIPE_IMAGE_MAX_SIZE', 5 * 1024 * 1024)),
+    'profile_picture': int(os.getenv('PROFILE_PICTURE_MAX_SIZE', 2 * 1024 * 1024)),
+}
+IMAGE_UPLOAD_ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+IMAGE_UPLOAD_MAX_DIMENSION = int(os.getenv('IMAGE_UPLOAD_MAX_DIMENSION', 8000))
+IMAGE_UPLOAD_MAX_PIXELS = int(os.getenv('IMAGE_UPLOAD_MAX_PIXELS', 40_000_000))
+# Maximum number of images decoded at the same time per worker process
+IMAGE_DECODE_CONCURRENCY = int(os.getenv('IMAGE_DECODE_CONCURRENCY', 2))
+IMAGE_DECODE_TIMEOUT = float(os.getenv('IMAGE_DECODE_TIMEOUT', 10))
+
+# Recipe gallery uploads
+RECIPE_GALLERY_MAX_UPLOADS = int(os.getenv('RECIPE_GALLERY_MAX_UPLOADS', 10))
+# Worker processes used to generate thumbnails (0 = generate inline)
+IMAGE_PROCESS_WORKERS = int(os.getenv('IMAGE_PROCESS_WORKERS', 2))
+
+# Maximum number of like/unlike/rate operations in one batch request
+INTERACTION_BATCH_MAX_OPERATIONS = int(os.getenv('INTERACTION_BATCH_MAX_OPERATIONS', 500))
+
+# Maximum number of recipes fetched by one /api/recipes/batch/ request
+RECIPE_BATCH_MAX_IDS = int(os.getenv('RECIPE_BATCH_MAX_IDS', 100))
+
+# Request performance metrics (Server-Timing header and /api/metrics/)
+PERF_METRICS_ENABLED = os.getenv('PERF_METRICS_ENABLED', 'True').lower() == 'true'
+# Fraction of requests to measure, e.g. 0.1 in production
+PERF_METRICS_SAMPLE_RATE = float(os.getenv('PERF_METRICS_SAMPLE_RATE', 1.0))
+# Bearer token that lets a metrics scraper read /api/metrics/prometheus/
+PERF_METRICS_SCRAPE_TOKEN = os.getenv('PERF_METRICS_SCRAPE_TOKEN', '')
+
+# Slow query log (ring buffer at /api/metrics/slow-queries/, summarized by manage.py slow_queries)
+SLOW_QUERY_LOG_ENABLED = os.getenv('SLOW_QUERY_LOG_ENABLED', 'True').lower() == 'true'
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', 200))
+# Fraction of slow SELECT statements whose EXPLAIN output is captured
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.getenv('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 0.1))
+SLOW_QUERY_BUFFER_SIZE = int(os.getenv('SLOW_QUERY_BUFFER_SIZE', 200))
+SLOW_QUERY_LOG_FILE = os.getenv('SLOW_QUERY_LOG_FILE', str(BASE_DIR / 'logs' / 'slow_queries.log'))
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv('SLOW_QUERY_LOG_MAX_BYTES', 10 * 1024 * 1024))
+SLOW_QUERY_LOG_BACKUP_COUNT = int(os.getenv('SLOW_QUERY_LOG_BACKUP_COUNT', 5))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'slow_queries': {
+            'class': 'tastestack.slow_queries.SlowQueryFileHandler',
+            'filename': SLOW_QUERY_LOG_FILE,
+            'maxBytes': SLOW_QUERY_LOG_MAX_BYTES,
+            'backupCount': SLOW_QUERY_LOG_BACKUP_COUNT,
+            'delay': True,
+            'encoding': 'utf-8',
+            'formatter': 'message',
+        } if SLOW_QUERY_LOG_FILE else {'class': 'logging.NullHandler'},
+    },
+    'loggers': {
+        'tastestack.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
+# N+1 query detection: 'off', 'warn' or 'raise'
+NPLUSONE_DETECTION = os.getenv('NPLUSONE_DETECTION', 'warn' if DEBUG else 'off')
+# Mode used while running the test suite
+NPLUSONE_TEST_DETECTION = os.getenv('NPLUSONE_TEST_DETECTION', 'raise')
+# How many times one query may repeat from the same line in a request
+NPLUSONE_THRESHOLD = int(os.getenv('NPLUSONE_THRESHOLD', 5))
+
+# Test runner: N+1 detection raises, rate limiting is off, temporary content index
+TEST_RUNNER = 'tastestack.test_runner.TasteStackTestRunner'
+
+# On-demand request profiling (stack sampler + tracemalloc, see /api/metrics/profiles/)
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'True').lower() == 'true'
+# Profile every Nth request to each view; 0 profiles only requests with a signed X-Profile header
+PROFILING_SAMPLE_EVERY = int(os.getenv('PROFILING_SAMPLE_EVERY', 0))
+PROFILING_SAMPLE_VIEWS = [name.strip() for name in os.getenv('PROFILING_SAMPLE_VIEWS', '').split(',') if name.strip()]
+PROFILING_INTERVAL_MS = float(os.getenv('PROFILING_INTERVAL_MS', 5))
+PROFILING_TOP_ALLOCATIONS = int(os.getenv('PROFILING_TOP_ALLOCATIONS', 25))
+PROFILING_MAX_PROFILES = int(os.getenv('PROFILING_MAX_PROFILES', 50))
+PROFILING_TOKEN_MAX_AGE = int(os.getenv('PROFILING_TOKEN_MAX_AGE', 3600))
+PROFILING_DIR = os.getenv('PROFILING_DIR', str(BASE_DIR / 'logs' / 'profiles'))
+
+# Read replica routing: 'round_robin' or 'least_loaded' (fewest queries in flight)
+DATABASE_REPLICA_STRATEGY = os.getenv('DATABASE_REPLICA_STRATEGY', 'round_robin')
+# Seconds a user's reads stay on the primary after they write
+DATABASE_REPLICA_PIN_SECONDS = int(os.getenv('DATABASE_REPLICA_PIN_SECONDS', 10))
+
+# Live updates over Server-Sent Events (requires ASGI, see tastestack/live.py)
+LIVE_UPDATES_ENABLED = os.getenv('LIVE_UPDATES_ENABLED', 'True').lower() == 'true'
+# 'tastestack.live.LocalBackend' (one process) or 'tastestack.live.RedisBackend' (several)
+LIVE_UPDATES_BACKEND = os.getenv('LIVE_UPDATES_BACKEND', 'tastestack.live.LocalBackend')
+LIVE_UPDATES_REDIS_URL = os.getenv('LIVE_UPDATES_REDIS_URL', 'redis://localhost:6379/0')
+LIVE_UPDATES_HEARTBEAT_SECONDS = float(os.getenv('LIVE_UPDATES_HEARTBEAT_SECONDS', 15))
+# Events buffered per slow client before its backlog is replaced by a resync event
+LIVE_UPDATES_QUEUE_SIZE = int(os.getenv('LIVE_UPDATES_QUEUE_SIZE', 100))
+LIVE_UPDATES_MAX_SUBSCRIBERS = int(os.getenv('LIVE_UPDATES_MAX_SUBSCRIBERS', 10000))
+LIVE_UPDATES_MAX_STREAM_SECONDS = int(os.getenv('LIVE_UPDATES_MAX_STREAM_SECONDS', 3600))
+LIVE_UPDATES_RETRY_MS = int(os.getenv('LIVE_UPDATES_RETRY_MS', 3000))
+LIVE_UPDATES_TICKET_MAX_AGE = int(os.getenv('LIVE_UPDATES_TICKET_MAX_AGE', 60))
+
+# Seconds the user of a JWT is cached per token (see tastestack/authentication.py); 0 disables
+AUTH_USER_CACHE_SECONDS = int(os.getenv('AUTH_USER_CACHE_SECONDS', 60))
+
+# Rate limiting (token buckets, see tastestack/ratelimit.py); rates are 'N/s', 'N/min', 'N/hour' or 'N/day'
+RATELIMIT_ENABLED = os.getenv('RATELIMIT_ENABLED', 'True').lower() == 'true'
+# 'tastestack.ratelimit.LocalStore' (per process) or 'tastestack.ratelimit.RedisStore' (shared)
+RATELIMIT_STORE = os.getenv('RATELIMIT_STORE', 'tastestack.ratelimit.LocalStore')
+RATELIMIT_REDIS_URL = os.getenv('RATELIMIT_REDIS_URL', 'redis://localhost:6379/0')
+# Number of reverse proxies in front of the app that append to X-Forwarded-For;
+# Railway (RAILWAY_ENVIRONMENT) and Heroku (DYNO) route every request through one
+BEHIND_PLATFORM_PROXY = any(os.getenv(name) for name in ('RAILWAY_ENVIRONMENT', 'DYNO'))
+RATELIMIT_TRUSTED_PROXIES = int(os.getenv('RATELIMIT_TRUSTED_PROXIES', 1 if BEHIND_PLATFORM_PROXY else 0))
+# Per scope: 'user' applies to requests with a valid bearer token, 'ip' to the others
+RATELIMIT_RATES = {
+    'search': {
+        'user': os.getenv('RATELIMIT_SEARCH_USER', '120/min'),
+        'ip': os.getenv('RATELIMIT_SEARCH_IP', '60/min'),
+    },
+    'login': {'ip': os.getenv('RATELIMIT_LOGIN_IP', '10/min')},
+    'register': {'ip': os.getenv('RATELIMIT_REGISTER_IP', '5/hour')},
+    'forgot_password': {'ip': os.getenv('RATELIMIT_FORGOT_PASSWORD_IP', '5/hour')},
+}
+
+# Load shedding and request deadlines (see tastestack/overload.py)
+LOAD_SHEDDING_ENABLED = os.getenv('LOAD_SHEDDING_ENABLED', 'True').lower() == 'true'
+# Seconds from arrival (X-Request-Start) a request of each priority class may take,
+# and the share of LOAD_SHEDDING_MAX_IN_FLIGHT it may use
+LOAD_SHEDDING_CLASSES = {
+    'critical': {'deadline': float(os.getenv('LOAD_SHEDDING_CRITICAL_DEADLINE', 30)), 'in_flight_share': 1.0},
+    'normal': {'deadline': float(os.getenv('LOAD_SHEDDING_NORMAL_DEADLINE', 15)), 'in_flight_share': 0.85},
+    'low': {'deadline': float(os.getenv('LOAD_SHEDDING_LOW_DEADLINE', 5)), 'in_flight_share': 0.6},
+}
+# Requests in flight per process before shedding starts (0 = no limit; useful with threads or ASGI)
+LOAD_SHEDDING_MAX_IN_FLIGHT = int(os.getenv('LOAD_SHEDDING_MAX_IN_FLIGHT', 0))
+# Writes and these paths are 'critical'; anonymous reads of the low priority paths are 'low'
+LOAD_SHEDDING_CRITICAL_PATHS = ['/api/auth/login/', '/api/auth/register/', '/api/auth/token/refresh/']
+LOAD_SHEDDING_LOW_PRIORITY_PATHS = ['/api/recipes/search/', '/api/recipes/statistics/']
+
+# Search query budget (see recipes/search.py)
+SEARCH_MAX_QUERY_LENGTH = int(os.getenv('SEARCH_MAX_QUERY_LENGTH', 200))
+SEARCH_MAX_TERMS = int(os.getenv('SEARCH_MAX_TERMS', 8))
+SEARCH_MIN_TERM_LENGTH = int(os.getenv('SEARCH_MIN_TERM_LENGTH', 2))
+# Weighted cost and number of icontains predicates above which only titles are searched
+SEARCH_MAX_COST = int(os.getenv('SEARCH_MAX_COST', 32))
+SEARCH_MAX_PREDICATES = int(os.getenv('SEARCH_MAX_PREDICATES', 12))
+# Seconds of request deadline below which only titles are searched
+SEARCH_FULL_MIN_TIME_LEFT = float(os.getenv('SEARCH_FULL_MIN_TIME_LEFT', 1.0))
+
+# Similar recipes from likes and ratings (see recipes/recommendations.py)
+# Neighbours stored per recipe; also the largest ?limit of /api/recipes/<id>/similar/
+SIMILAR_RECIPES_TOP_K = int(os.getenv('SIMILAR_RECIPES_TOP_K', 20))
+
+# Content-based similar recipes (see recipes/content_index.py)
+# Directory of the memory-mapped index file and its delta log; build it with `manage.py build_content_index`
+CONTENT_INDEX_PATH = os.getenv('CONTENT_INDEX_PATH', str(BASE_DIR / 'content_index'))
+# Strongest words kept per recipe, and recipes kept per word
+CONTENT_INDEX_MAX_TERMS = int(os.getenv('CONTENT_INDEX_MAX_TERMS', 64))
+CONTENT_INDEX_MAX_POSTINGS = int(os.getenv('CONTENT_INDEX_MAX_POSTINGS', 2000))
+
+# Trending recipes (see recipes/trending.py); `manage.py renormalize_trending` runs daily from the scheduler
+# Seconds after which an interaction counts 1/e of a fresh one, per window
+TRENDING_DECAY_SECONDS = {
+    'day': int(os.getenv('TRENDING_DAY_DECAY_SECONDS', 86400)),
+    'week': int(os.getenv('TRENDING_WEEK_DECAY_SECONDS', 7 * 86400)),
+}
+TRENDING_WEIGHTS = {
+    'like': float(os.getenv('TRENDING_LIKE_WEIGHT', 1.0)),
+    'rating': float(os.getenv('TRENDING_RATING_WEIGHT', 1.0)),
+    'comment': float(os.getenv('TRENDING_COMMENT_WEIGHT', 2.0)),
+}
+TRENDING_MAX_LIMIT = int(os.getenv('TRENDING_MAX_LIMIT', 50))
+# Epoch age, in day decay periods, after which a like or rating renormalizes the scores itself
+TRENDING_RENORMALIZE_AFTER = int(os.getenv('TRENDING_RENORMALIZE_AFTER', 30))
+
+# Periodic jobs of `manage.py run_scheduled_jobs`, started next to the web server by every deploy target
+SCHEDULED_JOBS = [
+    {'command': 'build_content_index', 'every': int(os.getenv('CONTENT_INDEX_BUILD_EVERY', 86400))},
+    {'command': 'refresh_similar_recipes', 'every': int(os.getenv('SIMILAR_RECIPES_REFRESH_EVERY', 300))},
+    {'command': 'refresh_similar_recipes', 'args': ['--full'],
+     'every': int(os.getenv('SIMILAR_RECIPES_REBUILD_EVERY', 86400))},
+    {'command': 'renormalize_trending', 'every': int(os.getenv('TRENDING_RENORMALIZE_EVERY', 86400))},
+    {'command': 'flushexpiredtokens', 'every': int(os.getenv('FLUSH_EXPIRED_TOKENS_EVERY', 86400))},
+]
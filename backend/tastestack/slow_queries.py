@@ -0,0 +1,184 @@
+"""
+Slow query log for TasteStack.
+
+``SlowQueryLogMiddleware`` wraps every SQL statement with
+``queries.instrument_queries`` while a request is handled. Statements slower
+than ``SLOW_QUERY_THRESHOLD_MS`` are recorded with their fingerprint,
+duration, the view that ran them and their parameters (strings redacted).
+A sample of slow ``SELECT`` statements also gets its ``EXPLAIN`` output.
+
+Records are kept in an in-process ring buffer (served at
+``/api/metrics/slow-queries/``) and written as JSON lines to the
+``tastestack.slow_queries`` logger, which ``settings.LOGGING`` sends to a
+rotating file read by ``manage.py slow_queries``.
+"""
+
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone as dt_timezone
+from logging.handlers import RotatingFileHandler
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from .middleware import WrappingMiddleware
+from .queries import fingerprint, instrument_queries
+
+
+logger = logging.getLogger('tastestack.slow_queries')
+
+# Longest SQL text kept in a record
+MAX_SQL_LENGTH = 4000
+
+_current_request = contextvars.ContextVar('slow_query_request', default=None)
+_explaining = contextvars.ContextVar('slow_query_explaining', default=False)
+
+
+class SlowQueryFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that creates the log directory on first write"""
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super()._open()
+
+
+class SlowQueryBuffer:
+    """Fixed-size, thread-safe buffer of the most recent slow queries"""
+
+    def __init__(self, size):
+        self._lock = threading.Lock()
+        self._records = deque(maxlen=size)
+
+    def append(self, record):
+        with self._lock:
+            self._records.append(record)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def snapshot(self):
+        """Return the records, newest first"""
+        with self._lock:
+            return list(reversed(self._records))
+
+
+buffer = SlowQueryBuffer(getattr(settings, 'SLOW_QUERY_BUFFER_SIZE', 200))
+
+
+def redact(value):
+    """Keep numbers, booleans, dates and None; replace text and bytes with their type and length"""
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        return f'<str:{len(value)}>'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return f'<bytes:{len(value)}>'
+    return str(value)
+
+
+def current_view():
+    """Name of the view handling the current request, if any"""
+    request = _current_request.get()
+    if request is None:
+        return None
+    resolver_match = getattr(request, 'resolver_match', None)
+    if resolver_match and resolver_match.view_name:
+        return resolver_match.view_name
+    return request.path
+
+
+def explain(connection, sql, params):
+    """Return the query plan of a SELECT statement as a list of lines"""
+    prefix = connection.ops.explain_query_prefix()
+    token = _explaining.set(True)
+    try:
+        # The savepoint keeps a failed EXPLAIN from breaking an open transaction
+        with transaction.atomic(using=connection.alias):
+            # create_cursor() skips the execute wrappers so the plan is not timed or logged
+            cursor = connection.create_cursor()
+            try:
+                cursor.execute(f'{prefix} {sql}', params)
+                rows = cursor.fetchall()
+            finally:
+                cursor.close()
+    except DatabaseError as exc:
+        return [f'EXPLAIN failed: {exc}']
+    finally:
+        _explaining.reset(token)
+    return [' '.join(str(column) for column in row) for row in rows]
+
+
+class SlowQueryLogger:
+    """``connection.execute_wrapper`` that records statements over the threshold"""
+
+    def __init__(self, threshold_ms, explain_rate):
+        self.threshold_ms = threshold_ms
+        self.explain_rate = explain_rate
+
+    def __call__(self, execute, sql, params, many, context):
+        if _explaining.get():
+            return execute(sql, params, many, context)
+
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - started) * 1000
+        if duration_ms >= self.threshold_ms:
+            self.record(context['connection'], sql, params, many, duration_ms)
+        return result
+
+    def record(self, connection, sql, params, many, duration_ms):
+        entry = {
+            'timestamp': datetime.now(dt_timezone.utc).isoformat(),
+            'duration_ms': round(duration_ms, 2),
+            'fingerprint': fingerprint(sql),
+            'sql': sql[:MAX_SQL_LENGTH],
+            'params': None if many else redact(params),
+            'view': current_view(),
+            'database': connection.alias,
+        }
+        if (not many and sql.lstrip()[:6].upper() == 'SELECT'
+                and self.explain_rate > 0 and random.random() < self.explain_rate):
+            entry['explain'] = explain(connection, sql, params)
+
+        buffer.append(entry)
+        logger.warning(json.dumps(entry, default=str))
+
+
+class SlowQueryLogMiddleware(WrappingMiddleware):
+    """
+    Record slow SQL statements run while handling a request.
+
+    Settings:
+        SLOW_QUERY_LOG_ENABLED: Turn the middleware on or off (default True)
+        SLOW_QUERY_THRESHOLD_MS: Statements at least this slow are recorded (default 200)
+        SLOW_QUERY_EXPLAIN_SAMPLE_RATE: Fraction of slow SELECTs to EXPLAIN (default 0.1)
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.enabled = getattr(settings, 'SLOW_QUERY_LOG_ENABLED', True)
+        self.wrapper = SlowQueryLogger(
+            getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 200),
+            getattr(settings, 'SLOW_QUERY_EXPLAIN_SAMPLE_RATE', 0.1),
+        )
+
+    def handle(self, request):
+        if not self.enabled:
+            return (yield)
+
+        token = _current_request.set(request)
+        try:
+            with instrument_queries(self.wrapper):
+                return (yield)
+        finally:
+            _current_request.reset(token)
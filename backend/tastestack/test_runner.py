@@ -0,0 +1,37 @@
+"""
+Project test runner (``TEST_RUNNER``).
+"""
+
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from .nplusone import get_mode
+
+
+class TasteStackTestRunner(DiscoverRunner):
+    """
+    DiscoverRunner that sets up the settings every suite runs under.
+
+    * ``NPLUSONE_DETECTION`` becomes ``NPLUSONE_TEST_DETECTION``, so new N+1
+      queries fail the tests
+    * rate limiting is off (the tests of the limiter turn it back on)
+    * the content index lives in a temporary directory
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._saved_mode = get_mode()
+        self._saved_rate_limiting = getattr(settings, 'RATELIMIT_ENABLED', True)
+        settings.NPLUSONE_DETECTION = getattr(settings, 'NPLUSONE_TEST_DETECTION', 'raise')
+        settings.RATELIMIT_ENABLED = False
+        self._saved_content_index_path = settings.CONTENT_INDEX_PATH
+        settings.CONTENT_INDEX_PATH = tempfile.mkdtemp(prefix='tastestack-content-index-')
+
+    def teardown_test_environment(self, **kwargs):
+        settings.NPLUSONE_DETECTION = self._saved_mode
+        settings.RATELIMIT_ENABLED = self._saved_rate_limiting
+        shutil.rmtree(settings.CONTENT_INDEX_PATH, ignore_errors=True)
+        settings.CONTENT_INDEX_PATH = self._saved_content_index_path
+        super().teardown_test_environment(**kwargs)
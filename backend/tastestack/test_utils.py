@@ -0,0 +1,162 @@
+"""
+Test helpers shared by the apps' test suites; not imported by the application.
+
+``TasteStackTestCase`` provides the fixtures most suites need: an ``owner``
+with a ``recipe``, a ``viewer``, an API client authenticated as ``owner``,
+fast password hashing, inline thumbnails and a temporary ``MEDIA_ROOT``.
+
+``QueryBudgetTestCase`` adds the query-budget checks: it runs a request
+against a small dataset, grows the dataset, runs the request again and fails
+if the second run needed more SQL queries. The failure message lists the
+query fingerprints whose count grew, which is usually the lazy load that
+needs a ``select_related`` or ``prefetch_related``.
+"""
+
+import io
+import shutil
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+from accounts.models import User
+from recipes.models import Recipe, RecipeImage
+from interactions.models import Rating, Like, Comment, Follow
+from .queries import count_fingerprints
+
+
+def make_image_file(name='photo.png', size=(16, 16)):
+    """Return a small valid PNG upload"""
+    output = io.BytesIO()
+    Image.new('RGB', size, (200, 120, 40)).save(output, 'PNG')
+    return SimpleUploadedFile(name, output.getvalue(), content_type='image/png')
+
+
+@override_settings(
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+    IMAGE_PROCESS_WORKERS=0,
+)
+class TasteStackTestCase(TestCase):
+    """Base class for API tests with an ``owner``, a ``viewer`` and a ``recipe``"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls._media_root = tempfile.mkdtemp()
+        cls._media_override = override_settings(MEDIA_ROOT=cls._media_root)
+        cls._media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._media_override.disable()
+        shutil.rmtree(cls._media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', email='owner@example.com', password='ownerpass123')
+        cls.viewer = User.objects.create_user(username='viewer', email='viewer@example.com', password='viewerpass123')
+        cls.recipe = cls.create_recipe(cls.owner, 'Target Recipe')
+
+    @staticmethod
+    def create_recipe(author, title):
+        return Recipe.objects.create(
+            title=title,
+            description='A recipe used by the tests',
+            ingredients=['1 cup flour', '2 eggs'],
+            instructions=['Mix', 'Bake'],
+            prep_time=10,
+            cook_time=20,
+            servings=2,
+            difficulty='Easy',
+            category='dinner',
+            author=author,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.owner)
+
+
+class QueryBudgetTestCase(TasteStackTestCase):
+    """
+    Base class for endpoint query-budget tests.
+
+    The dataset grows from ``SMALL_SIZE`` to ``LARGE_SIZE`` other users. Each
+    of them gets a recipe from ``owner``, and each of them likes, rates and
+    comments on all of ``owner``'s recipes. They also follow ``owner`` and
+    are followed back. Every endpoint therefore has more rows to serialize
+    in the second run.
+    """
+
+    SMALL_SIZE = 2
+    LARGE_SIZE = 6
+
+    def setUp(self):
+        super().setUp()
+        self.user_count = 0
+
+    def grow(self, count):
+        """Add ``count`` users and their activity around ``owner``"""
+        for _ in range(count):
+            self.user_count += 1
+            user = User.objects.create(
+                username=f'user{self.user_count}', email=f'user{self.user_count}@example.com'
+            )
+            self.create_recipe(self.owner, f'Recipe {self.user_count}')
+            RecipeImage.objects.create(recipe=self.recipe, image=f'recipe_images/gallery{self.user_count}.png',
+                                       position=self.user_count)
+            for recipe in Recipe.objects.filter(author=self.owner):
+                Like.objects.get_or_create(user=user, recipe=recipe)
+                Rating.objects.get_or_create(user=user, recipe=recipe, defaults={'rating': 4})
+                Comment.objects.create(user=user, recipe=recipe, content=f'Comment from {user.username}')
+            Follow.objects.create(follower=user, following=self.owner)
+            Follow.objects.create(follower=self.owner, following=user)
+            Like.objects.get_or_create(user=self.viewer, recipe=self.recipe)
+
+    def capture(self, prepare, expected_status):
+        perform = prepare()
+        with CaptureQueriesContext(connection) as context:
+            response = perform()
+        if expected_status is not None:
+            self.assertEqual(response.status_code, expected_status,
+                             f'Unexpected status {response.status_code}: {getattr(response, "data", "")}')
+        else:
+            self.assertLess(response.status_code, 400,
+                            f'Unexpected status {response.status_code}: {getattr(response, "data", "")}')
+        return [query['sql'] for query in context.captured_queries]
+
+    def assertConstantQueries(self, prepare, expected_status=None):
+        """
+        Assert that a request needs the same number of queries on the small
+        and on the large dataset.
+
+        Args:
+            prepare: Called before each measured run (outside the capture) to
+                set up what the request needs; returns a zero-argument
+                callable that performs the request and returns the response.
+            expected_status: Expected HTTP status, or None for any success
+        """
+        self.grow(self.SMALL_SIZE)
+        small = self.capture(prepare, expected_status)
+        self.grow(self.LARGE_SIZE - self.SMALL_SIZE)
+        large = self.capture(prepare, expected_status)
+
+        if len(large) > len(small):
+            small_counts = count_fingerprints(small)
+            large_counts = count_fingerprints(large)
+            grown = [
+                f'  {count}x (was {small_counts.get(sql, 0)}x): {sql}'
+                for sql, count in large_counts.most_common()
+                if count > small_counts.get(sql, 0)
+            ]
+            self.fail(
+                f'Query budget exceeded: {len(small)} queries with {self.SMALL_SIZE} users, '
+                f'{len(large)} with {self.LARGE_SIZE}. Queries that grew:\n' + '\n'.join(grown)
+            )
+
+    def assertConstantGet(self, path, expected_status=None):
+        self.assertConstantQueries(lambda: lambda: self.client.get(path), expected_status)
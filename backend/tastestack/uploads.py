@@ -0,0 +1,178 @@
+"""
+Bounded-memory image upload handling for TasteStack.
+
+Uploads larger than ``FILE_UPLOAD_MAX_MEMORY_SIZE`` are streamed to temporary
+files by Django's upload handlers, so this module only has to make sure that
+nothing gets decoded before it is known to be safe:
+
+* ``UploadSizeLimitMiddleware`` rejects request bodies above
+  ``UPLOAD_MAX_REQUEST_SIZE`` from the ``Content-Length`` header, before any
+  byte of the body is read.
+* ``BoundedImageField`` enforces a per-field byte limit, then reads only the
+  image header to check format, dimensions and pixel count (decompression
+  bombs), and finally lets Pillow verify the file while holding one of a
+  fixed number of decode slots.
+"""
+
+import threading
+
+from django.conf import settings
+from django.http import JsonResponse
+from PIL import Image
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+from .middleware import WrappingMiddleware
+
+
+DEFAULT_MAX_UPLOAD_SIZE = 5 * 1024 * 1024
+DEFAULT_MAX_DIMENSION = 8000
+DEFAULT_MAX_PIXELS = 40_000_000
+DEFAULT_ALLOWED_FORMATS = ('JPEG', 'PNG', 'GIF', 'WEBP')
+
+_decode_slots = threading.BoundedSemaphore(getattr(settings, 'IMAGE_DECODE_CONCURRENCY', 2))
+
+
+class ImageDecodeBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many images are being processed right now. Please retry shortly.'
+    default_code = 'image_decode_busy'
+
+
+def format_size(num_bytes):
+    """Return a short human readable size, e.g. ``5.0 MB``"""
+    if num_bytes < 1024 * 1024:
+        return f"{num_bytes / 1024:.1f} KB"
+    return f"{num_bytes / (1024 * 1024):.1f} MB"
+
+
+def get_upload_limit(field_name):
+    """Return the maximum upload size in bytes for the given form field"""
+    limits = getattr(settings, 'IMAGE_UPLOAD_MAX_SIZES', {})
+    return limits.get(field_name, limits.get('default', DEFAULT_MAX_UPLOAD_SIZE))
+
+
+def inspect_image_header(file_obj):
+    """
+    Read only the header of an uploaded image.
+
+    ``Image.open`` is lazy: it parses the header to learn the format and size
+    but does not touch the pixel data until ``load()`` is called.
+
+    Args:
+        file_obj: Uploaded file (in memory or spooled to a temporary file)
+
+    Returns:
+        tuple: (format, width, height)
+
+    Raises:
+        ValueError: If the file is not a recognisable image
+    """
+    position = file_obj.tell() if hasattr(file_obj, 'tell') else 0
+    try:
+        with Image.open(file_obj) as image:
+            return image.format, image.width, image.height
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise ValueError(str(e))
+    finally:
+        file_obj.seek(position)
+
+
+def acquire_decode_slot():
+    """
+    Take one of the ``IMAGE_DECODE_CONCURRENCY`` decode slots.
+
+    Raises:
+        ImageDecodeBusy: No slot freed up within ``IMAGE_DECODE_TIMEOUT`` seconds (HTTP 503)
+    """
+    timeout = getattr(settings, 'IMAGE_DECODE_TIMEOUT', 10)
+    if not _decode_slots.acquire(timeout=timeout):
+        raise ImageDecodeBusy()
+
+
+def release_decode_slot():
+    _decode_slots.release()
+
+
+class decode_slot:
+    """
+    Context manager limiting how many images are decoded concurrently.
+
+    Raises ``ImageDecodeBusy`` (HTTP 503) if no slot frees up within
+    ``IMAGE_DECODE_TIMEOUT`` seconds.
+    """
+
+    def __enter__(self):
+        acquire_decode_slot()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        release_decode_slot()
+        return False
+
+
+class BoundedImageField(serializers.ImageField):
+    """
+    ImageField that validates size, format and dimensions before decoding.
+
+    The byte limit is looked up by field name in ``IMAGE_UPLOAD_MAX_SIZES``.
+    """
+
+    default_error_messages = {
+        'too_large': 'Image is too large ({size}). The maximum size is {limit}.',
+        'invalid_format': 'Unsupported image format "{format}". Allowed formats: {allowed}.',
+        'too_many_pixels': 'Image dimensions {width}x{height} exceed the maximum of {max_dimension}px per side '
+                           'or {max_pixels} pixels in total.',
+    }
+
+    def to_internal_value(self, data):
+        file_object = serializers.FileField.to_internal_value(self, data)
+
+        limit = get_upload_limit(self.field_name)
+        if file_object.size > limit:
+            self.fail('too_large', size=format_size(file_object.size), limit=format_size(limit))
+
+        try:
+            image_format, width, height = inspect_image_header(file_object)
+        except ValueError:
+            self.fail('invalid_image')
+
+        allowed_formats = getattr(settings, 'IMAGE_UPLOAD_ALLOWED_FORMATS', DEFAULT_ALLOWED_FORMATS)
+        if image_format not in allowed_formats:
+            self.fail('invalid_format', format=image_format, allowed=', '.join(allowed_formats))
+
+        max_dimension = getattr(settings, 'IMAGE_UPLOAD_MAX_DIMENSION', DEFAULT_MAX_DIMENSION)
+        max_pixels = getattr(settings, 'IMAGE_UPLOAD_MAX_PIXELS', DEFAULT_MAX_PIXELS)
+        if width > max_dimension or height > max_dimension or width * height > max_pixels:
+            self.fail('too_many_pixels', width=width, height=height,
+                      max_dimension=max_dimension, max_pixels=max_pixels)
+
+        # Only now let Pillow verify the file contents
+        with decode_slot():
+            django_field = self._DjangoImageField()
+            django_field.error_messages = self.error_messages
+            return django_field.clean(file_object)
+
+
+class UploadSizeLimitMiddleware(WrappingMiddleware):
+    """
+    Reject request bodies larger than ``UPLOAD_MAX_REQUEST_SIZE`` with a 413
+    based on the declared ``Content-Length``, before the body is parsed.
+    """
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.max_request_size = getattr(settings, 'UPLOAD_MAX_REQUEST_SIZE', 4 * DEFAULT_MAX_UPLOAD_SIZE)
+
+    def handle(self, request):
+        try:
+            content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            content_length = 0
+
+        if content_length > self.max_request_size:
+            return JsonResponse(
+                {'error': f'Request body too large. The maximum size is {format_size(self.max_request_size)}.'},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+            )
+
+        return (yield)
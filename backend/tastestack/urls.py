@@ -4,6 +4,10 @@ from django.conf import settings
 from django.conf.urls.static import static
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from .media_debug import list_media_files
+from .metrics_views import (
+    metrics_summary, metrics_prometheus, slow_query_log,
+    profile_list, profile_token, profile_detail, profile_flamegraph,
+)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -13,6 +17,13 @@ urlpatterns = [
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('api/debug/media/', list_media_files, name='debug_media'),
+    path('api/metrics/', metrics_summary, name='metrics'),
+    path('api/metrics/prometheus/', metrics_prometheus, name='metrics_prometheus'),
+    path('api/metrics/slow-queries/', slow_query_log, name='slow_query_log'),
+    path('api/metrics/profiles/', profile_list, name='profile_list'),
+    path('api/metrics/profiles/token/', profile_token, name='profile_token'),
+    path('api/metrics/profiles/<str:profile_id>/', profile_detail, name='profile_detail'),
+    path('api/metrics/profiles/<str:profile_id>/flamegraph/', profile_flamegraph, name='profile_flamegraph'),
 ]
 
 # Serve media files in development
@@ -7,8 +7,44 @@ const getAuthHeaders = () => {
   return token ? { 'Authorization': `Bearer ${token}` } : {};
 };
 
+// Shared by concurrent requests that hit an expired access token at the same time
+let refreshPromise = null;
+
+// Exchange the stored refresh token for a new access token; resolves to false if it is gone or rejected
+const refreshAccessToken = () => {
+  const refresh = localStorage.getItem('refreshToken');
+  if (!refresh) {
+    return Promise.resolve(false);
+  }
+  if (!refreshPromise) {
+    refreshPromise = fetch(`${API_BASE_URL}/auth/token/refresh/`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ refresh })
+    })
+      .then(async (response) => {
+        if (!response.ok) {
+          localStorage.removeItem('refreshToken');
+          return false;
+        }
+        const data = await response.json();
+        localStorage.setItem('token', data.access);
+        if (data.refresh) {
+          // Rotation: the old refresh token has been blacklisted
+          localStorage.setItem('refreshToken', data.refresh);
+        }
+        return true;
+      })
+      .catch(() => false)
+      .finally(() => {
+        refreshPromise = null;
+      });
+  }
+  return refreshPromise;
+};
+
 // Generic API request function with enhanced error handling and timeout
-const apiRequest = async (endpoint, options = {}, isFormData = false) => {
+const apiRequest = async (endpoint, options = {}, isFormData = false, isRetry = false) => {
   const url = `${API_BASE_URL}${endpoint}`;
   
   // Get auth headers
@@ -39,9 +75,17 @@ const apiRequest = async (endpoint, options = {}, isFormData = false) => {
     const response = await fetch(url, config);
     clearTimeout(timeoutId);
     
-    // Handle 401 Unauthorized
+    // Handle 401 Unauthorized: renew an expired access token once, then retry
     if (response.status === 401) {
+      if (!isRetry && await refreshAccessToken()) {
+        // Callers that pass their own Authorization header need the new token too
+        const retryOptions = options.headers && options.headers.Authorization
+          ? { ...options, headers: { ...options.headers, Authorization: `Bearer ${localStorage.getItem('token')}` } }
+          : options;
+        return apiRequest(endpoint, retryOptions, isFormData, true);
+      }
       localStorage.removeItem('token');
+      localStorage.removeItem('refreshToken');
       window.location.href = '/login';
       const error = new Error('Unauthorized');
       error.status = 401;
@@ -18,17 +18,31 @@ export const login = async (credentials) => {
     body: JSON.stringify(credentials)
   });
   
-  // Store token in localStorage
+  // Store tokens in localStorage; the refresh token renews the access token
+  // without sending the password again (see api.js)
   if (data.token) {
     localStorage.setItem('token', data.token);
   }
+  if (data.refresh) {
+    localStorage.setItem('refreshToken', data.refresh);
+  }
   
   return data;
 };
 
 // User logout
 export const logout = () => {
+  const refresh = localStorage.getItem('refreshToken');
   localStorage.removeItem('token');
+  localStorage.removeItem('refreshToken');
+
+  // Blacklist the refresh token server-side; signing out locally must not wait on it
+  if (refresh) {
+    apiRequest('/auth/logout/', {
+      method: 'POST',
+      body: JSON.stringify({ refresh })
+    }).catch(() => {});
+  }
 };
 
 // Get current user profile
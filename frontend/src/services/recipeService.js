@@ -10,6 +10,15 @@ export const getRecipe = async (id) => {
   return apiRequest(`/recipes/${id}/`);
 };
 
+// Get several recipes by ID in one request (optionally only some fields)
+export const getRecipesByIds = async (ids, fields = null) => {
+  const params = new URLSearchParams({ ids: ids.join(',') });
+  if (fields) {
+    params.append('fields', fields.join(','));
+  }
+  return apiRequest(`/recipes/batch/?${params.toString()}`);
+};
+
 // Create a new recipe
 export const createRecipe = async (recipeData) => {
   